@@ -1,12 +1,25 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response
 from flask_socketio import SocketIO, emit
+from socketio import PubSubManager, AsyncRedisManager, AsyncServer, ASGIApp
+from socketio.async_pubsub_manager import AsyncPubSubManager
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+import socket
+import http.client
+from urllib.parse import urlsplit
 import subprocess
 import threading
 import os
-import select
+import selectors
+import heapq
+import itertools
 import pty
+import fcntl
+import termios
 import time
 import json
+import resource
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import atexit
@@ -14,18 +27,119 @@ import signal
 import sys
 from datetime import datetime
 import shutil
+from collections import deque
+import queue
+import codecs
+import zlib
+import struct
+import bisect
+import re
+
+try:
+    import re._parser as sre_parse
+except ImportError:
+    import sre_parse
+
+try:
+    import pyte
+    from pyte import graphics as pyte_graphics
+except ImportError:
+    pyte = None
 
 app = Flask(__name__)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
 # Конфигурация
 SCRIPTS_DIR = 'scripts'
+SCRIPTS_DEBOUNCE_DELAY = 0.5  # Обрабатывать изменения в scripts после такой паузы в событиях (секунд)
+SCRIPTS_DEBOUNCE_MAX_DELAY = 5  # ... но не позже чем через столько секунд после первого события
 HISTORY_DIR = 'history'
 MAX_HISTORY_LINES = 500
+HISTORY_SEGMENT_LINES = MAX_HISTORY_LINES  # Записей в одном сегменте файла истории
+HISTORY_SEGMENT_SIZE = 4 * 1024 * 1024  # Максимальный размер сегмента (байт)
+HISTORY_MAX_SEGMENTS = 2  # Сколько сегментов (включая текущий) хранить на диске
+HISTORY_PAGE_SIZE = 200  # Записей в странице истории по умолчанию
+HISTORY_PAGE_MAX = 2000  # Максимум записей в одной странице истории
+HISTORY_QUEUE_BYTES = 16 * 1024 * 1024  # Максимум байт в очереди на запись истории, сверх него записи отбрасываются
+HISTORY_FLUSH_SIZE = 256 * 1024  # Сбрасывать накопленные записи на диск при таком объеме (байт)
+HISTORY_FLUSH_INTERVAL = 0.5  # ... или не реже чем раз в столько секунд
+HISTORY_FSYNC_INTERVAL = 0  # Интервал fsync в секундах (0 - не вызывать fsync)
+MAX_SCROLLBACK_SIZE = 1024 * 1024  # Максимальный объем вывода процесса в памяти (символов)
+OUTPUT_BATCH_MIN_INTERVAL = 0.016  # Окно склейки вывода в один кадр при малом потоке (секунд)
+OUTPUT_BATCH_MAX_INTERVAL = 0.05  # ... и при интенсивном выводе
+OUTPUT_BATCH_SIZE = 64 * 1024  # Отправлять кадр сразу при таком объеме (байт)
+OUTPUT_MAX_UNACKED_FRAMES = 60  # Отставший клиент переводится в режим "перейти к последнему экрану"
+INPUT_QUEUE_SIZE = 4 * 1024 * 1024  # Максимум байт ввода, ожидающих записи в PTY процесса
+INPUT_WRITE_SIZE = 64 * 1024  # Байт за один вызов write в PTY
+INPUT_UPLOAD_CHUNK = 64 * 1024  # Загрузка через API читается и ставится в очередь такими кусками (байт)
+INPUT_UPLOAD_HIGH_WATER = 256 * 1024  # ... и ждет, пока в очереди не станет меньше этого объема
+INPUT_UPLOAD_TIMEOUT = 30  # Прервать загрузку, если процесс не читает ввод столько секунд
+TERMINAL_SCREEN_MODEL = True  # Вести виртуальный экран процесса на сервере (нужен пакет pyte)
+TERMINAL_COLUMNS = 80  # Размер виртуального экрана по умолчанию
+TERMINAL_LINES = 24
+TERMINAL_RESIZE_POLICY = 'smallest'  # Размер PTY при нескольких зрителях: 'smallest' или 'last_active'
+TERMINAL_SCROLLBACK_LINES = 1000  # Строк прокрутки над экраном
+TERMINAL_SNAPSHOT_SCROLLBACK = 500  # Строк прокрутки, отправляемых клиенту вместе с экраном
+OUTPUT_SNAPSHOT_SIZE = 256 * 1024  # Сколько последнего вывода отправлять подключающемуся клиенту без виртуального экрана (символов)
+TERMINAL_REPLAY_SIZE = 64 * 1024  # Сколько последнего вывода проигрывать в новый экран (символов): pyte разбирает ~100 КБ/с
+TERMINAL_SCREEN_BACKLOG = 64 * 1024  # Если разбор отстал на столько символов, промежуточный вывод отбрасывается
+TERMINAL_SCREEN_RESEED_SIZE = 16 * 1024  # ... и экран восстанавливается по такому хвосту вывода
+TERMINAL_SCREEN_BATCH = 16 * 1024  # Символов, разбираемых потоком экрана за один захват блокировки
+STOP_ESCALATION = [(signal.SIGTERM, 5), (signal.SIGKILL, 5)]  # Сигналы группе процесса при остановке и ожидание после каждого (секунд)
+SHUTDOWN_TIMEOUT = 3  # Сколько ждать завершения всех процессов при выходе перед SIGKILL (секунд)
+SUPERVISOR_POLICY_FILE = 'supervisor.json'  # Файл политики перезапуска и ограничений в папке скрипта
+SUPERVISOR_DEFAULT_POLICY = {
+    'restart': 'no',  # 'no', 'on-failure' (код выхода не 0) или 'always'
+    'autostart': False,  # Запускать скрипт при старте приложения
+    'backoff_initial': 1,  # Первая задержка перед перезапуском, дальше удваивается (секунд)
+    'backoff_max': 60,  # Максимальная задержка перед перезапуском (секунд)
+    'backoff_reset': 60,  # Сбрасывать задержку, если процесс проработал столько секунд
+    'max_restarts': 5,  # Максимум перезапусков за окно (0 - без ограничения)
+    'restart_window': 300,  # Окно подсчета перезапусков (секунд)
+    'limits': {}  # memory_mb, cpu_percent, cpu_seconds, pids, nofile
+}
+CGROUP_ENABLED = True  # Ограничивать ресурсы через поддерево cgroup v2, если оно доступно
+CGROUP_ROOT = '/sys/fs/cgroup'
+SERVER_HOST = os.environ.get('TERMINAL_MANAGER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('TERMINAL_MANAGER_PORT', 5000))
+# 'standalone' - все в одном процессе; 'owner' - процессы, PTY и история; 'worker' - только клиенты (без состояния)
+SERVER_ROLE = os.environ.get('TERMINAL_MANAGER_ROLE', 'standalone')
+# Шина между owner и worker: 'unix:///путь/к/сокету' (брокер в owner) или URL Redis/Kombu/Kafka/ZeroMQ
+MESSAGE_QUEUE = os.environ.get('TERMINAL_MANAGER_QUEUE')
+OWNER_URL = os.environ.get('TERMINAL_MANAGER_OWNER_URL', 'http://127.0.0.1:5001')  # Куда worker пересылает API и события клиентов
+# 'threading' - поток на соединение (Werkzeug); 'asyncio' - ASGI-сервер uvicorn, PTY в цикле asyncio
+SERVER_ASYNC_MODE = os.environ.get('TERMINAL_MANAGER_ASYNC_MODE', 'threading')
+SOCKET_HANDLER_THREADS = 16  # Потоков для обработчиков событий клиентов и REST API в режиме asyncio
+MESSAGE_BUS_CLIENT_QUEUE = 10000  # Сообщений в очереди к одному подписчику Unix-шины, при переполнении он отключается
+METRICS_INTERVAL = 5  # Период сбора метрик процессов из /proc (секунд, 0 - отключить)
+REGISTRY_DELTA_LOG_SIZE = 1000  # Сколько последних изменений списка скриптов хранить для досинхронизации клиентов
+HISTORY_COMPRESS_THRESHOLD = 16 * 1024  # Сжимать историю для клиентов с поддержкой deflate начиная с этого размера (байт)
+HISTORY_SEARCH_PAGE_SIZE = 100  # Результатов поиска по истории в странице по умолчанию
+HISTORY_SEARCH_PAGE_MAX = 1000  # Максимум результатов поиска в одной странице
+HISTORY_SEARCH_BATCH = 50  # Результатов в одном сообщении history_search_results
+HISTORY_SEARCH_LINE_MAX = 16 * 1024  # Строка вывода без перевода строки длиннее этого режется для индекса (символов)
+HISTORY_SEARCH_INDEX_MEMORY = 64 * 1024 * 1024  # Примерный объем индексов поиска в памяти, сверх него вытесняются давно не использованные (байт)
+HISTORY_SEARCH_BUILD_TIMEOUT = 60  # Сколько поиск ждет построения индекса процесса (секунд)
 
 # Глобальные переменные
 processes = {}
 process_outputs = {}
+process_outputs_lock = threading.Lock()
+known_histories = set()  # Процессы, для которых на диске есть файл истории
+history_logs = {}
+history_logs_lock = threading.Lock()
+history_indexes = {}  # process_name -> HistorySearchIndex
+history_indexes_lock = threading.Lock()
+output_subscribers = {}  # process_name -> {sid: {'acked': seq, 'sent': seq, 'lagging': bool}}
+output_subscribers_lock = threading.Lock()
+screen_viewers = {}  # process_name -> {sid}: пока есть зрители, для процесса ведется виртуальный экран
+screen_viewers_lock = threading.Lock()
+terminal_sizes = {}  # process_name -> {sid: {'columns', 'lines', 'active'}}
+terminal_sizes_lock = threading.Lock()
+client_transports = {}  # sid -> {'binary': bool, 'compress': bool}
+client_rooms = {}  # room -> {sid}: в режиме owner клиенты подключены к worker, и локальный менеджер их не видит
+client_rooms_lock = threading.Lock()
+output_decoders = {}  # process_name -> инкрементальный UTF-8 декодер
+output_bytes = {}  # process_name -> всего байт вывода, прочитанных из PTY
 
 # Создаем необходимые папки
 for directory in [SCRIPTS_DIR, HISTORY_DIR]:
@@ -34,12 +148,695 @@ for directory in [SCRIPTS_DIR, HISTORY_DIR]:
 
 shutdown_event = threading.Event()
 
+class MessageBusBroker:
+    """Брокер Unix-шины: пересылает сообщения всем остальным серверам, у каждого подписчика своя очередь"""
+
+    def __init__(self, path):
+        self.path = path
+        self._clients = []
+        self._lock = threading.Lock()
+        self._sock = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self._sock.listen(64)
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        print(f"Шина сообщений слушает {self.path}")
+
+    def stop(self):
+        try:
+            self._sock.close()
+            os.unlink(self.path)
+        except (AttributeError, OSError):
+            pass
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            client = {'sock': conn, 'queue': queue.Queue(maxsize=MESSAGE_BUS_CLIENT_QUEUE)}
+            with self._lock:
+                self._clients.append(client)
+            threading.Thread(target=self._reader, args=(client,), daemon=True).start()
+            threading.Thread(target=self._writer, args=(client,), daemon=True).start()
+
+    def _reader(self, client):
+        try:
+            for line in client['sock'].makefile('rb'):
+                with self._lock:
+                    targets = [c for c in self._clients if c is not client]
+                for target in targets:
+                    try:
+                        target['queue'].put_nowait(line)
+                    except queue.Full:
+                        print("Подписчик шины не успевает читать сообщения и будет отключен")
+                        self._drop(target)
+        except OSError:
+            pass
+        self._drop(client)
+
+    def _writer(self, client):
+        while True:
+            line = client['queue'].get()
+            if line is None:
+                return
+            try:
+                client['sock'].sendall(line)
+            except OSError:
+                self._drop(client)
+                return
+
+    def _drop(self, client):
+        with self._lock:
+            if client not in self._clients:
+                return
+            self._clients.remove(client)
+        try:
+            client['queue'].put_nowait(None)
+        except queue.Full:
+            pass
+        try:
+            client['sock'].shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+class UnixSocketManager(PubSubManager):
+    """Менеджер клиентов Socket.IO поверх Unix-шины MessageBusBroker"""
+
+    name = 'unix'
+
+    def __init__(self, url, channel='flask-socketio', write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.path = url[len('unix://'):]
+        self._sock = None
+        self._connect_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    def _connect(self):
+        with self._connect_lock:
+            if self._sock is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.path)
+                self._sock = sock
+            return self._sock
+
+    def _reset(self, sock):
+        with self._connect_lock:
+            if self._sock is sock:
+                self._sock = None
+        try:
+            sock.close()
+        except (AttributeError, OSError):
+            pass
+
+    def _publish(self, data):
+        line = (self.json.dumps(data) + '\n').encode('utf-8')
+        for attempt in range(2):
+            sock = None
+            try:
+                sock = self._connect()
+                with self._send_lock:
+                    sock.sendall(line)
+                return
+            except OSError as e:
+                self._reset(sock)
+                if attempt:
+                    print(f"Ошибка отправки в шину сообщений: {e}")
+
+    def _listen(self):
+        while True:
+            sock = None
+            try:
+                sock = self._connect()
+                for line in sock.makefile('rb'):
+                    yield line
+            except OSError:
+                pass
+            self._reset(sock)
+            time.sleep(1)
+
+def make_socketio_options():
+    """Параметры SocketIO для выбранной шины сообщений"""
+    if not MESSAGE_QUEUE:
+        return {}
+    if MESSAGE_QUEUE.startswith('unix://'):
+        return {'client_manager': UnixSocketManager(MESSAGE_QUEUE)}
+    return {'message_queue': MESSAGE_QUEUE}
+
+message_bus_broker = None
+if SERVER_ROLE == 'owner' and MESSAGE_QUEUE and MESSAGE_QUEUE.startswith('unix://'):
+    message_bus_broker = MessageBusBroker(MESSAGE_QUEUE[len('unix://'):])
+    message_bus_broker.start()
+
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading', **make_socketio_options())
+
+class ScrollbackBuffer:
+    """Кольцевой буфер вывода процесса с фиксированным бюджетом по объему и числу фрагментов"""
+
+    def __init__(self, max_size=MAX_SCROLLBACK_SIZE, max_chunks=MAX_HISTORY_LINES):
+        self.max_size = max_size
+        self.max_chunks = max_chunks
+        self._chunks = deque()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.screen = None
+
+    def attach_screen(self, screen):
+        """Подключить виртуальный экран: он получает хвост буфера и весь дальнейший вывод"""
+        with self._lock:
+            if self.screen is not None:
+                return self.screen
+            screen.feed(''.join(self._tail_chunks(TERMINAL_REPLAY_SIZE)), seed=True)
+            self.screen = screen
+            return screen
+
+    def detach_screen(self):
+        with self._lock:
+            screen, self.screen = self.screen, None
+        if screen is not None:
+            screen.close()
+
+    def append(self, data):
+        """Добавить фрагмент вывода, вытесняя самые старые данные"""
+        if not data:
+            return
+        if len(data) > self.max_size:
+            data = data[-self.max_size:]
+        with self._lock:
+            self._chunks.append(data)
+            self._size += len(data)
+            while self._size > self.max_size or len(self._chunks) > self.max_chunks:
+                self._size -= len(self._chunks.popleft())
+            if self.screen is not None:
+                self.screen.feed(data)
+
+    def snapshot(self):
+        """Получить копию фрагментов (без склейки в одну строку)"""
+        with self._lock:
+            return list(self._chunks)
+
+    def tail(self, size):
+        """Последние size символов вывода (склеиваются только они, а не весь буфер)"""
+        with self._lock:
+            chunks = self._tail_chunks(size)
+        return ''.join(chunks)[-size:]
+
+    def _tail_chunks(self, size):
+        chunks = []
+        total = 0
+        for chunk in reversed(self._chunks):
+            if total >= size:
+                break
+            chunks.append(chunk)
+            total += len(chunk)
+        chunks.reverse()
+        return chunks
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+            self._size = 0
+
+    def __len__(self):
+        return self._size
+
+class TerminalScreen:
+    """Виртуальный экран процесса (pyte): разбор вывода в своем потоке, снимок для подключающегося клиента"""
+
+    _FG_CODES = {name: code for code, name in list(pyte_graphics.FG_ANSI.items()) + list(pyte_graphics.FG_AIXTERM.items())} if pyte else {}
+    _BG_CODES = {name: code for code, name in list(pyte_graphics.BG_ANSI.items()) + list(pyte_graphics.BG_AIXTERM.items())} if pyte else {}
+
+    def __init__(self, columns=TERMINAL_COLUMNS, lines=TERMINAL_LINES, name='terminal-screen'):
+        self._lock = threading.Lock()  # Состояние pyte
+        self._screen = pyte.HistoryScreen(columns, lines, history=TERMINAL_SCROLLBACK_LINES)
+        self._stream = pyte.Stream(self._screen)
+        self._cond = threading.Condition()  # Очередь разбора
+        self._pending = []  # Текст вывода и ('resize', columns, lines) по порядку
+        self._pending_size = 0
+        self._seed_size = 0
+        self._reset = False
+        self._closed = False
+        self.size = (columns, lines)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def feed(self, data, seed=False):
+        """Поставить вывод в очередь разбора (не блокирует); seed - начальный хвост буфера без ограничения"""
+        if not data:
+            return
+        with self._cond:
+            self._pending_size += len(data)
+            if seed:
+                # Кусками: поток экрана не держит блокировку на весь хвост буфера
+                self._pending.extend(data[i:i + TERMINAL_SCREEN_BATCH] for i in range(0, len(data), TERMINAL_SCREEN_BATCH))
+                self._seed_size = self._pending_size
+            else:
+                self._pending.append(data)
+                if self._pending_size > self._seed_size + TERMINAL_SCREEN_BACKLOG:
+                    self._trim()
+            self._cond.notify()
+
+    def _trim(self):
+        """Разбор не успевает: промежуточный вывод не нужен, экран восстановим по хвосту (под _cond)"""
+        tail = ''.join(item for item in self._pending if isinstance(item, str))[-TERMINAL_SCREEN_RESEED_SIZE:]
+        self._pending = [('resize',) + self.size, tail]
+        self._pending_size = len(tail)
+        self._seed_size = 0
+        self._reset = True
+
+    def resize(self, columns, lines):
+        with self._cond:
+            self.size = (columns, lines)
+            self._pending.append(('resize', columns, lines))
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._pending = []
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            started = time.monotonic()
+            self._drain(TERMINAL_SCREEN_BATCH)
+            # Не больше половины времени на разбор: GIL нужен и потоку ввода-вывода
+            time.sleep(time.monotonic() - started)
+
+    def _drain(self, limit=None):
+        """Разобрать накопленное (все или около limit символов); _lock сохраняет порядок разбора"""
+        with self._lock:
+            with self._cond:
+                taken = 0
+                count = 0
+                for item in self._pending:
+                    if limit is not None and taken >= limit:
+                        break
+                    count += 1
+                    if isinstance(item, str):
+                        taken += len(item)
+                pending, self._pending = self._pending[:count], self._pending[count:]
+                self._pending_size -= taken
+                self._seed_size = max(0, self._seed_size - taken)
+                reset, self._reset = self._reset, False
+            if reset:
+                self._screen.reset()
+            for item in pending:
+                try:
+                    if isinstance(item, str):
+                        self._stream.feed(item)
+                    else:
+                        self._screen.resize(item[2], item[1])
+                except Exception as e:
+                    print(f"Ошибка разбора вывода виртуальным терминалом: {e}")
+
+    def snapshot(self, scrollback=TERMINAL_SNAPSHOT_SCROLLBACK):
+        """Последовательность ANSI, воспроизводящая прокрутку, экран и позицию курсора; None, пока экран не прогрет"""
+        # Начальный хвост буфера разбирает поток экрана; снимок его не ждет
+        with self._cond:
+            if self._seed_size:
+                return None
+            # Остаток очереди дорабатываем здесь: снимок не должен отставать от вывода.
+            # Непрерывный поток вывода при этом сводим к хвосту, как при отставании разбора
+            if self._pending_size > TERMINAL_SCREEN_RESEED_SIZE:
+                self._trim()
+        self._drain()
+        with self._lock:
+            screen = self._screen
+            history = list(screen.history.top)[-scrollback:] if scrollback else []
+            rows = [self._render_line(line, screen.columns) for line in history]
+            rows += [self._render_line(screen.buffer[y], screen.columns) for y in range(screen.lines)]
+            cursor = screen.cursor
+            # Курсор - относительно последней строки экрана: у клиента может быть больше строк,
+            # и тогда экран сервера занимает не верх окна
+            up = screen.lines - 1 - cursor.y
+            tail = "\x1b[0m\r" + (f"\x1b[{up}A" if up else "") + f"\x1b[{cursor.x + 1}G{self._sgr(cursor.attrs)}"
+            if cursor.hidden:
+                tail += "\x1b[?25l"
+        # \x1bc - полный сброс терминала клиента перед отрисовкой
+        return "\x1bc" + "\r\n".join(rows) + tail
+
+    def _render_line(self, line, columns):
+        default = self._screen.default_char
+        last = -1
+        for x in range(columns):
+            char = line[x]
+            if char.data not in (' ', '') or char[1:] != default[1:]:
+                last = x
+        parts = []
+        attrs = default[1:]
+        for x in range(last + 1):
+            char = line[x]
+            if not char.data:
+                # Вторая половина широкого символа
+                continue
+            if char[1:] != attrs:
+                attrs = char[1:]
+                parts.append(self._sgr(char))
+            parts.append(char.data)
+        if attrs != default[1:]:
+            parts.append("\x1b[0m")
+        return ''.join(parts)
+
+    def _sgr(self, char):
+        codes = ['0']
+        for flag, code in (('bold', '1'), ('italics', '3'), ('underscore', '4'), ('blink', '5'), ('reverse', '7'), ('strikethrough', '9')):
+            if getattr(char, flag, False):
+                codes.append(code)
+        for color, names, extended in ((char.fg, self._FG_CODES, '38'), (char.bg, self._BG_CODES, '48')):
+            if color == 'default':
+                continue
+            if color in names:
+                codes.append(str(names[color]))
+            elif len(color) == 6:
+                try:
+                    codes.append(f"{extended};2;{int(color[0:2], 16)};{int(color[2:4], 16)};{int(color[4:6], 16)}")
+                except ValueError:
+                    pass
+        return f"\x1b[{';'.join(codes)}m"
+
+def get_terminal_screen(process_name):
+    """Виртуальный экран процесса (создается по буферу при первом обращении) или None без pyte"""
+    if pyte is None or not TERMINAL_SCREEN_MODEL:
+        return None
+    buffer = get_output_buffer(process_name)
+    if buffer.screen is None:
+        columns, lines = (processes.get(process_name) or {}).get('winsize') or (TERMINAL_COLUMNS, TERMINAL_LINES)
+        screen = TerminalScreen(columns, lines, name=f'terminal-screen-{process_name}')
+        if buffer.attach_screen(screen) is not screen:
+            screen.close()
+    return buffer.screen
+
+def release_terminal_screen(process_name):
+    """Последний зритель ушел: экран больше не ведем"""
+    buffer = process_outputs.get(process_name)
+    if buffer is not None:
+        buffer.detach_screen()
+
+def get_process_snapshot(process_name):
+    """Содержимое для подключающегося клиента: экран с прокруткой или сырой буфер вывода"""
+    with screen_viewers_lock:
+        viewed = bool(screen_viewers.get(process_name))
+    screen = get_terminal_screen(process_name) if viewed else None
+    snapshot = screen.snapshot() if screen is not None else None
+    if snapshot is not None:
+        return snapshot
+    # Без pyte или пока экран прогревается в своем потоке - хвост сырого вывода
+    return get_output_buffer(process_name).tail(OUTPUT_SNAPSHOT_SIZE)
+
+def get_output_buffer(process_name):
+    """Получить (или создать) буфер вывода процесса; история с диска подгружается при первом обращении"""
+    buffer = process_outputs.get(process_name)
+    if buffer is not None:
+        return buffer
+    with process_outputs_lock:
+        buffer = process_outputs.get(process_name)
+        if buffer is None:
+            buffer = ScrollbackBuffer()
+            if process_name in known_histories:
+                try:
+                    for data in read_history_entries(process_name):
+                        buffer.append(data)
+                except Exception as e:
+                    print(f"Ошибка загрузки истории для {process_name}: {e}")
+                    buffer.clear()
+            process_outputs[process_name] = buffer
+        return buffer
+
+def get_process_room(process_name, binary=False):
+    """Комната Socket.IO, в которую отправляется вывод процесса (текстом или байтами)"""
+    return f"process:{process_name}:bin" if binary else f"process:{process_name}"
+
+def get_client_transport(sid):
+    return client_transports.get(sid, {'binary': False, 'compress': False})
+
+def room_has_members(room):
+    if SERVER_ROLE == 'owner':
+        with client_rooms_lock:
+            return bool(client_rooms.get(room))
+    for _ in socketio.server.manager.get_participants('/', room):
+        return True
+    return False
+
+def enter_client_room(sid, room):
+    """Добавить клиента в комнату (через шину, если клиент подключен к другому серверу)"""
+    socketio.server.enter_room(sid, room, namespace='/')
+    if SERVER_ROLE == 'owner':
+        with client_rooms_lock:
+            client_rooms.setdefault(room, set()).add(sid)
+
+def leave_client_room(sid, room):
+    socketio.server.leave_room(sid, room, namespace='/')
+    if SERVER_ROLE == 'owner':
+        with client_rooms_lock:
+            members = client_rooms.get(room)
+            if members is not None:
+                members.discard(sid)
+                if not members:
+                    del client_rooms[room]
+
+def forget_client_rooms(sid):
+    """Клиент отключился: убрать его из учета комнат"""
+    with client_rooms_lock:
+        for room in list(client_rooms):
+            client_rooms[room].discard(sid)
+            if not client_rooms[room]:
+                del client_rooms[room]
+
+def make_output_payload(sid, process_name, text, **extra):
+    """Сформировать сообщение с историей/экраном с учетом транспорта клиента"""
+    transport = get_client_transport(sid)
+    payload = {'process': process_name}
+    payload.update(extra)
+    if transport['binary'] or transport['compress']:
+        data = text.encode('utf-8')
+        if transport['compress'] and len(data) >= HISTORY_COMPRESS_THRESHOLD:
+            payload['data'] = zlib.compress(data)
+            payload['encoding'] = 'deflate'
+        elif transport['binary']:
+            payload['data'] = data
+        else:
+            payload['data'] = text
+    else:
+        payload['data'] = text
+    return payload
+
+class OutputBatcher:
+    """Склейка вывода процессов в кадры Socket.IO с окном, растущим при интенсивном выводе"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # process_name -> [байты, текст, size, deadline]
+        self._last_flush = {}
+        self._interval = {}
+        self._seq = {}
+        self.stats = {'chunks': 0, 'frames': 0, 'bytes': 0}
+
+    def add(self, process_name, raw, text):
+        """Добавить вывод в буфер и в кадр; возвращает True, если нужно разбудить цикл для отправки по таймеру"""
+        now = time.monotonic()
+        buffer = get_output_buffer(process_name)
+        with self._lock:
+            buffer.append(text)
+            self.stats['chunks'] += 1
+            pending = self._pending.get(process_name)
+            if pending is None:
+                interval = self._interval.get(process_name, OUTPUT_BATCH_MIN_INTERVAL)
+                if now - self._last_flush.get(process_name, 0) >= interval:
+                    frame = [[raw], [text]]
+                    self._mark_flushed(process_name, len(raw), now)
+                else:
+                    self._pending[process_name] = [[raw], [text], len(raw), self._last_flush[process_name] + interval]
+                    return True
+            else:
+                pending[0].append(raw)
+                pending[1].append(text)
+                pending[2] += len(raw)
+                if pending[2] < OUTPUT_BATCH_SIZE:
+                    return False
+                frame = self._pending.pop(process_name)
+                self._mark_flushed(process_name, pending[2], now)
+            self._emit(process_name, frame[0], frame[1], self._seq[process_name])
+        return False
+
+    def next_deadline(self):
+        with self._lock:
+            if not self._pending:
+                return None
+            return min(p[3] for p in self._pending.values())
+
+    def flush_due(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [name for name, p in self._pending.items() if p[3] <= now]
+        for process_name in due:
+            self.flush(process_name)
+
+    def flush(self, process_name):
+        with self._lock:
+            self._flush(process_name)
+
+    def _flush(self, process_name):
+        pending = self._pending.pop(process_name, None)
+        if pending is not None:
+            self._mark_flushed(process_name, pending[2], time.monotonic())
+            self._emit(process_name, pending[0], pending[1], self._seq[process_name])
+
+    def resync(self, sid, process_name):
+        """Вернуть клиента в поток кадров с актуальным экраном; возвращает seq снимка"""
+        with self._lock:
+            self._flush(process_name)
+            seq = self._seq.get(process_name, 0)
+            payload = make_output_payload(sid, process_name, get_process_snapshot(process_name), seq=seq)
+            enter_client_room(sid, get_process_room(process_name, get_client_transport(sid)['binary']))
+            socketio.emit('process_resync', payload, to=sid)
+        return seq
+
+    def current_seq(self, process_name):
+        with self._lock:
+            return self._seq.get(process_name, 0)
+
+    def _mark_flushed(self, process_name, size, now):
+        self._last_flush[process_name] = now
+        self._seq[process_name] = self._seq.get(process_name, 0) + 1
+        # Крупный кадр - признак интенсивного вывода, расширяем окно
+        busy = size >= OUTPUT_BATCH_SIZE // 4
+        self._interval[process_name] = OUTPUT_BATCH_MAX_INTERVAL if busy else OUTPUT_BATCH_MIN_INTERVAL
+        self.stats['frames'] += 1
+        self.stats['bytes'] += size
+
+    def _emit(self, process_name, raw_chunks, text_chunks, seq):
+        # Кадр собирается только для тех транспортов, у которых есть подписчики
+        for binary in (False, True):
+            room = get_process_room(process_name, binary)
+            if not room_has_members(room):
+                continue
+            data = b''.join(raw_chunks) if binary else ''.join(text_chunks)
+            try:
+                socketio.emit('process_output', {'process': process_name, 'data': data, 'seq': seq}, to=room)
+            except:
+                pass
+        check_lagging_subscribers(process_name, seq)
+
+output_batcher = OutputBatcher()
+
+def emit_process_output(process_name, data, raw=None):
+    """Добавить вывод в буфер процесса и отправить подписанным на него клиентам (с склейкой в кадры)"""
+    if raw is None:
+        raw = data.encode('utf-8')
+    if output_batcher.add(process_name, raw, data) and threading.current_thread() is not io_loop._thread:
+        io_loop.wakeup()
+
+def subscribe_output(sid, process_name, flow_control=False):
+    """Подписать клиента на вывод процесса"""
+    enter_client_room(sid, get_process_room(process_name, get_client_transport(sid)['binary']))
+    with screen_viewers_lock:
+        screen_viewers.setdefault(process_name, set()).add(sid)
+    if flow_control:
+        seq = output_batcher.current_seq(process_name)
+        with output_subscribers_lock:
+            output_subscribers.setdefault(process_name, {})[sid] = {'acked': seq, 'sent': seq, 'lagging': False}
+
+def unsubscribe_output(sid, process_name=None):
+    """Отписать клиента от вывода одного процесса (или всех при process_name=None)"""
+    with output_subscribers_lock:
+        names = [process_name] if process_name else list(output_subscribers.keys())
+        for name in names:
+            output_subscribers.get(name, {}).pop(sid, None)
+    released = []
+    with screen_viewers_lock:
+        for name in ([process_name] if process_name else list(screen_viewers)):
+            viewers = screen_viewers.get(name)
+            if viewers is not None and sid in viewers:
+                viewers.discard(sid)
+                if not viewers:
+                    del screen_viewers[name]
+                    released.append(name)
+    for name in released:
+        release_terminal_screen(name)
+    forget_terminal_size(sid, process_name)
+    if process_name:
+        for binary in (False, True):
+            leave_client_room(sid, get_process_room(process_name, binary))
+
+def check_lagging_subscribers(process_name, seq):
+    """Отключить поток кадров клиентам, которые не успевают их подтверждать"""
+    lagging = []
+    with output_subscribers_lock:
+        for sid, state in output_subscribers.get(process_name, {}).items():
+            if state['lagging']:
+                continue
+            state['sent'] = seq
+            if seq - state['acked'] > OUTPUT_MAX_UNACKED_FRAMES:
+                state['lagging'] = True
+                lagging.append(sid)
+    for sid in lagging:
+        try:
+            leave_client_room(sid, get_process_room(process_name, get_client_transport(sid)['binary']))
+        except Exception:
+            pass
+
+def ack_output(sid, process_name, seq):
+    """Обработать подтверждение кадров; догнавший клиент получает актуальный экран"""
+    with output_subscribers_lock:
+        state = output_subscribers.get(process_name, {}).get(sid)
+        if state is None:
+            return
+        state['acked'] = max(state['acked'], seq)
+        resync = state['lagging'] and state['acked'] >= state['sent']
+        if resync:
+            state['lagging'] = False
+    if resync:
+        # Пропущенные кадры не досылаем - отдаем последний экран целиком
+        seq = output_batcher.resync(sid, process_name)
+        with output_subscribers_lock:
+            state['acked'] = state['sent'] = seq
+
+def record_output(process_name, data):
+    """Сохранить вывод процесса в файл истории (в буфер в памяти его кладет emit_process_output)"""
+    append_to_history_file(process_name, data)
+
 def get_script_name_without_extension(filename):
     """Получить имя файла без расширения"""
     if '.' in filename:
         return '.'.join(filename.split('.')[:-1])
     return filename
 
+def organize_script_file(item):
+    """Переместить исполняемый файл из корня scripts в папку с его именем; возвращает имя папки"""
+    item_path = os.path.join(SCRIPTS_DIR, item)
+    
+    # Если это файл (а не папка) и он исполняемый
+    if not (os.path.isfile(item_path) and os.access(item_path, os.X_OK)):
+        return None
+    
+    # Создаем папку с именем файла без расширения
+    folder_name = get_script_name_without_extension(item)
+    script_folder = os.path.join(SCRIPTS_DIR, folder_name)
+    
+    # Создаем папку если её нет
+    if not os.path.exists(script_folder):
+        os.makedirs(script_folder)
+    
+    # Перемещаем файл в папку
+    new_path = os.path.join(script_folder, item)
+    if os.path.exists(new_path):
+        return None
+    shutil.move(item_path, new_path)
+    print(f"Скрипт {item} перемещен в папку {script_folder}")
+    return folder_name
+
 def organize_scripts():
     """Организовать скрипты по папкам (без расширения)"""
     try:
@@ -49,263 +846,1626 @@ def organize_scripts():
             
         # Сканируем корневую папку scripts на наличие файлов (не папок)
         for item in os.listdir(SCRIPTS_DIR):
-            item_path = os.path.join(SCRIPTS_DIR, item)
-            
-            # Если это файл (а не папка) и он исполняемый
-            if os.path.isfile(item_path) and os.access(item_path, os.X_OK):
-                # Создаем папку с именем файла без расширения
-                folder_name = get_script_name_without_extension(item)
-                script_folder = os.path.join(SCRIPTS_DIR, folder_name)
-                
-                # Создаем папку если её нет
-                if not os.path.exists(script_folder):
-                    os.makedirs(script_folder)
-                
-                # Перемещаем файл в папку
-                new_path = os.path.join(script_folder, item)
-                if not os.path.exists(new_path):
-                    shutil.move(item_path, new_path)
-                    print(f"Скрипт {item} перемещен в папку {script_folder}")
+            folder_name = organize_script_file(item)
+            if folder_name:
+                script_registry.refresh_folder(folder_name)
                     
     except Exception as e:
         print(f"Ошибка организации скриптов: {e}")
 
-def get_history_file_path(process_name):
-    return os.path.join(HISTORY_DIR, f"{process_name}.log")
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
 
-def load_history():
-    """Загружаем последние 500 строк истории из файла"""
-    global process_outputs
+def get_process_tree(pid):
+    """PID процесса и всех его потомков (по /proc/<pid>/task/*/children)"""
+    pids = []
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        try:
+            for tid in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{tid}/children') as f:
+                    stack.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+def read_proc_usage(pid):
+    """Потребление одного процесса: такты CPU, RSS, ввод-вывод, открытые дескрипторы"""
+    usage = {'cpu_ticks': 0, 'rss_bytes': 0, 'read_bytes': 0, 'write_bytes': 0, 'open_fds': 0}
+    with open(f'/proc/{pid}/stat') as f:
+        # Имя процесса в скобках может содержать пробелы - разбираем после ')'
+        fields = f.read().rsplit(')', 1)[1].split()
+    usage['cpu_ticks'] = int(fields[11]) + int(fields[12])
+    with open(f'/proc/{pid}/statm') as f:
+        usage['rss_bytes'] = int(f.read().split()[1]) * PAGE_SIZE
     try:
-        if not os.path.exists(HISTORY_DIR):
-            os.makedirs(HISTORY_DIR)
+        with open(f'/proc/{pid}/io') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('read_bytes', 'write_bytes'):
+                    usage[key] = int(value)
+    except OSError:
+        pass
+    try:
+        usage['open_fds'] = len(os.listdir(f'/proc/{pid}/fd'))
+    except OSError:
+        pass
+    return usage
+
+class MetricsSampler:
+    """Фоновый сбор метрик управляемых процессов (вместе с потомками) из /proc"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previous = {}  # process_name -> (время, такты CPU, байт вывода)
+        self.metrics = {}
+        self.generation = 0
+        self._thread = None
+
+    def start(self):
+        if not METRICS_INTERVAL or not os.path.isdir('/proc'):
             return
-            
-        for filename in os.listdir(HISTORY_DIR):
-            if filename.endswith('.log'):
-                process_name = filename[:-4]
-                file_path = get_history_file_path(process_name)
-                
-                if os.path.exists(file_path):
-                    try:
-                        lines = []
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            all_lines = f.readlines()
-                            recent_lines = all_lines[-MAX_HISTORY_LINES:] if len(all_lines) > MAX_HISTORY_LINES else all_lines
-                            
-                            for line in recent_lines:
-                                try:
-                                    entry = json.loads(line.strip())
-                                    lines.append(entry['data'])
-                                except:
-                                    continue
-                                    
-                        process_outputs[process_name] = ''.join(lines)
-                    except Exception as e:
-                        print(f"Ошибка загрузки истории для {process_name}: {e}")
-                        process_outputs[process_name] = ""
-                        
-        print(f"История загружена из папки {HISTORY_DIR}")
-    except Exception as e:
-        print(f"Ошибка загрузки истории: {e}")
-        process_outputs = {}
+        self._thread = threading.Thread(target=self._run, name='metrics-sampler', daemon=True)
+        self._thread.start()
 
-def append_to_history_file(process_name, data):
-    """Добавляем запись в историю в формате JSON Lines"""
-    try:
-        file_path = get_history_file_path(process_name)
-        
-        entry = {
-            'timestamp': datetime.now().isoformat(),
-            'data': data
-        }
-        
-        with open(file_path, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    def get(self, process_name):
+        with self._lock:
+            return self.metrics.get(process_name)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.metrics)
+
+    def _run(self):
+        while not shutdown_event.wait(METRICS_INTERVAL):
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Ошибка сбора метрик: {e}")
+
+    def sample(self):
+        now = time.monotonic()
+        metrics = {}
+        for process_name, entry in list(processes.items()):
+            process = entry.get('process')
+            if not process or process.poll() is not None:
+                continue
+            total = {'cpu_ticks': 0, 'rss_bytes': 0, 'read_bytes': 0, 'write_bytes': 0, 'open_fds': 0}
+            pids = get_process_tree(process.pid)
+            for pid in pids:
+                try:
+                    usage = read_proc_usage(pid)
+                except (OSError, ValueError, IndexError):
+                    continue
+                for key, value in usage.items():
+                    total[key] += value
             
-        limit_history_file_size(file_path)
+            written = output_bytes.get(process_name, 0)
+            previous = self._previous.get(process_name)
+            cpu_percent = output_rate = 0.0
+            if previous and now > previous[0]:
+                elapsed = now - previous[0]
+                cpu_percent = max(0.0, (total['cpu_ticks'] - previous[1]) / CLOCK_TICKS / elapsed * 100)
+                output_rate = max(0.0, (written - previous[2]) / elapsed)
+            self._previous[process_name] = (now, total['cpu_ticks'], written)
             
-    except Exception as e:
-        print(f"Ошибка записи в историю для {process_name}: {e}")
+            metrics[process_name] = {
+                'pid': process.pid,
+                'processes': len(pids),
+                'cpu_percent': round(cpu_percent, 2),
+                'rss_bytes': total['rss_bytes'],
+                'read_bytes': total['read_bytes'],
+                'write_bytes': total['write_bytes'],
+                'open_fds': total['open_fds'],
+                'output_bytes': written,
+                'output_bytes_per_sec': round(output_rate, 1),
+            }
+        
+        for process_name in list(self._previous):
+            if process_name not in metrics:
+                del self._previous[process_name]
+        with self._lock:
+            self.metrics = metrics
+            self.generation += 1
+
+metrics_sampler = MetricsSampler()
+
+def make_process_info(folder, script_file):
+    return {
+        'name': folder,
+        'script_file': script_file,
+        'status': 'running' if is_process_running(folder) else 'stopped',
+        'supervisor': supervisor.get_status(folder)
+    }
 
-def limit_history_file_size(file_path):
-    """Ограничиваем размер файла истории до MAX_HISTORY_LINES строк"""
+def load_supervisor_policy(process_name):
+    """Прочитать политику скрипта из SUPERVISOR_POLICY_FILE, недостающие поля - по умолчанию"""
+    policy = dict(SUPERVISOR_DEFAULT_POLICY, limits={})
+    path = os.path.join(SCRIPTS_DIR, process_name, SUPERVISOR_POLICY_FILE)
     try:
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            if len(lines) > MAX_HISTORY_LINES:
-                lines = lines[-MAX_HISTORY_LINES:]
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.writelines(lines)
-    except Exception as e:
-        print(f"Ошибка ограничения размера файла истории: {e}")
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return policy
+    except (OSError, ValueError) as e:
+        print(f"Ошибка чтения политики {path}: {e}")
+        return policy
+    if isinstance(data, dict):
+        policy.update((key, value) for key, value in data.items() if key in policy)
+    if policy['restart'] not in ('no', 'on-failure', 'always'):
+        print(f"Неизвестный режим перезапуска в {path}: {policy['restart']}")
+        policy['restart'] = 'no'
+    if not isinstance(policy['limits'], dict):
+        policy['limits'] = {}
+    return policy
 
-def save_current_history():
-    print("История уже сохраняется построчно")
-    pass
+def find_script_file(script_folder):
+    """Найти первый исполняемый файл в папке скрипта"""
+    for file in os.listdir(script_folder):
+        file_path = os.path.join(script_folder, file)
+        if os.path.isfile(file_path) and os.access(file_path, os.X_OK):
+            return file
+    return None
 
-def cleanup():
-    print("Завершение работы приложения...")
-    for process_name in list(processes.keys()):
-        if process_name in processes and processes[process_name].get('process'):
-            try:
-                process = processes[process_name]['process']
-                if process.poll() is None:
-                    process.terminate()
+REGISTRY_ROOM = 'registry'
+
+class ScriptRegistry:
+    """Кэш списка скриптов и их политик с журналом дельт (seq, epoch) для клиентов"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scripts = {}  # имя папки -> имя исполняемого файла
+        self._policies = {}  # имя папки -> политика автоперезапуска
+        self._deltas = deque(maxlen=REGISTRY_DELTA_LOG_SIZE)
+        self.version = 0
+        self.epoch = os.urandom(8).hex()
+
+    def rebuild(self):
+        scripts = {}
+        try:
+            for folder in os.listdir(SCRIPTS_DIR):
+                folder_path = os.path.join(SCRIPTS_DIR, folder)
+                if os.path.isdir(folder_path):
                     try:
-                        process.wait(timeout=3)
-                    except subprocess.TimeoutExpired:
-                        process.kill()
-                        process.wait()
-                    print(f"Процесс {process_name} остановлен")
-            except Exception as e:
-                print(f"Ошибка остановки процесса {process_name}: {e}")
-    
-    try:
-        observer.stop()
-        observer.join()
-    except:
-        pass
-    
-    print("Приложение завершено")
+                        script_file = find_script_file(folder_path)
+                    except OSError:
+                        continue
+                    if script_file:
+                        scripts[folder] = script_file
+        except Exception as e:
+            print(f"Ошибка при чтении папки scripts: {e}")
+        policies = {folder: load_supervisor_policy(folder) for folder in scripts}
+        with self._lock:
+            self._scripts = scripts
+            self._policies = policies
+            self.version += 1
+            # Журнал дельт больше не согласован со списком - клиентам нужен полный снимок
+            self._deltas.clear()
 
-atexit.register(cleanup)
-signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
-signal.signal(signal.SIGINT, lambda signum, frame: sys.exit(0))
+    def refresh_folder(self, folder):
+        """Пересканировать одну папку; возвращает имя исполняемого файла или None"""
+        return self._refresh(folder)[0]
 
-# Организуем скрипты при запуске
-organize_scripts()
-load_history()
+    def refresh_folders(self, folders):
+        """Пересканировать набор папок; возвращает сводку изменений"""
+        changes = {'added': [], 'updated': [], 'removed': []}
+        for folder in sorted(folders):
+            op = self._refresh(folder)[1]
+            if op:
+                changes[op].append(folder)
+        return changes
 
-class ScriptsFolderHandler(FileSystemEventHandler):
-    def __init__(self, socketio):
-        self.socketio = socketio
-        self.last_event_time = 0
-    
-    def on_any_event(self, event):
-        if event.is_directory or event.src_path.endswith(('.tmp', '.swp', '~')):
-            return
-            
-        current_time = time.time()
-        if current_time - self.last_event_time < 1:
-            return
-            
-        self.last_event_time = current_time
-        
-        # Организуем скрипты при изменении в папке
-        organize_scripts()
-        
+    def _refresh(self, folder):
+        folder_path = os.path.join(SCRIPTS_DIR, folder)
+        script_file = None
+        if os.path.isdir(folder_path):
+            try:
+                script_file = find_script_file(folder_path)
+            except OSError:
+                script_file = None
+        policy = load_supervisor_policy(folder) if script_file else None
+        with self._lock:
+            old_file = self._scripts.get(folder)
+            old_policy = self._policies.get(folder)
+            if policy:
+                self._policies[folder] = policy
+            else:
+                self._policies.pop(folder, None)
+            if old_file == script_file:
+                if not script_file or policy == old_policy:
+                    return script_file, None
+                # Изменился только файл политики: клиентам - новое состояние автоперезапуска
+                self._record({'op': 'supervisor', 'process': {'name': folder, 'supervisor': supervisor.get_status(folder)}})
+                return script_file, 'updated'
+            if script_file:
+                self._scripts[folder] = script_file
+                op = 'updated' if old_file else 'added'
+                self._record({
+                    'op': 'update' if old_file else 'add',
+                    'process': make_process_info(folder, script_file)
+                })
+            else:
+                self._scripts.pop(folder, None)
+                op = 'removed'
+                self._record({'op': 'remove', 'process': {'name': folder}})
+        return script_file, op
+
+    def set_status(self, folder, status):
+        """Отметить изменение статуса процесса"""
+        with self._lock:
+            self._record({'op': 'status', 'process': {'name': folder, 'status': status}})
+
+    def set_supervisor(self, folder, info):
+        """Отметить изменение состояния автоперезапуска"""
+        with self._lock:
+            self._record({'op': 'supervisor', 'process': {'name': folder, 'supervisor': info}})
+
+    def get(self, folder):
+        with self._lock:
+            return self._scripts.get(folder)
+
+    def policy(self, folder):
+        # Без блокировки: вызывается и из make_process_info под ней; словарь меняется только под _lock
+        return self._policies.get(folder)
+
+    def snapshot(self):
+        with self._lock:
+            return self.version, dict(self._scripts)
+
+    def sync(self, sid, since=None, epoch=None):
+        """Отправить клиенту дельты после since или полный снимок (нет в журнале или другой epoch)"""
+        with self._lock:
+            # Вход в комнату под блокировкой: ни одна дельта не потеряется и не придет раньше снимка
+            enter_client_room(sid, REGISTRY_ROOM)
+            if since is not None and epoch == self.epoch and since <= self.version:
+                deltas = [d for d in self._deltas if d['seq'] > since]
+                first_seq = deltas[0]['seq'] if deltas else self.version + 1
+                if first_seq == since + 1 and (not deltas or deltas[-1]['seq'] == self.version):
+                    for delta in deltas:
+                        socketio.emit('registry_delta', delta, to=sid)
+                    return
+            socketio.emit('registry_snapshot', {
+                'epoch': self.epoch,
+                'seq': self.version,
+                'processes': [make_process_info(folder, script_file) for folder, script_file in self._scripts.items()]
+            }, to=sid)
+
+    def _record(self, delta):
+        self.version += 1
+        delta['seq'] = self.version
+        delta['epoch'] = self.epoch
+        self._deltas.append(delta)
         try:
-            self.socketio.emit('scripts_updated', {'message': 'Список скриптов обновлен'})
+            socketio.emit('registry_delta', delta, to=REGISTRY_ROOM)
         except:
             pass
 
-observer = Observer()
-event_handler = ScriptsFolderHandler(socketio)
-observer.schedule(event_handler, SCRIPTS_DIR, recursive=False)
-observer.start()
+script_registry = ScriptRegistry()
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+def get_history_file_path(process_name):
+    return os.path.join(HISTORY_DIR, f"{process_name}.log")
 
-@app.route('/api/processes', methods=['GET'])
-def get_processes():
-    process_list = []
-    
-    if not os.path.exists(SCRIPTS_DIR):
-        os.makedirs(SCRIPTS_DIR)
-        return jsonify(process_list)
-    
+def get_history_segment_path(process_name, seq):
+    return f"{get_history_file_path(process_name)}.{seq}"
+
+def get_history_index_path(segment_path):
+    """Путь к индексу сегмента: смещение и время каждой записи"""
+    return f"{segment_path}.idx"
+
+# Запись индекса: смещение строки в сегменте (uint64) и время записи (unix time, double)
+HISTORY_INDEX_RECORD = struct.Struct('<Qd')
+
+def parse_history_timestamp(line):
     try:
-        # Сканируем папки внутри scripts
-        for folder in os.listdir(SCRIPTS_DIR):
-            folder_path = os.path.join(SCRIPTS_DIR, folder)
-            if os.path.isdir(folder_path):
-                # Ищем исполняемый файл внутри папки
-                script_file = None
-                for file in os.listdir(folder_path):
-                    file_path = os.path.join(folder_path, file)
-                    if os.path.isfile(file_path) and os.access(file_path, os.X_OK):
-                        script_file = file
-                        break
-                
-                if script_file:
-                    # Проверяем статус процесса
-                    status = 'running' if folder in processes and processes[folder].get('process') and processes[folder]['process'].poll() is None else 'stopped'
-                    process_list.append({
-                        'name': folder,
-                        'script_file': script_file,
-                        'status': status
-                    })
-    except Exception as e:
-        print(f"Ошибка при чтении папки scripts: {e}")
-    
-    return jsonify(process_list)
+        return datetime.fromisoformat(json.loads(line)['timestamp']).timestamp()
+    except Exception:
+        return 0.0
 
-@app.route('/api/process/<process_name>/status', methods=['GET'])
-def get_process_status(process_name):
-    if process_name in processes and processes[process_name].get('process'):
-        if processes[process_name]['process'].poll() is None:
-            status = 'running'
-        else:
-            status = 'stopped'
-            cleanup_process(process_name)
-    else:
-        status = 'stopped'
-    
-    return jsonify({'status': status, 'process': process_name})
+def list_history_segments(process_name):
+    """Номера закрытых сегментов истории процесса по возрастанию"""
+    prefix = f"{process_name}.log."
+    segments = []
+    try:
+        for filename in os.listdir(HISTORY_DIR):
+            if filename.startswith(prefix) and filename[len(prefix):].isdigit():
+                segments.append(int(filename[len(prefix):]))
+    except OSError:
+        pass
+    return sorted(segments)
 
-@app.route('/api/process/<process_name>/start', methods=['POST'])
-def start_process_api(process_name):
-    success, message = start_process(process_name)
-    return jsonify({'success': success, 'message': message})
+class HistoryLog:
+    """Журнал истории процесса: текущий сегмент history/<name>.log и закрытые history/<name>.log.<N>"""
 
-@app.route('/api/process/<process_name>/stop', methods=['POST'])
-def stop_process_api(process_name):
-    success, message = stop_process(process_name)
-    return jsonify({'success': success, 'message': message})
+    def __init__(self, process_name):
+        self.process_name = process_name
+        self.path = get_history_file_path(process_name)
+        self.index_path = get_history_index_path(self.path)
+        self._lock = threading.Lock()
+        self._file = None
+        self._index_file = None
+        self._lines = 0
+        self._size = 0
+        self._segments = deque(list_history_segments(process_name))
+        self._index_events = []  # Изменения для индекса поиска из текущей пачки
 
-@socketio.on('connect')
-def handle_connect():
-    pass
+    def _open(self):
+        self._file = open(self.path, 'a', encoding='utf-8')
+        known_histories.add(self.process_name)
+        self._size = self._file.tell()
+        self._lines = 0
+        index_records = []
+        if self._size:
+            # Индексируем уже существующий сегмент один раз при открытии
+            offset = 0
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    index_records.append((offset, line))
+                    offset += len(line)
+            self._lines = len(index_records)
+        
+        try:
+            index_size = os.path.getsize(self.index_path)
+        except OSError:
+            index_size = -1
+        if index_size != self._lines * HISTORY_INDEX_RECORD.size:
+            # Индекса нет или он не согласован с сегментом - строим заново
+            with open(self.index_path, 'wb') as f:
+                for offset, line in index_records:
+                    f.write(HISTORY_INDEX_RECORD.pack(offset, parse_history_timestamp(line)))
+        self._index_file = open(self.index_path, 'ab')
+        
+        if self._is_full():
+            self._rotate()
 
-def start_process(process_name):
-    global processes, process_outputs
-    
-    # Путь к папке скрипта
-    script_folder = os.path.join(SCRIPTS_DIR, process_name)
-    
-    print(f"Попытка запуска процесса: {process_name}")
-    print(f"Путь к папке скрипта: {script_folder}")
-    
-    # Проверяем существование папки
-    if not os.path.exists(script_folder):
-        return False, f'Папка скрипта {script_folder} не существует'
+    def _is_full(self):
+        return self._lines >= HISTORY_SEGMENT_LINES or self._size >= HISTORY_SEGMENT_SIZE
+
+    def _current_seq(self):
+        # Номер, под которым текущий сегмент будет сохранен при ротации
+        return self._segments[-1] + 1 if self._segments else 1
+
+    def _rotate(self):
+        self._file.close()
+        self._index_file.close()
+        seq = self._current_seq()
+        segment_path = get_history_segment_path(self.process_name, seq)
+        os.replace(self.path, segment_path)
+        os.replace(self.index_path, get_history_index_path(segment_path))
+        self._segments.append(seq)
+        while len(self._segments) > HISTORY_MAX_SEGMENTS - 1:
+            old_seq = self._segments.popleft()
+            old_path = get_history_segment_path(self.process_name, old_seq)
+            for path in (old_path, get_history_index_path(old_path)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._index_events.append(('drop', old_seq))
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._index_file = open(self.index_path, 'ab')
+        self._lines = 0
+        self._size = 0
+
+    def write_lines(self, entries):
+        """Записать пачку записей: (строка JSON Lines с переводом строки, unix time, данные)"""
+        with self._lock:
+            self._index_events = []
+            if self._file is None:
+                self._open()
+            index = []
+            for line, timestamp, data in entries:
+                self._index_events.append(('add', self._current_seq(), self._lines, timestamp, data))
+                index.append(HISTORY_INDEX_RECORD.pack(self._size, timestamp))
+                self._file.write(line)
+                self._lines += 1
+                self._size += len(line.encode('utf-8'))
+                if self._is_full():
+                    self._flush_index(index)
+                    index = []
+                    self._rotate()
+            self._flush_index(index)
+            # Индекс обновляет свой поток; здесь только очередь, без ожидания
+            history_indexer.put(self.process_name, self._index_events)
+            self._index_events = []
+
+    def _flush_index(self, index):
+        # Сначала данные, потом индекс: читатель видит только полностью записанные строки
+        self._file.flush()
+        if index:
+            self._index_file.write(b''.join(index))
+        self._index_file.flush()
+
+    def fsync(self):
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                os.fsync(self._index_file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                for f in (self._file, self._index_file):
+                    try:
+                        f.close()
+                    except OSError:
+                        pass
+                self._file = None
+                self._index_file = None
+
+def get_history_log(process_name):
+    with history_logs_lock:
+        log = history_logs.get(process_name)
+        if log is None:
+            log = history_logs[process_name] = HistoryLog(process_name)
+        return log
+
+def _close_history_log_now(process_name):
+    with history_logs_lock:
+        log = history_logs.pop(process_name, None)
+    if log:
+        log.close()
+
+class HistoryWriter:
+    """Общий фоновый поток записи истории: пачки по объему или таймеру, fsync не чаще HISTORY_FSYNC_INTERVAL"""
+
+    _STOP = object()
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._queue_bytes = 0
+        self._dropping = False
+        self._pending = {}
+        self._pending_size = 0
+        self._dirty = set()
+        self._last_flush = time.monotonic()
+        self._last_fsync = time.monotonic()
+        self._thread = None
+        self._stopped = False
+        self.stats = {
+            'queued': 0,
+            'written': 0,
+            'batches': 0,
+            'errors': 0,
+            'dropped': 0,
+            'dropped_bytes': 0,
+            'max_queue_depth': 0,
+            'max_queue_bytes': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._thread.start()
+
+    def put(self, process_name, line, timestamp=0.0, data=''):
+        """Поставить строку в очередь, не ожидая (line=None - закрыть журнал процесса после записи)"""
+        if self._stopped:
+            # Поток уже остановлен (завершение работы) - пишем синхронно
+            if line is None:
+                _close_history_log_now(process_name)
+            else:
+                get_history_log(process_name).write_lines([(line, timestamp, data)])
+            return
+        size = len(line) if line is not None else 0
+        with self._cond:
+            if size and self._queue_bytes + size > HISTORY_QUEUE_BYTES:
+                # Диск не успевает: запись отбрасывается, вывод процессов не ждет
+                self.stats['dropped'] += 1
+                self.stats['dropped_bytes'] += size
+                if not self._dropping:
+                    self._dropping = True
+                    print(f"Очередь истории переполнена ({self._queue_bytes} байт), записи отбрасываются")
+                return
+            self._dropping = False
+            self._queue.append((process_name, line, timestamp, data))
+            self._queue_bytes += size
+            self.stats['queued'] += 1
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], len(self._queue))
+            self.stats['max_queue_bytes'] = max(self.stats['max_queue_bytes'], self._queue_bytes)
+            self._cond.notify()
+
+    def get_stats(self):
+        return dict(self.stats, queue_depth=len(self._queue), queue_bytes=self._queue_bytes, pending_bytes=self._pending_size)
+
+    def stop(self):
+        """Дописать все накопленные записи и остановить поток"""
+        self._stopped = True
+        if self._thread and self._thread.is_alive():
+            with self._cond:
+                self._queue.append((self._STOP, None, None, None))
+                self._cond.notify()
+            self._thread.join()
+        else:
+            self._drain_queue()
+            self._flush()
+        self._fsync()
+
+    def _get(self, timeout):
+        with self._cond:
+            if not self._queue:
+                self._cond.wait(timeout)
+            if not self._queue:
+                return None, None, None, None
+            item = self._queue.popleft()
+            if item[1] is not None:
+                self._queue_bytes -= len(item[1])
+            return item
+
+    def _drain_queue(self):
+        while True:
+            item = self._get(0)
+            if item[0] is None:
+                return
+            if item[0] is not self._STOP:
+                self._add(*item)
+
+    def _run(self):
+        while True:
+            timeout = max(0.0, HISTORY_FLUSH_INTERVAL - (time.monotonic() - self._last_flush))
+            process_name, line, timestamp, data = self._get(timeout)
+            
+            if process_name is self._STOP:
+                self._drain_queue()
+                self._flush()
+                return
+            if process_name is not None:
+                self._add(process_name, line, timestamp, data)
+            
+            if self._pending_size >= HISTORY_FLUSH_SIZE or time.monotonic() - self._last_flush >= HISTORY_FLUSH_INTERVAL:
+                self._flush()
+            if HISTORY_FSYNC_INTERVAL and time.monotonic() - self._last_fsync >= HISTORY_FSYNC_INTERVAL:
+                self._fsync()
+
+    def _add(self, process_name, line, timestamp, data):
+        if line is None:
+            # Закрытие журнала выполняется после записи всего, что было до него
+            self._flush()
+            _close_history_log_now(process_name)
+            self._dirty.discard(process_name)
+            return
+        self._pending.setdefault(process_name, []).append((line, timestamp, data))
+        self._pending_size += len(line)
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        pending, self._pending, self._pending_size = self._pending, {}, 0
+        started = time.monotonic()
+        for process_name, lines in pending.items():
+            try:
+                get_history_log(process_name).write_lines(lines)
+                self._dirty.add(process_name)
+                self.stats['written'] += len(lines)
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"Ошибка записи в историю для {process_name}: {e}")
+        elapsed_ms = (time.monotonic() - started) * 1000
+        self.stats['batches'] += 1
+        self.stats['last_flush_ms'] = round(elapsed_ms, 3)
+        self.stats['max_flush_ms'] = max(self.stats['max_flush_ms'], round(elapsed_ms, 3))
+        self.stats['total_flush_ms'] += elapsed_ms
+
+    def _fsync(self):
+        self._last_fsync = time.monotonic()
+        if not HISTORY_FSYNC_INTERVAL:
+            return
+        for process_name in list(self._dirty):
+            with history_logs_lock:
+                log = history_logs.get(process_name)
+            try:
+                if log:
+                    log.fsync()
+            except OSError as e:
+                print(f"Ошибка fsync истории для {process_name}: {e}")
+        self._dirty.clear()
+
+history_writer = HistoryWriter()
+
+def close_history_log(process_name):
+    """Закрыть журнал процесса после записи всех уже поставленных в очередь записей"""
+    history_writer.put(process_name, None)
+
+def read_tail_lines(path, limit, block_size=65536):
+    """Прочитать последние limit строк файла, читая блоками с конца"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        blocks = []
+        newlines = 0
+        while position > 0 and newlines <= limit:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size)
+            newlines += block.count(b'\n')
+            blocks.append(block)
+    data = b''.join(reversed(blocks))
+    lines = data.splitlines()
+    if position > 0:
+        # Первая строка блока может быть неполной
+        lines = lines[1:]
+    return lines[-limit:] if limit else []
+
+def read_history_entries(process_name, limit=MAX_HISTORY_LINES):
+    """Прочитать последние limit записей истории (данные) из всех сегментов"""
+    paths = [get_history_file_path(process_name)]
+    paths += [get_history_segment_path(process_name, seq) for seq in reversed(list_history_segments(process_name))]
     
-    if not os.path.isdir(script_folder):
-        return False, f'Путь {script_folder} не является папкой'
+    chunks = []
+    for path in paths:
+        if len(chunks) >= limit:
+            break
+        try:
+            lines = read_tail_lines(path, limit - len(chunks))
+        except OSError:
+            continue
+        segment = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                segment.append(entry['data'])
+            except:
+                continue
+        chunks = segment + chunks
+    return chunks[-limit:]
+
+def load_history_index(process_name):
+    """Сегменты истории от старых к новым: (номер, путь, [(смещение, время), ...])"""
+    closed = list_history_segments(process_name)
+    segments = [(seq, get_history_segment_path(process_name, seq)) for seq in closed]
+    segments.append(((closed[-1] if closed else 0) + 1, get_history_file_path(process_name)))
+    
+    result = []
+    for seq, path in segments:
+        try:
+            with open(get_history_index_path(path), 'rb') as f:
+                records = [record for record in HISTORY_INDEX_RECORD.iter_unpack(f.read())]
+        except (OSError, struct.error):
+            continue
+        result.append((seq, path, records))
+    return result
+
+def parse_history_time(value):
+    """Время для фильтра: unix time или строка ISO 8601"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+def parse_history_cursor(value):
+    if not value:
+        return None
+    seq, _, position = str(value).partition(':')
+    return int(seq), int(position)
+
+def query_history(process_name, limit=HISTORY_PAGE_SIZE, before=None, after=None, start=None, end=None, last_bytes=None):
+    """Выборка записей истории по индексу: страница по курсору, интервал времени или последние last_bytes"""
+    for attempt in range(3):
+        closed = list_history_segments(process_name)
+        page = _query_history(process_name, limit, before, after, start, end, last_bytes)
+        # Ротация во время чтения переименовывает текущий сегмент - тогда читаем заново
+        if list_history_segments(process_name) == closed:
+            break
+    return page
+
+def _query_history(process_name, limit, before, after, start, end, last_bytes):
+    last_bytes = int(last_bytes) if last_bytes else None
+    # Объем last_bytes ограничивает страницу вместо limit
+    limit = HISTORY_PAGE_MAX if last_bytes else max(1, min(int(limit or HISTORY_PAGE_SIZE), HISTORY_PAGE_MAX))
+    segments = load_history_index(process_name)
+    
+    # Сквозная нумерация записей всех сегментов
+    bases = []
+    total = 0
+    for _, _, records in segments:
+        bases.append(total)
+        total += len(records)
+    
+    def locate(position):
+        k = bisect.bisect_right(bases, position) - 1
+        return k, position - bases[k]
+    
+    def timestamp_at(position):
+        k, i = locate(position)
+        return segments[k][2][i][1]
+    
+    def first_at_or_after(timestamp):
+        lo, hi = 0, total
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if timestamp_at(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+    
+    def position_of(cursor):
+        seq, i = cursor
+        for k, (segment_seq, _, records) in enumerate(segments):
+            if segment_seq == seq:
+                return bases[k] + min(i, len(records))
+        # Сегмент уже удален (старше всех): позиция перед первой записью,
+        # чтобы after не пропустил самую старую из оставшихся; или еще не создан (новее всех)
+        return -1 if not segments or seq < segments[0][0] else total
+    
+    lo, hi = 0, total
+    start, end = parse_history_time(start), parse_history_time(end)
+    if start is not None:
+        lo = first_at_or_after(start)
+    if end is not None:
+        hi = first_at_or_after(end)
+    before, after = parse_history_cursor(before), parse_history_cursor(after)
+    if after is not None:
+        lo = max(lo, position_of(after) + 1)
+    if before is not None:
+        hi = min(hi, position_of(before))
+    
+    forward = after is not None or (start is not None and before is None and not last_bytes)
+    if hi <= lo:
+        positions = range(0)
+    elif forward:
+        positions = range(lo, min(hi, lo + limit))
+    else:
+        positions = range(max(lo, hi - limit), hi)
     
-    # Ищем исполняемый файл в папке
-    script_path = None
-    script_file = None
+    entries = []
+    size = 0
+    open_files = {}
+    try:
+        for position in (positions if forward else reversed(positions)):
+            k, i = locate(position)
+            seq, path, records = segments[k]
+            if path not in open_files:
+                open_files[path] = open(path, 'rb')
+            f = open_files[path]
+            f.seek(records[i][0])
+            try:
+                entry = json.loads(f.readline())
+            except ValueError:
+                continue
+            entries.append({'cursor': f"{seq}:{i}", 'timestamp': entry.get('timestamp'), 'data': entry.get('data', ''), '_position': position})
+            size += len(entries[-1]['data'])
+            if last_bytes and not forward and size >= last_bytes:
+                break
+    except OSError as e:
+        # Сегмент мог быть удален ротацией во время чтения
+        print(f"Ошибка чтения истории {process_name}: {e}")
+    finally:
+        for f in open_files.values():
+            f.close()
+    
+    if not forward:
+        entries.reverse()
     
+    first = entries[0]['_position'] if entries else None
+    last = entries[-1]['_position'] if entries else None
+    for entry in entries:
+        del entry['_position']
+    return {
+        'process': process_name,
+        'entries': entries,
+        'before': entries[0]['cursor'] if entries and first > lo else None,
+        'after': entries[-1]['cursor'] if entries and last < hi - 1 else None,
+    }
+
+# Escape-последовательности терминала (CSI, OSC, одиночные ESC x) и прочие управляющие символы
+TERMINAL_ESCAPE_RE = re.compile(r'\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\-_])')
+CONTROL_CHARS_RE = re.compile(r'[\x00-\x08\x0b-\x1f\x7f]')
+SEARCH_WORD_RE = re.compile(r'\w+')
+
+def clean_history_line(text):
+    """Текст строки вывода для поиска: без оформления, после \\r - только последняя перерисовка"""
+    text = TERMINAL_ESCAPE_RE.sub('', text).rstrip('\r')
+    if '\r' in text:
+        text = text.rsplit('\r', 1)[1]
+    return CONTROL_CHARS_RE.sub('', text)
+
+def search_words(text):
+    return set(SEARCH_WORD_RE.findall(text.lower()))
+
+def regex_required_words(pattern):
+    """Слова-литералы верхнего уровня, обязательные для совпадения с регулярным выражением"""
     try:
-        for file in os.listdir(script_folder):
-            file_path = os.path.join(script_folder, file)
-            print(f"Проверка файла: {file_path}, исполняемый: {os.path.isfile(file_path) and os.access(file_path, os.X_OK)}")
-            if os.path.isfile(file_path) and os.access(file_path, os.X_OK):
-                script_path = file_path
-                script_file = file
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return set()
+    runs, run = [], []
+    for op, arg in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(arg))
+        else:
+            runs.append(''.join(run))
+            run = []
+    runs.append(''.join(run))
+    return set().union(*(search_words(text) for text in runs))
+
+class HistorySearchIndex:
+    """Инвертированный индекс строк истории одного процесса"""
+
+    # Примерные накладные расходы на строку сверх ее текста (байт)
+    LINE_OVERHEAD = 100
+
+    def __init__(self, process_name):
+        self.process_name = process_name
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.used = time.monotonic()
+        self.clear()
+
+    def clear(self):
+        self.size = 0  # Примерный объем в памяти (байт)
+        self._lines = []  # (сегмент, номер записи, номер строки в записи, unix time, текст)
+        self._head = 0  # Сколько выброшенных строк еще лежит в начале _lines
+        self._base = 0  # Номер строки _lines[_head]
+        self._words = {}  # слово -> номера строк по возрастанию
+        self._partial = None  # Незавершенная строка: [сегмент, номер записи, номер строки в записи, unix time, [куски], длина]
+        self._last = (0, -1)  # (сегмент, номер записи) последней учтенной записи
+
+    def build(self):
+        """Проиндексировать уже записанные на диск сегменты"""
+        # Номера сегментов - как в load_history_index; файлы .idx не нужны
+        closed = list_history_segments(self.process_name)
+        segments = [(seq, get_history_segment_path(self.process_name, seq)) for seq in closed]
+        segments.append(((closed[-1] if closed else 0) + 1, get_history_file_path(self.process_name)))
+        for seq, path in segments:
+            try:
+                with open(path, 'rb') as f:
+                    for i, line in enumerate(f):
+                        if not line.endswith(b'\n'):
+                            break
+                        try:
+                            entry = json.loads(line)
+                            timestamp = datetime.fromisoformat(entry['timestamp']).timestamp()
+                        except (ValueError, KeyError, TypeError):
+                            continue
+                        self.add(seq, i, timestamp, entry.get('data', ''))
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                print(f"Ошибка индексации истории {self.process_name}: {e}")
+
+    def add(self, seq, i, timestamp, data):
+        """Учесть запись истории (повторно переданные записи пропускаются)"""
+        if (seq, i) <= self._last:
+            return
+        self._last = (seq, i)
+        parts = data.split('\n')
+        for k, part in enumerate(parts):
+            if self._partial is None:
+                if k == len(parts) - 1 and not part:
+                    break
+                # Строка всегда начинается с начала куска: (сегмент, запись, k) ее не меняют при перестроении
+                self._partial = [seq, i, k, timestamp, [], 0]
+            self._partial[4].append(part)
+            self._partial[5] += len(part)
+            if k < len(parts) - 1 or self._partial[5] >= HISTORY_SEARCH_LINE_MAX:
+                self._finish_line()
+
+    def _finish_line(self):
+        seq, i, k, timestamp, parts, _ = self._partial
+        self._partial = None
+        text = clean_history_line(''.join(parts))
+        if not text.strip():
+            return
+        line_id = self._base + len(self._lines) - self._head
+        self._lines.append((seq, i, k, timestamp, text))
+        self.size += len(text) + self.LINE_OVERHEAD
+        for word in search_words(text):
+            self._words.setdefault(word, []).append(line_id)
+
+    def drop_segments(self, seq):
+        """Выбросить строки, начавшиеся в сегментах с номером не больше seq"""
+        dropped = set()
+        while self._head < len(self._lines) and self._lines[self._head][0] <= seq:
+            dropped |= search_words(self._lines[self._head][4])
+            self.size -= len(self._lines[self._head][4]) + self.LINE_OVERHEAD
+            self._head += 1
+            self._base += 1
+        for word in dropped:
+            line_ids = self._words[word]
+            del line_ids[:bisect.bisect_left(line_ids, self._base)]
+            if not line_ids:
+                del self._words[word]
+        if self._head > len(self._lines) // 2:
+            del self._lines[:self._head]
+            self._head = 0
+
+    def candidates(self, words, start=None, end=None):
+        """Строки в интервале [start, end) со всеми словами: (сегмент, запись, строка в записи, время, текст)"""
+        with self.lock:
+            vocabulary = list(self._words) if words else []
+        matched = {word: [indexed for indexed in vocabulary if word in indexed] for word in words}
+        
+        with self.lock:
+            line_ids = None
+            for word in sorted(words, key=len, reverse=True):
+                found = set()
+                for indexed in matched[word]:
+                    found.update(self._words.get(indexed, ()))
+                line_ids = found if line_ids is None else line_ids & found
+                if not line_ids:
+                    break
+            next_id = self._base + len(self._lines) - self._head
+            if line_ids is None:
+                line_ids = range(self._base, next_id)
+            else:
+                # Строки могли быть выброшены ротацией после копирования словаря
+                line_ids = sorted(line_id for line_id in line_ids if line_id >= self._base)
+            partial = None
+            if self._partial is not None:
+                seq, i, k, timestamp, parts, _ = self._partial
+                partial = (seq, i, k, timestamp, ''.join(parts))
+            lines = [self._lines[line_id - self._base + self._head] for line_id in reversed(line_ids)]
+        
+        if partial is not None:
+            partial = partial[:4] + (clean_history_line(partial[4]),)
+            if partial[4].strip():
+                lines.insert(0, partial)
+        result = []
+        for line in lines:
+            if end is not None and line[3] >= end:
+                continue
+            if start is not None and line[3] < start:
                 break
+            result.append(line)
+        return result
+
+class HistorySearchIndexer:
+    """Поток, который лениво строит и пополняет индексы поиска и вытесняет лишние"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queue = deque()  # (имя процесса, индекс для построения или список изменений, байт)
+        self._queue_bytes = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='history-indexer', daemon=True)
+        self._thread.start()
+
+    def put(self, process_name, events):
+        """Изменения из пачки записи истории: ('add', сегмент, номер, время, данные) и ('drop', сегмент)"""
+        # Без блокировки: процессы без индекса пропускаем, индекс потом прочитает все с диска
+        if not events or process_name not in history_indexes:
+            return
+        size = sum(len(event[4]) for event in events if event[0] == 'add')
+        with self._cond:
+            if self._queue_bytes + size > HISTORY_QUEUE_BYTES:
+                # Индексирование не успевает: сбрасываем индексы, при поиске они построятся заново
+                print("Индексирование истории не успевает за записью, индексы поиска сброшены")
+                self._queue = deque(item for item in self._queue if isinstance(item[1], HistorySearchIndex))
+                self._queue_bytes = 0
+                with history_indexes_lock:
+                    history_indexes.clear()
+                return
+            self._queue.append((process_name, events, size))
+            self._queue_bytes += size
+            self._cond.notify()
+
+    def get_index(self, process_name):
+        """Индекс для поиска; при первом обращении ждет его построения"""
+        with history_indexes_lock:
+            index = history_indexes.get(process_name)
+            created = index is None
+            if created:
+                index = history_indexes[process_name] = HistorySearchIndex(process_name)
+        index.used = time.monotonic()
+        if created:
+            with self._cond:
+                self._queue.append((process_name, index, 0))
+                self._cond.notify()
+        if not index.ready.wait(HISTORY_SEARCH_BUILD_TIMEOUT):
+            print(f"Индекс поиска {process_name} не построен за {HISTORY_SEARCH_BUILD_TIMEOUT} с")
+        return index
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                process_name, item, size = self._queue.popleft()
+                self._queue_bytes -= size
+            try:
+                if isinstance(item, HistorySearchIndex):
+                    self._build(item)
+                else:
+                    index = history_indexes.get(process_name)
+                    if index is not None:
+                        with index.lock:
+                            for event in item:
+                                if event[0] == 'drop':
+                                    index.drop_segments(event[1])
+                                else:
+                                    index.add(*event[1:])
+            except Exception as e:
+                print(f"Ошибка индексации истории {process_name}: {e}")
+            self._evict()
+
+    def _build(self, index):
+        started = time.monotonic()
+        try:
+            # Ротация во время чтения сдвигает номера сегментов - тогда читаем заново
+            for attempt in range(3):
+                segments = list_history_segments(index.process_name)
+                with index.lock:
+                    index.clear()
+                    index.build()
+                if list_history_segments(index.process_name) == segments:
+                    break
+        finally:
+            index.ready.set()
+        print(f"Индекс поиска {index.process_name} построен за {time.monotonic() - started:.2f} с")
+
+    def _evict(self):
+        with history_indexes_lock:
+            total = sum(index.size for index in history_indexes.values())
+            if total <= HISTORY_SEARCH_INDEX_MEMORY:
+                return
+            for index in sorted(history_indexes.values(), key=lambda index: index.used):
+                if total <= HISTORY_SEARCH_INDEX_MEMORY:
+                    break
+                if index.ready.is_set():
+                    del history_indexes[index.process_name]
+                    total -= index.size
+
+history_indexer = HistorySearchIndexer()
+
+def parse_search_cursor(value):
+    """Курсор страницы поиска 'время:сегмент:запись:строка:процесс' -> ключ сортировки"""
+    if not value:
+        return None
+    timestamp, seq, i, k, process_name = str(value).split(':', 4)
+    return float(timestamp), process_name, int(seq), int(i), int(k)
+
+def format_search_cursor(key):
+    timestamp, process_name, seq, i, k = key
+    return f"{timestamp!r}:{seq}:{i}:{k}:{process_name}"
+
+def search_history(query, regex=False, case=False, process=None, start=None, end=None,
+                   limit=HISTORY_SEARCH_PAGE_SIZE, cursor=None):
+    """Итератор найденных строк от новых к старым, последним - {'done': True, 'next': курсор}"""
+    if not query:
+        raise ValueError('пустой запрос')
+    flags = 0 if case else re.IGNORECASE
+    try:
+        pattern = re.compile(query if regex else re.escape(query), flags)
+    except re.error as e:
+        raise ValueError(f'неверное регулярное выражение: {e}')
+    words = regex_required_words(query) if regex else search_words(query)
+    limit = max(1, min(int(limit or HISTORY_SEARCH_PAGE_SIZE), HISTORY_SEARCH_PAGE_MAX))
+    start, end = parse_history_time(start), parse_history_time(end)
+    after_key = parse_search_cursor(cursor)
+    with history_indexes_lock:
+        available = set(history_indexes) | known_histories
+    if isinstance(process, str):
+        process = [process]
+    process_names = available if not process else available & set(process)
+    
+    def process_matches(process_name):
+        candidates = history_indexer.get_index(process_name).candidates(words, start, end)
+        for seq, i, k, timestamp, text in candidates:
+            # Ключ не зависит от индекса: после вытеснения и перестроения страницы продолжаются с того же места
+            key = (timestamp, process_name, seq, i, k)
+            if after_key is not None and key >= after_key:
+                continue
+            spans = [match.span() for match in pattern.finditer(text) if match.end() > match.start()]
+            if not spans and not pattern.search(text):
+                continue
+            yield key, {
+                'process': process_name,
+                'cursor': f"{seq}:{i}",
+                'timestamp': datetime.fromtimestamp(timestamp).isoformat(),
+                'line': text,
+                'matches': spans,
+            }
+    
+    def results():
+        found = 0
+        last_key = None
+        merged = heapq.merge(*(process_matches(name) for name in sorted(process_names)), key=lambda item: item[0], reverse=True)
+        for key, result in merged:
+            if found == limit:
+                yield {'done': True, 'next': format_search_cursor(last_key)}
+                return
+            found += 1
+            last_key = key
+            yield result
+        yield {'done': True, 'next': None}
+    
+    return results()
+
+def load_history():
+    """Запоминаем, для каких процессов есть история; сами записи читаются лениво"""
+    try:
+        if not os.path.exists(HISTORY_DIR):
+            os.makedirs(HISTORY_DIR)
+            return
+            
+        for filename in os.listdir(HISTORY_DIR):
+            if filename.endswith('.log'):
+                known_histories.add(filename[:-4])
+                        
+        print(f"Найдено файлов истории: {len(known_histories)} в папке {HISTORY_DIR}")
+    except Exception as e:
+        print(f"Ошибка загрузки истории: {e}")
+
+def append_to_history_file(process_name, data):
+    """Добавляем запись в историю в формате JSON Lines"""
+    try:
+        now = datetime.now()
+        entry = {
+            'timestamp': now.isoformat(),
+            'data': data
+        }
+        history_writer.put(process_name, json.dumps(entry, ensure_ascii=False) + '\n', now.timestamp(), data)
     except Exception as e:
-        return False, f'Ошибка чтения папки {script_folder}: {str(e)}'
+        print(f"Ошибка записи в историю для {process_name}: {e}")
+
+def save_current_history():
+    print("История уже сохраняется построчно")
+    pass
+
+cleanup_done = False
+
+def cleanup():
+    global cleanup_done
+    if cleanup_done or SERVER_ROLE == 'worker':
+        return
+    cleanup_done = True
+    print("Завершение работы приложения...")
+    supervisor.shutdown()
+    
+    # Останавливаем все процессы параллельно: SIGTERM всем группам сразу, общий таймаут, затем SIGKILL
+    running = {}
+    for process_name, entry in list(processes.items()):
+        process = entry.get('process')
+        if process and process.poll() is None:
+            try:
+                signal_process_group(process, signal.SIGTERM)
+                running[process_name] = process
+            except Exception as e:
+                print(f"Ошибка остановки процесса {process_name}: {e}")
+    
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+    while running and time.monotonic() < deadline:
+        for process_name, process in list(running.items()):
+            if process.poll() is not None:
+                print(f"Процесс {process_name} остановлен")
+                del running[process_name]
+        time.sleep(0.05)
+    
+    for process_name, process in running.items():
+        try:
+            signal_process_group(process, signal.SIGKILL)
+            process.wait(timeout=1)
+            print(f"Процесс {process_name} принудительно остановлен")
+        except Exception as e:
+            print(f"Ошибка остановки процесса {process_name}: {e}")
+    
+    shutdown_event.set()
+    io_loop.stop()
+    remove_script_cgroups()
+    
+    # Дописываем всю накопленную историю до выхода
+    history_writer.stop()
+    for process_name in list(history_logs.keys()):
+        _close_history_log_now(process_name)
+    
+    try:
+        observer.stop()
+        observer.join()
+    except:
+        pass
+    
+    if message_bus_broker:
+        message_bus_broker.stop()
+    
+    print("Приложение завершено")
+
+atexit.register(cleanup)
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+signal.signal(signal.SIGINT, lambda signum, frame: sys.exit(0))
+
+# Организуем скрипты при запуске (worker не владеет ни скриптами, ни историей)
+if SERVER_ROLE != 'worker':
+    organize_scripts()
+    script_registry.rebuild()
+    load_history()
+    history_writer.start()
+    history_indexer.start()
+    metrics_sampler.start()
+
+def get_script_folder_for_path(path):
+    """Имя папки скрипта (первый уровень внутри SCRIPTS_DIR) для пути из события"""
+    rel_path = os.path.relpath(path, SCRIPTS_DIR)
+    if rel_path.startswith('..') or rel_path == '.':
+        return None
+    return rel_path.split(os.sep)[0]
+
+class ScriptsFolderHandler(FileSystemEventHandler):
+    """Обработчик событий папки scripts: изменения копятся и применяются, когда события затихнут"""
+
+    def __init__(self, socketio):
+        self.socketio = socketio
+        self._condition = threading.Condition()
+        self._root_items = set()
+        self._folders = set()
+        self._first_event = None
+        self._last_event = None
+        self._thread = threading.Thread(target=self._run, name='scripts-debounce', daemon=True)
+        self._thread.start()
     
-    if not script_path:
+    def on_any_event(self, event):
+        if event.src_path.endswith(('.tmp', '.swp', '~')):
+            return
+        # Чтение файлов (запуск скрипта, его собственные файлы в рабочей папке) ничего
+        # не меняет, а modified у папки дублирует событие о самом файле
+        if event.event_type in ('opened', 'closed_no_write') or (event.is_directory and event.event_type == 'modified'):
+            return
+        
+        with self._condition:
+            changed = False
+            for path in (event.src_path, getattr(event, 'dest_path', None)):
+                if not path:
+                    continue
+                rel_path = os.path.relpath(path, SCRIPTS_DIR)
+                folder = get_script_folder_for_path(path)
+                if not folder:
+                    continue
+                if os.sep not in rel_path:
+                    # Объект в корне scripts: файл для организации или сама папка скрипта
+                    self._root_items.add(folder)
+                elif not self._affects_registry(rel_path, folder, event):
+                    continue
+                self._folders.add(folder)
+                changed = True
+            if not changed:
+                return
+            
+            now = time.monotonic()
+            if self._first_event is None:
+                self._first_event = now
+            self._last_event = now
+            self._condition.notify()
+    
+    def _affects_registry(self, rel_path, folder, event):
+        """Может ли изменение внутри папки скрипта поменять реестр (логи и данные скрипта - нет)"""
+        parts = rel_path.split(os.sep)
+        if len(parts) > 2 or event.is_directory:
+            # Реестр смотрит только на файлы верхнего уровня папки скрипта
+            return False
+        name = parts[1]
+        if name == SUPERVISOR_POLICY_FILE or name == script_registry.get(folder):
+            return True
+        # Новый исполняемый файл может стать скриптом папки
+        path = os.path.join(SCRIPTS_DIR, rel_path)
+        return event.event_type != 'deleted' and os.path.isfile(path) and os.access(path, os.X_OK)
+
+    def _run(self):
+        while not shutdown_event.is_set():
+            with self._condition:
+                while self._first_event is None:
+                    self._condition.wait()
+                now = time.monotonic()
+                deadline = min(self._last_event + SCRIPTS_DEBOUNCE_DELAY, self._first_event + SCRIPTS_DEBOUNCE_MAX_DELAY)
+                if now < deadline:
+                    self._condition.wait(deadline - now)
+                    continue
+                root_items, self._root_items = self._root_items, set()
+                folders, self._folders = self._folders, set()
+                self._first_event = self._last_event = None
+            
+            try:
+                self._apply(root_items, folders)
+            except Exception as e:
+                print(f"Ошибка обработки изменений в папке scripts: {e}")
+    
+    def _apply(self, root_items, folders):
+        # Организуем только новые файлы из корня scripts
+        for item in root_items:
+            try:
+                folder_name = organize_script_file(item)
+            except Exception as e:
+                print(f"Ошибка организации скрипта {item}: {e}")
+                continue
+            if folder_name:
+                folders.add(folder_name)
+        
+        changes = script_registry.refresh_folders(folders)
+        if not any(changes.values()):
+            return
+        remove_script_cgroups(changes['removed'])
+        
+        try:
+            self.socketio.emit('scripts_updated', dict(changes, message='Список скриптов обновлен'))
+        except:
+            pass
+
+observer = Observer()
+event_handler = ScriptsFolderHandler(socketio)
+if SERVER_ROLE != 'worker':
+    observer.schedule(event_handler, SCRIPTS_DIR, recursive=True)
+    observer.start()
+
+class OwnerClient:
+    """HTTP-клиент worker к процессу-владельцу (keep-alive соединение на поток)"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        for attempt in range(2):
+            conn = getattr(self._local, 'conn', None)
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                return response.status, response.getheaders(), response.read()
+            except (OSError, http.client.HTTPException):
+                # Сервер закрыл keep-alive соединение - переподключаемся один раз
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+owner_client = OwnerClient(OWNER_URL)
+
+PROXY_RESPONSE_HEADERS = ('Content-Type', 'ETag', 'Cache-Control')
+
+@app.before_request
+def proxy_api_to_owner():
+    """worker не хранит состояния: все API-запросы обслуживает процесс-владелец"""
+    if SERVER_ROLE != 'worker' or not request.path.startswith('/api/'):
+        return None
+    headers = {key: value for key, value in request.headers.items() if key in ('Content-Type', 'If-None-Match', 'Accept')}
+    try:
+        status, response_headers, body = owner_client.request(request.method, request.full_path.rstrip('?'), request.get_data() or None, headers)
+    except (OSError, http.client.HTTPException) as e:
+        return jsonify({'success': False, 'message': f'Владелец процессов недоступен: {e}'}), 502
+    response = Response(body, status=status)
+    for key, value in response_headers:
+        if key in PROXY_RESPONSE_HEADERS:
+            response.headers[key] = value
+    return response
+
+@app.route('/api/internal/socket_event', methods=['POST'])
+def internal_socket_event():
+    """Событие клиента, пересланное worker: выполняется здесь от имени его sid"""
+    if SERVER_ROLE != 'owner':
+        return jsonify({'success': False, 'message': 'Доступно только в режиме owner'}), 404
+    message = request.get_json(silent=True) or {}
+    event = message.get('event')
+    handler = SOCKET_EVENT_HANDLERS.get(event)
+    if handler is None or not message.get('sid'):
+        return jsonify({'success': False, 'message': f'Неизвестное событие {event}'}), 400
+    call_socket_handler(handler, event, message['sid'], message.get('data'))
+    return jsonify({'success': True})
+
+def call_socket_handler(handler, event, sid, data):
+    """Выполнить обработчик события Socket.IO от имени клиента sid в текущем контексте запроса"""
+    request.sid = sid
+    request.namespace = '/'
+    if event == 'disconnect':
+        return handler()
+    return handler(data)
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+@app.route('/api/processes', methods=['GET'])
+def get_processes():
+    version, scripts = script_registry.snapshot()
+    etag = f'"{script_registry.epoch}-{version}-{metrics_sampler.generation}"'
+    # no-cache: браузер всегда переспрашивает сервер, но с If-None-Match
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag in request.headers.get('If-None-Match', ''):
+        return '', 304, headers
+    
+    process_list = [make_process_info(folder, script_file) for folder, script_file in scripts.items()]
+    for info in process_list:
+        info['metrics'] = metrics_sampler.get(info['name'])
+    
+    response = jsonify(process_list)
+    response.headers.update(headers)
+    return response
+
+def format_prometheus_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Метрики процессов и сервера в текстовом формате Prometheus"""
+    lines = []
+    
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{format_prometheus_label(val)}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    
+    process_metrics = metrics_sampler.snapshot()
+    for key, kind, help_text in (
+        ('cpu_percent', 'gauge', 'CPU usage of the process tree, percent of one core'),
+        ('rss_bytes', 'gauge', 'Resident memory of the process tree'),
+        ('read_bytes', 'counter', 'Bytes read from storage by the process tree'),
+        ('write_bytes', 'counter', 'Bytes written to storage by the process tree'),
+        ('open_fds', 'gauge', 'Open file descriptors of the process tree'),
+        ('processes', 'gauge', 'Number of processes in the tree'),
+        ('output_bytes', 'counter', 'Terminal output bytes read from the PTY'),
+        ('output_bytes_per_sec', 'gauge', 'Terminal output rate'),
+    ):
+        metric(f'wtm_process_{key}', kind, help_text,
+               [({'process': name}, values[key]) for name, values in sorted(process_metrics.items())])
+    
+    try:
+        server_usage = read_proc_usage(os.getpid())
+    except OSError:
+        server_usage = None
+    if server_usage:
+        metric('wtm_server_cpu_seconds_total', 'counter', 'CPU time used by the manager process',
+               [({}, round(server_usage['cpu_ticks'] / CLOCK_TICKS, 2))])
+        metric('wtm_server_rss_bytes', 'gauge', 'Resident memory of the manager process', [({}, server_usage['rss_bytes'])])
+        metric('wtm_server_threads', 'gauge', 'Threads in the manager process', [({}, threading.active_count())])
+    
+    running = sum(1 for name in list(processes) if is_process_running(name))
+    metric('wtm_processes_running', 'gauge', 'Running managed processes', [({}, running)])
+    metric('wtm_clients_connected', 'gauge', 'Connected Socket.IO clients', [({}, len(client_transports))])
+    
+    batcher_stats = dict(output_batcher.stats)
+    metric('wtm_output_chunks_total', 'counter', 'PTY output chunks passed to the batcher', [({}, batcher_stats['chunks'])])
+    metric('wtm_output_frames_total', 'counter', 'Output frames emitted to clients', [({}, batcher_stats['frames'])])
+    metric('wtm_output_frame_bytes_total', 'counter', 'Bytes emitted in output frames', [({}, batcher_stats['bytes'])])
+    
+    writer_stats = history_writer.get_stats()
+    metric('wtm_history_queue_depth', 'gauge', 'Entries waiting in the history writer queue', [({}, writer_stats['queue_depth'])])
+    metric('wtm_history_queue_bytes', 'gauge', 'Bytes waiting in the history writer queue', [({}, writer_stats['queue_bytes'])])
+    metric('wtm_history_queue_max_depth', 'gauge', 'Maximum observed history queue depth', [({}, writer_stats['max_queue_depth'])])
+    metric('wtm_history_queue_max_bytes', 'gauge', 'Maximum observed history queue size in bytes', [({}, writer_stats['max_queue_bytes'])])
+    metric('wtm_history_dropped_total', 'counter', 'History entries dropped on a full queue', [({}, writer_stats['dropped'])])
+    metric('wtm_history_dropped_bytes_total', 'counter', 'Bytes of history dropped on a full queue', [({}, writer_stats['dropped_bytes'])])
+    metric('wtm_history_entries_written_total', 'counter', 'History entries written to disk', [({}, writer_stats['written'])])
+    metric('wtm_history_batches_total', 'counter', 'History flush batches', [({}, writer_stats['batches'])])
+    metric('wtm_history_errors_total', 'counter', 'History write errors', [({}, writer_stats['errors'])])
+    metric('wtm_history_flush_seconds_total', 'counter', 'Total time spent flushing history', [({}, round(writer_stats['total_flush_ms'] / 1000, 6))])
+    metric('wtm_history_flush_last_seconds', 'gauge', 'Duration of the last history flush', [({}, writer_stats['last_flush_ms'] / 1000)])
+    metric('wtm_history_flush_max_seconds', 'gauge', 'Longest history flush', [({}, writer_stats['max_flush_ms'] / 1000)])
+    
+    return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/api/process/<process_name>/status', methods=['GET'])
+def get_process_status(process_name):
+    if process_name in processes and processes[process_name].get('process'):
+        if processes[process_name]['process'].poll() is None:
+            status = 'running'
+        else:
+            status = 'stopped'
+            cleanup_process(process_name)
+    else:
+        status = 'stopped'
+    
+    return jsonify({'status': status, 'process': process_name})
+
+@app.route('/api/process/<process_name>/history', methods=['GET'])
+def get_process_history_page(process_name):
+    """Страница истории: ?limit=&before=&after=&start=&end=&last_bytes="""
+    try:
+        result = query_history(process_name, **{
+            key: request.args.get(key) for key in ('limit', 'before', 'after', 'start', 'end', 'last_bytes')
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Неверные параметры запроса: {e}'}), 400
+    return jsonify(result)
+
+@app.route('/api/history/search', methods=['GET'])
+def search_history_api():
+    """Поиск по истории (JSON Lines): ?q=&regex=&case=&process=&start=&end=&limit=&cursor="""
+    try:
+        results = search_history(
+            request.args.get('q', ''),
+            regex=request.args.get('regex') in ('1', 'true'),
+            case=request.args.get('case') in ('1', 'true'),
+            process=request.args.getlist('process') or None,
+            **{key: request.args.get(key) for key in ('start', 'end', 'limit', 'cursor')}
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Неверные параметры запроса: {e}'}), 400
+    return Response((json.dumps(result, ensure_ascii=False) + '\n' for result in results),
+                    mimetype='application/x-ndjson')
+
+@app.route('/api/process/<process_name>/input', methods=['POST'])
+def upload_process_input(process_name):
+    """Передать тело запроса на ввод процессу кусками, по мере чтения процессом (curl --data-binary @file)"""
+    process_input = get_process_input(process_name)
+    if process_input is None:
+        return jsonify({'success': False, 'message': f'Процесс {process_name} не запущен'}), 409
+    total = 0
+    while True:
+        chunk = request.stream.read(INPUT_UPLOAD_CHUNK)
+        if not chunk:
+            break
+        if not process_input.wait_for_room(INPUT_UPLOAD_HIGH_WATER, INPUT_UPLOAD_TIMEOUT):
+            return jsonify({'success': False, 'message': f'Процесс не читает ввод {INPUT_UPLOAD_TIMEOUT} с', 'bytes': total}), 504
+        error = process_input.put(chunk)
+        if error:
+            return jsonify({'success': False, 'message': f'Ошибка отправки: {error}', 'bytes': total}), 409
+        total += len(chunk)
+    return jsonify({'success': True, 'message': f'Передано {total} байт', 'bytes': total})
+
+@app.route('/api/process/<process_name>/start', methods=['POST'])
+def start_process_api(process_name):
+    supervisor.reset(process_name)
+    success, message = start_process(process_name)
+    return jsonify({'success': success, 'message': message})
+
+@app.route('/api/process/<process_name>/stop', methods=['POST'])
+def stop_process_api(process_name):
+    if supervisor.reset(process_name) and not is_process_running(process_name):
+        return jsonify({'success': True, 'message': f'Автоперезапуск {process_name} отменен'})
+    success, message = stop_process(process_name)
+    return jsonify({'success': success, 'message': message})
+
+@app.route('/api/process/<process_name>/restart', methods=['POST'])
+def restart_process_api(process_name):
+    """Перезапуск: остановка в фоне, запуск - после завершения процесса"""
+    supervisor.reset(process_name)
+    if not is_process_running(process_name):
+        success, message = start_process(process_name)
+    else:
+        success, message = stop_process(process_name, restart=True)
+    return jsonify({'success': success, 'message': message})
+
+@socketio.on('connect')
+def handle_connect(auth=None):
+    """Согласование транспорта: бинарные кадры вывода и сжатие истории"""
+    auth = auth if isinstance(auth, dict) else {}
+    client_transports[request.sid] = {
+        'binary': bool(auth.get('binary')),
+        'compress': bool(auth.get('compress')),
+    }
+
+def start_process(process_name):
+    global processes, process_outputs
+    
+    # Путь к папке скрипта
+    script_folder = os.path.join(SCRIPTS_DIR, process_name)
+    
+    print(f"Попытка запуска процесса: {process_name}")
+    print(f"Путь к папке скрипта: {script_folder}")
+    
+    # Проверяем существование папки
+    if not os.path.exists(script_folder):
+        return False, f'Папка скрипта {script_folder} не существует'
+    
+    if not os.path.isdir(script_folder):
+        return False, f'Путь {script_folder} не является папкой'
+    
+    # Берем исполняемый файл из реестра, при промахе пересканируем папку
+    script_file = script_registry.get(process_name)
+    if not script_file:
+        try:
+            script_file = script_registry.refresh_folder(process_name)
+        except Exception as e:
+            return False, f'Ошибка чтения папки {script_folder}: {str(e)}'
+    
+    if not script_file:
         return False, f'Исполняемый файл не найден в папке {script_folder}'
     
+    script_path = os.path.join(script_folder, script_file)
+    
     print(f"Найден скрипт: {script_path}")
     
     # Проверяем существование файла
@@ -320,9 +2480,18 @@ def start_process(process_name):
     
     try:
         master, slave = pty.openpty()
+        # Ввод пишется без блокировок (ProcessInput), поэтому сразу, а не при регистрации в цикле
+        os.set_blocking(master, False)
         
-        if process_name not in process_outputs:
-            process_outputs[process_name] = ""
+        # Размер терминала задаем до запуска, чтобы скрипт сразу видел правильный размер
+        winsize = get_terminal_size(process_name)
+        set_pty_size(slave, *winsize)
+        
+        # Экран (если процесс уже смотрят) подстраиваем под новый размер; новый экран
+        # создается только при подписке зрителя
+        screen = get_output_buffer(process_name).screen
+        if screen is not None and screen.size != winsize:
+            screen.resize(*winsize)
         
         print(f"Запуск скрипта с рабочей директорией: {script_folder}")
         
@@ -339,226 +2508,1405 @@ def start_process(process_name):
         
         print(f"Команда запуска: {cmd}")
         
-        processes[process_name] = {
-            'process': subprocess.Popen(
+        # Политика - из кэша реестра, файл перечитывается только по событиям watchdog
+        limits = supervisor.policy(process_name)['limits']
+        cgroup_procs, rlimits = prepare_resource_limits(process_name, limits)
+        gate = None
+        if cgroup_procs or rlimits:
+            # Скрипт ждет на канале, пока родитель не применит ограничения к его pid
+            gate = os.pipe()
+            cmd = ['/bin/bash', '-c', LIMITS_GATE_SCRIPT.format(fd=gate[0]), 'bash'] + cmd
+        
+        try:
+            process = subprocess.Popen(
                 cmd,  # Используем правильную команду с относительными путями
                 stdin=slave,
                 stdout=slave,
                 stderr=slave,
                 universal_newlines=True,
                 bufsize=0,
-                cwd=script_folder  # Устанавливаем рабочую директорию на папку скрипта
-            ),
+                cwd=script_folder,  # Устанавливаем рабочую директорию на папку скрипта
+                start_new_session=True,  # Своя сессия и группа: останавливаем скрипт вместе с потомками
+                pass_fds=(gate[0],) if gate else (),
+                preexec_fn=set_controlling_terminal
+            )
+            if gate:
+                apply_resource_limits(process_name, process.pid, cgroup_procs, rlimits)
+                os.write(gate[1], b'\n')
+        finally:
+            if gate:
+                os.close(gate[0])
+                os.close(gate[1])
+        
+        processes[process_name] = {
+            'process': process,
             'master': master,
+            'input': ProcessInput(process_name, master),
             'status': 'running',
-            'thread_running': True
+            'winsize': winsize,
+            'limits': 'cgroup' if cgroup_procs else ('rlimit' if rlimits else None)
         }
         
         os.close(slave)
         
-        status_thread = threading.Thread(target=check_process_status_background, args=(process_name,), daemon=True)
-        status_thread.start()
+        output_decoders.pop(process_name, None)
+        io_loop.register(process_name, processes[process_name]['process'], master, processes[process_name]['input'])
+        script_registry.set_status(process_name, 'running')
+        supervisor.on_start(process_name)
+        
+        try:
+            socketio.emit('process_status_update', {'process': process_name, 'status': 'running'})
+        except:
+            pass
+        
+        return True, f'Процесс {process_name} запущен (PID: {processes[process_name]["process"].pid})'
+    except Exception as e:
+        error_msg = f'Ошибка запуска: {str(e)}'
+        print(f"Ошибка запуска процесса {process_name}: {error_msg}")
+        return False, error_msg
+
+def set_controlling_terminal():
+    """Выполняется в дочернем процессе после setsid: делаем PTY управляющим терминалом (и больше ничего)"""
+    try:
+        fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+    except OSError:
+        pass
+
+# Обертка запуска при ограничениях: дождаться строки из канала, закрыть его и заменить себя скриптом
+LIMITS_GATE_SCRIPT = 'read -r _ <&{fd}; exec {fd}<&-; exec "$@"'
+
+def apply_resource_limits(process_name, pid, cgroup_procs, rlimits):
+    """Перевести запущенный процесс в cgroup скрипта и задать ему rlimit (из родителя)"""
+    if cgroup_procs:
+        try:
+            with open(cgroup_procs, 'w') as f:
+                f.write(str(pid))
+        except OSError as e:
+            print(f"Ошибка перевода {process_name} в cgroup: {e}")
+    for limit, value in rlimits:
+        try:
+            resource.prlimit(pid, limit, (value, value))
+        except (ValueError, OSError) as e:
+            print(f"Ошибка установки rlimit для {process_name}: {e}")
+
+cgroup_lock = threading.Lock()
+cgroup_checked = False
+cgroup_base = None
+cgroup_controllers = []
+
+def init_cgroups():
+    """Подготовить поддерево cgroup v2 для скриптов; None, если оно недоступно"""
+    global cgroup_checked, cgroup_base, cgroup_controllers
+    with cgroup_lock:
+        if cgroup_checked:
+            return cgroup_base
+        cgroup_checked = True
+        if not CGROUP_ENABLED:
+            return None
+        try:
+            with open('/proc/self/cgroup') as f:
+                paths = [line[3:] for line in f.read().splitlines() if line.startswith('0::')]
+            if not paths:
+                raise OSError('иерархия cgroup v2 не смонтирована')
+            base = os.path.join(CGROUP_ROOT, paths[0].lstrip('/'))
+            with open(os.path.join(base, 'cgroup.controllers')) as f:
+                available = f.read().split()
+            controllers = [c for c in ('cpu', 'memory', 'pids') if c in available]
+            if not controllers:
+                raise OSError('нет контроллеров cpu/memory/pids')
+            # В cgroup v2 процессы могут жить только в листьях: само приложение переезжает в подгруппу manager
+            manager = os.path.join(base, 'manager')
+            os.makedirs(manager, exist_ok=True)
+            with open(os.path.join(manager, 'cgroup.procs'), 'w') as f:
+                f.write(str(os.getpid()))
+            with open(os.path.join(base, 'cgroup.subtree_control'), 'w') as f:
+                f.write(' '.join('+' + c for c in controllers))
+        except OSError as e:
+            print(f"cgroup v2 недоступен ({e}), ограничения задаются через rlimit")
+            return None
+        cgroup_base = base
+        cgroup_controllers = controllers
+        print(f"Ограничения ресурсов через cgroup v2: {base} ({', '.join(controllers)})")
+        return cgroup_base
+
+def remove_script_cgroups(process_names=None):
+    """Удалить пустые cgroup скриптов (все, если process_names не задан); занятые остаются"""
+    if not cgroup_base:
+        return
+    if process_names is None:
+        try:
+            names = [name for name in os.listdir(cgroup_base) if name.startswith('script.')]
+        except OSError:
+            return
+    else:
+        names = ['script.' + process_name for process_name in process_names]
+    for name in names:
+        try:
+            os.rmdir(os.path.join(cgroup_base, name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"cgroup {name} не удален: {e}")
+
+def prepare_resource_limits(process_name, limits):
+    """Подготовить ограничения скрипта: путь cgroup.procs (или None) и список rlimit"""
+    if not limits:
+        return None, []
+    
+    def number(key):
+        try:
+            value = limits.get(key)
+            return float(value) if value else None
+        except (TypeError, ValueError):
+            print(f"Некорректное ограничение {key} для {process_name}: {limits.get(key)}")
+            return None
+    
+    memory_mb = number('memory_mb')
+    cpu_percent = number('cpu_percent')
+    pids = number('pids')
+    
+    cgroup_procs = None
+    applied = set()
+    base = init_cgroups() if (memory_mb or cpu_percent or pids) else None
+    if base:
+        path = os.path.join(base, 'script.' + process_name)
+        values = {}
+        if 'memory' in cgroup_controllers:
+            values['memory.max'] = str(int(memory_mb * 1024 * 1024)) if memory_mb else 'max'
+            applied.add('memory_mb')
+        if 'cpu' in cgroup_controllers:
+            values['cpu.max'] = f'{int(cpu_percent * 1000)} 100000' if cpu_percent else 'max 100000'
+            applied.add('cpu_percent')
+        if 'pids' in cgroup_controllers:
+            values['pids.max'] = str(int(pids)) if pids else 'max'
+            applied.add('pids')
+        try:
+            os.makedirs(path, exist_ok=True)
+            for key, value in values.items():
+                with open(os.path.join(path, key), 'w') as f:
+                    f.write(value)
+            cgroup_procs = os.path.join(path, 'cgroup.procs')
+        except OSError as e:
+            print(f"Ошибка настройки cgroup для {process_name}: {e}")
+            applied.clear()
+    
+    rlimits = []
+    if memory_mb and 'memory_mb' not in applied:
+        rlimits.append((resource.RLIMIT_AS, int(memory_mb * 1024 * 1024)))
+    cpu_seconds = number('cpu_seconds')
+    if cpu_seconds:
+        rlimits.append((resource.RLIMIT_CPU, int(cpu_seconds)))
+    nofile = number('nofile')
+    if nofile:
+        rlimits.append((resource.RLIMIT_NOFILE, int(nofile)))
+    # RLIMIT_NPROC pids не заменяет: он считает все процессы и потоки пользователя
+    # (включая потоки самого приложения) и не действует для root
+    for key, value in (('cpu_percent', cpu_percent), ('pids', pids)):
+        if value and key not in applied:
+            print(f"Ограничение {key} для {process_name} требует cgroup v2 и не применено")
+    return cgroup_procs, rlimits
+
+def signal_process_group(process, sig):
+    """Отправить сигнал всей группе процесса; False, если в группе никого не осталось"""
+    try:
+        os.killpg(process.pid, sig)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Группа могла смениться (setpgid в скрипте) - сигналим хотя бы самому процессу
+        if process.poll() is None:
+            process.send_signal(sig)
+            return True
+        return False
+
+def stop_process(process_name, restart=False):
+    """Остановить процесс вместе с его группой, не дожидаясь завершения (restart=True - запустить снова)"""
+    global processes, process_outputs
+    
+    if process_name not in processes or not processes[process_name].get('process'):
+        return False, f'Процесс {process_name} не запущен'
+    
+    entry = processes[process_name]
+    if entry['process'].poll() is not None:
+        cleanup_process(process_name)
+        return False, f'Процесс {process_name} уже завершен'
+    
+    if restart:
+        entry['restart'] = True
+    if entry.get('stopping'):
+        return True, f'Процесс {process_name} уже останавливается'
+    entry['stopping'] = True
+    
+    escalate_stop(process_name, entry['process'], 0)
+    return True, f'Процесс {process_name} останавливается'
+
+def escalate_stop(process_name, process, step):
+    """Очередной шаг остановки: сигнал группе и таймер на следующий шаг"""
+    if step >= len(STOP_ESCALATION):
+        return
+    sig, wait = STOP_ESCALATION[step]
+    # Лидер группы может уже завершиться, а потомки - еще нет
+    if not signal_process_group(process, sig):
+        return
+    print(f"Процессу {process_name} отправлен сигнал {signal.Signals(sig).name}")
+    io_loop.call_later(wait, lambda: escalate_stop(process_name, process, step + 1))
+
+def is_process_running(process_name):
+    entry = processes.get(process_name)
+    return bool(entry and entry.get('process') and entry['process'].poll() is None)
+
+def cleanup_process(process_name):
+    global processes
+    
+    if process_name in processes:
+        processes[process_name]['status'] = 'stopped'
+
+class ProcessInput:
+    """Очередь ввода процесса с неблокирующей записью в master PTY"""
+
+    def __init__(self, process_name, master_fd):
+        self.process_name = process_name
+        self._fd = master_fd
+        self._cond = threading.Condition()
+        self._buffer = bytearray()
+        self._queued = 0  # Всего байт поставлено в очередь
+        self._written = 0  # Всего байт записано в PTY
+        self._callbacks = []  # куча (смещение, номер, callback): уведомления о записи
+        self._counter = itertools.count()
+        self._closed = False
+        self._error = None
+
+    @property
+    def pending(self):
+        with self._cond:
+            return len(self._buffer)
+
+    def put(self, data, on_written=None):
+        """Поставить байты в очередь и записать, сколько получится; on_written(error) - после записи в PTY"""
+        with self._cond:
+            if self._closed:
+                return self._error or 'процесс не принимает ввод'
+            if self._buffer and len(self._buffer) + len(data) > INPUT_QUEUE_SIZE:
+                return 'очередь ввода переполнена'
+            self._buffer += data
+            self._queued += len(data)
+            if on_written is not None:
+                heapq.heappush(self._callbacks, (self._queued, next(self._counter), on_written))
+        if not self.flush():
+            io_loop.watch_input(self)
+        return None
+
+    def flush(self):
+        """Записать из очереди, сколько примет PTY; True, если очередь пуста"""
+        done = []
+        with self._cond:
+            while self._buffer and not self._closed:
+                try:
+                    written = os.write(self._fd, self._buffer[:INPUT_WRITE_SIZE])
+                except BlockingIOError:
+                    break
+                except OSError as e:
+                    done = self._close(f'ошибка записи: {e}')
+                    break
+                del self._buffer[:written]
+                self._written += written
+            while self._callbacks and self._callbacks[0][0] <= self._written:
+                done.append((heapq.heappop(self._callbacks)[2], None))
+            empty = not self._buffer
+            self._cond.notify_all()
+        for callback, error in done:
+            callback(error)
+        return empty
+
+    def wait_for_room(self, limit, timeout):
+        """Ждать, пока в очереди не останется меньше limit байт; False по таймауту"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self._buffer) >= limit and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self, error='процесс завершен'):
+        """Закрыть очередь до закрытия дескриптора: недописанный ввод отбрасывается"""
+        with self._cond:
+            done = self._close(error)
+        for callback, error in done:
+            callback(error)
+
+    def _close(self, error):
+        if self._closed:
+            return []
+        self._closed = True
+        self._error = error
+        if self._buffer:
+            print(f"Ввод {self.process_name}: {error}, не записано {len(self._buffer)} байт")
+        self._buffer.clear()
+        callbacks, self._callbacks = self._callbacks, []
+        self._cond.notify_all()
+        return [(callback, error) for _, _, callback in sorted(callbacks)]
+
+def get_process_input(process_name):
+    """Очередь ввода запущенного процесса или None"""
+    entry = processes.get(process_name)
+    if not entry or not entry.get('process') or entry['process'].poll() is not None:
+        return None
+    return entry.get('input')
+
+class ProcessIOLoop:
+    """Единый цикл ввода-вывода всех процессов: selectors, pidfd и таймеры"""
+
+    READ_SIZE = 65536
+    POLL_INTERVAL = 1.0
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, ('wakeup', None))
+        self._lock = threading.Lock()
+        self._pending = []
+        self._watched = {}  # id -> {'name', 'process', 'master', 'pidfd', 'input'}
+        self._input_waiting = []  # Очереди ввода, ждущие готовности PTY к записи
+        self._timers = []  # куча (время, номер, функция)
+        self._timer_counter = itertools.count()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='process-io-loop', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.wakeup()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=5)
+
+    def wakeup(self):
+        try:
+            os.write(self._wakeup_w, b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def call_later(self, delay, callback):
+        """Выполнить callback в потоке цикла через delay секунд (вызывается из любого потока)"""
+        with self._lock:
+            heapq.heappush(self._timers, (time.monotonic() + delay, next(self._timer_counter), callback))
+        self.wakeup()
+
+    def _run_due_timers(self):
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._timers or self._timers[0][0] > now:
+                    return
+                _, _, callback = heapq.heappop(self._timers)
+            try:
+                callback()
+            except Exception as e:
+                print(f"Ошибка отложенной задачи: {e}")
+
+    def register(self, process_name, process, master_fd, process_input):
+        """Начать обслуживание процесса (вызывается из любого потока)"""
+        with self._lock:
+            self._pending.append({'name': process_name, 'process': process, 'master': master_fd, 'pidfd': None, 'input': process_input})
+        self.wakeup()
+
+    def watch_input(self, process_input):
+        """Дописать очередь ввода, когда PTY будет готов к записи (вызывается из любого потока)"""
+        with self._lock:
+            self._input_waiting.append(process_input)
+        self.wakeup()
+
+    def _run(self):
+        while not shutdown_event.is_set():
+            timeout = None
+            if any(w['pidfd'] is None for w in self._watched.values()):
+                timeout = self.POLL_INTERVAL
+            with self._lock:
+                timer_deadline = self._timers[0][0] if self._timers else None
+            for deadline in (output_batcher.next_deadline(), timer_deadline):
+                if deadline is not None:
+                    delay = max(0.0, deadline - time.monotonic())
+                    timeout = delay if timeout is None else min(timeout, delay)
+            try:
+                events = self._selector.select(timeout)
+            except OSError as e:
+                print(f"Ошибка цикла ввода-вывода: {e}")
+                time.sleep(0.1)
+                continue
+            
+            for key, mask in events:
+                kind, watched = key.data
+                if kind == 'wakeup':
+                    self._drain_wakeup()
+                elif kind == 'output':
+                    if mask & selectors.EVENT_WRITE:
+                        self._on_writable(watched)
+                    if mask & selectors.EVENT_READ:
+                        self._on_readable(watched)
+                elif kind == 'exit':
+                    self._on_exit(watched)
+            
+            self._apply_pending()
+            self._apply_input_waiting()
+            output_batcher.flush_due()
+            self._run_due_timers()
+            
+            # Процессы без pidfd проверяем через poll() (SIGCHLD лишь будит цикл)
+            for watched in list(self._watched.values()):
+                if watched['pidfd'] is None and watched['process'].poll() is not None:
+                    self._on_exit(watched)
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self._wakeup_r, 4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _apply_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for watched in pending:
+            if hasattr(os, 'pidfd_open'):
+                try:
+                    watched['pidfd'] = os.pidfd_open(watched['process'].pid)
+                except OSError:
+                    watched['pidfd'] = None
+            self._watched[id(watched)] = watched
+            self._selector.register(watched['master'], selectors.EVENT_READ, ('output', watched))
+            if watched['pidfd'] is not None:
+                self._selector.register(watched['pidfd'], selectors.EVENT_READ, ('exit', watched))
+
+    def _apply_input_waiting(self):
+        with self._lock:
+            waiting, self._input_waiting = self._input_waiting, []
+        for process_input in waiting:
+            for watched in self._watched.values():
+                if watched['input'] is process_input and watched['master'] is not None:
+                    self._selector.modify(watched['master'], selectors.EVENT_READ | selectors.EVENT_WRITE, ('output', watched))
+
+    def _on_writable(self, watched):
+        if watched['master'] is not None and watched['input'].flush():
+            self._selector.modify(watched['master'], selectors.EVENT_READ, ('output', watched))
+
+    def _on_readable(self, watched):
+        if watched['master'] is None:
+            return
+        if read_process_output(watched['name'], watched['master'], self.READ_SIZE) is False:
+            # EOF/EIO: все дескрипторы slave закрыты, дальше ждем только завершения процесса
+            self._close_master(watched)
+
+    def _close_master(self, watched):
+        if watched['master'] is None:
+            return
+        try:
+            self._selector.unregister(watched['master'])
+        except (KeyError, ValueError):
+            pass
+        watched['input'].close()
+        try:
+            os.close(watched['master'])
+        except OSError:
+            pass
+        watched['master'] = None
+        
+        process_name = watched['name']
+        if process_name in processes and processes[process_name].get('process') is watched['process']:
+            processes[process_name]['master'] = None
+
+    def _on_exit(self, watched):
+        if self._watched.pop(id(watched), None) is None:
+            return
+        if watched['pidfd'] is not None:
+            try:
+                self._selector.unregister(watched['pidfd'])
+            except (KeyError, ValueError):
+                pass
+            os.close(watched['pidfd'])
         
-        output_thread = threading.Thread(target=read_process_output, args=(process_name, master), daemon=True)
-        output_thread.start()
+        watched['process'].poll()
+        # Дочитываем то, что осталось в буфере PTY
+        if watched['master'] is not None:
+            while read_process_output(watched['name'], watched['master'], self.READ_SIZE) is True:
+                pass
+            self._close_master(watched)
         
-        return True, f'Процесс {process_name} запущен (PID: {processes[process_name]["process"].pid})'
-    except Exception as e:
-        error_msg = f'Ошибка запуска: {str(e)}'
-        print(f"Ошибка запуска процесса {process_name}: {error_msg}")
-        return False, error_msg
+        handle_process_exit(watched['name'], watched['process'])
 
-def stop_process(process_name):
-    global processes, process_outputs
+def read_process_output(process_name, master_fd, size=4096):
+    """Прочитать доступный вывод процесса: True - прочитано, None - данных нет, False - EOF"""
+    try:
+        output = os.read(master_fd, size)
+    except BlockingIOError:
+        return None
+    except OSError:
+        return False
+    if not output:
+        return False
+    output_bytes[process_name] = output_bytes.get(process_name, 0) + len(output)
     
-    if process_name not in processes or not processes[process_name].get('process'):
-        return False, f'Процесс {process_name} не запущен'
+    # Инкрементальный декодер не теряет многобайтные символы на границе чтения
+    decoder = output_decoders.get(process_name)
+    if decoder is None:
+        decoder = output_decoders[process_name] = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    output_str = decoder.decode(output)
+    record_output(process_name, output_str)
+    emit_process_output(process_name, output_str, output)
+    return True
+
+def handle_process_exit(process_name, process):
+    """Обработать завершение процесса: статус, сообщение в терминал, закрытие истории"""
+    restart = False
+    stopping = False
+    if process_name in processes and processes[process_name].get('process') is process:
+        processes[process_name]['status'] = 'stopped'
+        restart = processes[process_name].pop('restart', False)
+        stopping = processes[process_name].get('stopping', False)
     
-    if processes[process_name]['process'].poll() is not None:
-        cleanup_process(process_name)
-        return False, f'Процесс {process_name} уже завершен'
+    output_msg = f'\n[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] [Процесс {process_name} завершен]\n'
+    record_output(process_name, output_msg)
+    close_history_log(process_name)
     
+    emit_process_output(process_name, output_msg)
+    output_batcher.flush(process_name)
+    script_registry.set_status(process_name, 'stopped')
     try:
-        if process_name in processes:
-            processes[process_name]['thread_running'] = False
-        
-        process = processes[process_name]['process']
-        master = processes[process_name]['master']
-        
-        process.terminate()
-        process.wait(timeout=5)
+        socketio.emit('process_status_update', {'process': process_name, 'status': 'stopped'})
+    except:
+        pass
+    
+    supervisor.on_exit(process_name, process.returncode, manual=stopping)
+    
+    if restart and not shutdown_event.is_set():
+        success, message = start_process(process_name)
+        if not success:
+            error_msg = f'\n[Ошибка перезапуска: {message}]\n'
+            record_output(process_name, error_msg)
+            emit_process_output(process_name, error_msg)
+
+class Supervisor:
+    """Автоперезапуск скриптов по политике с экспоненциальной задержкой"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+        self._stopped = False
+
+    def policy(self, process_name):
+        """Политика из кэша реестра скриптов (файл перечитывается по событиям watchdog)"""
+        return script_registry.policy(process_name) or dict(SUPERVISOR_DEFAULT_POLICY, limits={})
+
+    def _state(self, process_name):
+        if process_name not in self._states:
+            self._states[process_name] = {
+                'state': 'idle', 'restarts': deque(), 'failures': 0, 'started_at': None,
+                'last_exit_code': None, 'next_restart': None, 'token': 0
+            }
+        return self._states[process_name]
+
+    def on_start(self, process_name):
+        with self._lock:
+            state = self._state(process_name)
+            state['state'] = 'running'
+            state['started_at'] = time.monotonic()
+            state['next_restart'] = None
+            state['token'] += 1  # Отменяет запланированный перезапуск
+        self._publish(process_name)
+
+    def reset(self, process_name):
+        """Ручное управление: отменить ожидающий перезапуск и сбросить счетчики; True, если перезапуск ожидался"""
+        with self._lock:
+            state = self._state(process_name)
+            pending = state['state'] == 'backoff'
+            state['restarts'].clear()
+            state['failures'] = 0
+            state['next_restart'] = None
+            state['token'] += 1
+            if state['state'] in ('backoff', 'gave_up'):
+                state['state'] = 'idle'
+        self._publish(process_name)
+        return pending
+
+    def on_exit(self, process_name, returncode, manual=False):
+        policy = self.policy(process_name)
+        message = None
+        delay = None
+        with self._lock:
+            state = self._state(process_name)
+            state['last_exit_code'] = returncode
+            run_time = time.monotonic() - state['started_at'] if state['started_at'] else 0
+            state['started_at'] = None
+            failed = returncode != 0
+            if manual or self._stopped or policy['restart'] == 'no' or (policy['restart'] == 'on-failure' and not failed):
+                state['state'] = 'idle'
+            else:
+                now = time.monotonic()
+                window = float(policy['restart_window'])
+                while state['restarts'] and now - state['restarts'][0] > window:
+                    state['restarts'].popleft()
+                if policy['max_restarts'] and len(state['restarts']) >= policy['max_restarts']:
+                    state['state'] = 'gave_up'
+                    message = f'[Автоперезапуск остановлен: {len(state["restarts"])} перезапусков за {int(window)} с]'
+                else:
+                    if run_time >= float(policy['backoff_reset']):
+                        state['failures'] = 0
+                    delay = min(float(policy['backoff_max']), float(policy['backoff_initial']) * 2 ** state['failures'])
+                    state['failures'] += 1
+                    state['restarts'].append(now)
+                    state['state'] = 'backoff'
+                    state['next_restart'] = time.time() + delay
+                    state['token'] += 1
+                    token = state['token']
+                    message = f'[Автоперезапуск через {delay:g} с, код выхода {returncode}]'
         
-        if master:
+        if message:
+            print(f"{process_name}: {message}")
+            record_output(process_name, message + '\n')
+            emit_process_output(process_name, message + '\n')
+        if delay is not None:
+            io_loop.call_later(delay, lambda: self._restart(process_name, token))
+        self._publish(process_name)
+
+    def _restart(self, process_name, token):
+        with self._lock:
+            if self._stopped or self._state(process_name)['token'] != token:
+                return
+        if is_process_running(process_name):
+            return
+        success, message = start_process(process_name)
+        if not success:
+            error_msg = f'[Ошибка автоперезапуска: {message}]\n'
+            record_output(process_name, error_msg)
+            emit_process_output(process_name, error_msg)
+            self.on_exit(process_name, None)
+
+    def autostart(self):
+        """Запустить скрипты с autostart в политике"""
+        _, scripts = script_registry.snapshot()
+        for process_name in sorted(scripts):
+            if self.policy(process_name)['autostart'] and not is_process_running(process_name):
+                success, message = start_process(process_name)
+                print(f"Автозапуск {process_name}: {message}")
+
+    def shutdown(self):
+        with self._lock:
+            self._stopped = True
+
+    def get_status(self, process_name):
+        policy = self.policy(process_name)
+        entry = processes.get(process_name) or {}
+        with self._lock:
+            state = self._states.get(process_name)
+            return {
+                'restart': policy['restart'],
+                'autostart': bool(policy['autostart']),
+                'state': state['state'] if state else 'idle',
+                'restarts': len(state['restarts']) if state else 0,
+                'next_restart': state['next_restart'] if state else None,
+                'last_exit_code': state['last_exit_code'] if state else None,
+                'limits': policy['limits'],
+                'limits_applied': entry.get('limits')
+            }
+
+    def _publish(self, process_name):
+        script_registry.set_supervisor(process_name, self.get_status(process_name))
+
+supervisor = Supervisor()
+
+class AsyncProcessIOLoop:
+    """Цикл ввода-вывода процессов для режима asyncio (add_reader/call_later в цикле сервера)"""
+
+    READ_SIZE = 65536
+    POLL_INTERVAL = 1.0
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+        self._pending = []
+        self._watched = {}
+        self._flush_handle = None
+        self._flush_deadline = None
+        # Потока цикла нет: emit_process_output всегда будит цикл через wakeup()
+        self._thread = None
+
+    def start(self):
+        pass
+
+    def attach(self, loop):
+        with self._lock:
+            self._loop = loop
+            pending, self._pending = self._pending, []
+        for callback in pending:
+            loop.call_soon(callback)
+
+    def stop(self):
+        with self._lock:
+            loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._remove_all)
+
+    def _call_soon(self, callback):
+        with self._lock:
+            if self._loop is None:
+                self._pending.append(callback)
+                return
+            loop = self._loop
+        loop.call_soon_threadsafe(callback)
+
+    def wakeup(self):
+        self._call_soon(self._schedule_flush)
+
+    def call_later(self, delay, callback):
+        self._call_soon(lambda: self._loop.call_later(delay, self._run_callback, callback))
+
+    def _run_callback(self, callback):
+        try:
+            callback()
+        except Exception as e:
+            print(f"Ошибка отложенной задачи: {e}")
+
+    def register(self, process_name, process, master_fd, process_input):
+        watched = {'name': process_name, 'process': process, 'master': master_fd, 'pidfd': None, 'input': process_input}
+        self._call_soon(lambda: self._add(watched))
+
+    def watch_input(self, process_input):
+        self._call_soon(lambda: self._watch_input(process_input))
+
+    def _watch_input(self, process_input):
+        for watched in self._watched.values():
+            if watched['input'] is process_input and watched['master'] is not None:
+                self._loop.add_writer(watched['master'], self._on_writable, watched)
+
+    def _on_writable(self, watched):
+        if watched['master'] is not None and watched['input'].flush():
+            self._loop.remove_writer(watched['master'])
+
+    def _add(self, watched):
+        if hasattr(os, 'pidfd_open'):
             try:
-                os.close(master)
-            except:
-                pass
-        
-        if process_name in processes:
-            processes[process_name]['status'] = 'stopped'
+                watched['pidfd'] = os.pidfd_open(watched['process'].pid)
+            except OSError:
+                watched['pidfd'] = None
+        self._watched[id(watched)] = watched
+        self._loop.add_reader(watched['master'], self._on_readable, watched)
+        if watched['pidfd'] is not None:
+            self._loop.add_reader(watched['pidfd'], self._on_exit, watched)
+        else:
+            self._poll_exit(watched)
+
+    def _poll_exit(self, watched):
+        if id(watched) not in self._watched:
+            return
+        if watched['process'].poll() is not None:
+            self._on_exit(watched)
+        else:
+            self._loop.call_later(self.POLL_INTERVAL, self._poll_exit, watched)
+
+    def _schedule_flush(self):
+        deadline = output_batcher.next_deadline()
+        if deadline is None:
+            return
+        if self._flush_handle is not None:
+            if self._flush_deadline <= deadline:
+                return
+            self._flush_handle.cancel()
+        self._flush_deadline = deadline
+        self._flush_handle = self._loop.call_later(max(0.0, deadline - time.monotonic()), self._flush)
+
+    def _flush(self):
+        self._flush_handle = None
+        output_batcher.flush_due()
+        self._schedule_flush()
+
+    def _on_readable(self, watched):
+        if watched['master'] is None:
+            return
+        if read_process_output(watched['name'], watched['master'], self.READ_SIZE) is False:
+            self._close_master(watched)
+        self._schedule_flush()
+
+    def _close_master(self, watched):
+        if watched['master'] is None:
+            return
+        self._loop.remove_reader(watched['master'])
+        self._loop.remove_writer(watched['master'])
+        watched['input'].close()
+        try:
+            os.close(watched['master'])
+        except OSError:
+            pass
+        watched['master'] = None
         
-        return True, f'Процесс {process_name} остановлен'
-    except:
-        process.kill()
-        process.wait()
+        process_name = watched['name']
+        if process_name in processes and processes[process_name].get('process') is watched['process']:
+            processes[process_name]['master'] = None
+
+    def _on_exit(self, watched):
+        if self._watched.pop(id(watched), None) is None:
+            return
+        if watched['pidfd'] is not None:
+            self._loop.remove_reader(watched['pidfd'])
+            os.close(watched['pidfd'])
         
-        if process_name in processes and processes[process_name]['master']:
-            try:
-                os.close(processes[process_name]['master'])
-            except:
+        watched['process'].poll()
+        if watched['master'] is not None:
+            while read_process_output(watched['name'], watched['master'], self.READ_SIZE) is True:
                 pass
+            self._close_master(watched)
         
-        if process_name in processes:
-            processes[process_name]['status'] = 'stopped'
-        
-        return True, f'Процесс {process_name} принудительно остановлен'
+        handle_process_exit(watched['name'], watched['process'])
+        self._schedule_flush()
 
-def cleanup_process(process_name):
-    global processes
-    
-    if process_name in processes:
-        processes[process_name]['status'] = 'stopped'
+    def _remove_all(self):
+        for watched in list(self._watched.values()):
+            if watched['master'] is not None:
+                self._loop.remove_reader(watched['master'])
+                self._loop.remove_writer(watched['master'])
+            if watched['pidfd'] is not None:
+                self._loop.remove_reader(watched['pidfd'])
 
-def check_process_status_background(process_name):
-    global processes
-    
-    while process_name in processes and processes[process_name].get('thread_running', False) and not shutdown_event.is_set():
-        if process_name in processes and processes[process_name].get('process'):
-            process = processes[process_name]['process']
-            if process.poll() is not None:
-                if process_name in processes:
-                    processes[process_name]['status'] = 'stopped'
-                    processes[process_name]['thread_running'] = False
-                try:
-                    socketio.emit('process_status_update', {'process': process_name, 'status': 'stopped'})
-                    output_msg = f'\n[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] [Процесс {process_name} завершен]\n'
-                    socketio.emit('process_output', {'process': process_name, 'data': output_msg})
-                    
-                    if process_name not in process_outputs:
-                        process_outputs[process_name] = ""
-                    process_outputs[process_name] += output_msg
-                    append_to_history_file(process_name, output_msg)
-                except:
-                    pass
-                break
-        time.sleep(1)
+io_loop = AsyncProcessIOLoop() if SERVER_ASYNC_MODE == 'asyncio' else ProcessIOLoop()
+if SERVER_ROLE != 'worker':
+    io_loop.start()
 
-def read_process_output(process_name, master_fd):
-    global process_outputs
-    
+if SERVER_ROLE != 'worker' and SERVER_ASYNC_MODE != 'asyncio' and not hasattr(os, 'pidfd_open') and threading.current_thread() is threading.main_thread():
+    signal.signal(signal.SIGCHLD, lambda signum, frame: io_loop.wakeup())
+
+def get_terminal_size(process_name):
+    """Размер PTY процесса по размерам терминалов зрителей и TERMINAL_RESIZE_POLICY"""
+    with terminal_sizes_lock:
+        viewers = list(terminal_sizes.get(process_name, {}).values())
+    if not viewers:
+        return TERMINAL_COLUMNS, TERMINAL_LINES
+    if TERMINAL_RESIZE_POLICY == 'last_active':
+        viewer = max(viewers, key=lambda v: v['active'])
+        return viewer['columns'], viewer['lines']
+    return min(v['columns'] for v in viewers), min(v['lines'] for v in viewers)
+
+def set_pty_size(fd, columns, lines):
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack('HHHH', lines, columns, 0, 0))
+
+def apply_terminal_size(process_name):
+    """Применить выбранный размер к PTY запущенного процесса (только если он изменился)"""
+    entry = processes.get(process_name)
+    if not entry or entry.get('master') is None or entry['process'].poll() is not None:
+        return
+    size = get_terminal_size(process_name)
+    if entry.get('winsize') == size:
+        return
     try:
-        while process_name in processes and processes[process_name].get('thread_running', False) and not shutdown_event.is_set():
-            ready, _, _ = select.select([master_fd], [], [], 0.1)
-            if ready:
-                try:
-                    output = os.read(master_fd, 4096)
-                    if output:
-                        output_str = output.decode('utf-8', errors='ignore')
-                        
-                        if process_name not in process_outputs:
-                            process_outputs[process_name] = ""
-                        process_outputs[process_name] += output_str
-                        append_to_history_file(process_name, output_str)
-                        
-                        try:
-                            socketio.emit('process_output', {'process': process_name, 'data': output_str})
-                        except:
-                            pass
-                    else:
-                        break
-                except OSError:
-                    break
-            elif process_name in processes and processes[process_name].get('process'):
-                process = processes[process_name]['process']
-                if process.poll() is not None:
-                    output_str = f'\n[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] [Процесс {process_name} завершен]\n'
-                    
-                    if process_name not in process_outputs:
-                        process_outputs[process_name] = ""
-                    process_outputs[process_name] += output_str
-                    append_to_history_file(process_name, output_str)
-                    
-                    try:
-                        socketio.emit('process_output', {'process': process_name, 'data': output_str})
-                        socketio.emit('process_status_update', {'process': process_name, 'status': 'stopped'})
-                    except:
-                        pass
-                    
-                    if process_name in processes:
-                        processes[process_name]['status'] = 'stopped'
-                        processes[process_name]['thread_running'] = False
-                    break
-    except Exception as e:
-        error_msg = f'\n[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] [Ошибка чтения: {str(e)}]\n'
-        
-        if process_name not in process_outputs:
-            process_outputs[process_name] = ""
-        process_outputs[process_name] += error_msg
-        append_to_history_file(process_name, error_msg)
-        
-        try:
-            socketio.emit('process_output', {'process': process_name, 'data': error_msg})
-        except:
-            pass
+        # SIGWINCH группе переднего плана ядро отправит само: PTY - управляющий терминал сессии
+        set_pty_size(entry['master'], *size)
+        entry['winsize'] = size
+    except OSError as e:
+        print(f"Ошибка изменения размера терминала {process_name}: {e}")
+        return
+    buffer = process_outputs.get(process_name)
+    screen = buffer.screen if buffer is not None else None
+    if screen is not None:
+        screen.resize(*size)
+
+def update_terminal_size(sid, process_name, columns=None, lines=None):
+    """Запомнить размер терминала клиента (или только отметить его активность)"""
+    with terminal_sizes_lock:
+        viewers = terminal_sizes.setdefault(process_name, {})
+        if columns is None:
+            if sid not in viewers:
+                return
+            viewers[sid]['active'] = time.monotonic()
+        else:
+            viewers[sid] = {'columns': columns, 'lines': lines, 'active': time.monotonic()}
+    apply_terminal_size(process_name)
+
+def forget_terminal_size(sid, process_name=None):
+    with terminal_sizes_lock:
+        names = [process_name] if process_name else [name for name, viewers in terminal_sizes.items() if sid in viewers]
+        for name in names:
+            terminal_sizes.get(name, {}).pop(sid, None)
+    for name in names:
+        apply_terminal_size(name)
+
+@socketio.on('resize_terminal')
+def handle_resize_terminal(data):
+    """Размер xterm клиента для процесса"""
+    process_name = data.get('process')
+    try:
+        columns = max(2, min(int(data.get('cols')), 1000))
+        lines = max(2, min(int(data.get('rows')), 1000))
+    except (TypeError, ValueError):
+        return
+    if process_name:
+        update_terminal_size(request.sid, process_name, columns, lines)
 
 @socketio.on('process_input')
 def handle_process_input(data):
     process_name = data.get('process')
     input_data = data.get('data')
     
-    if process_name in processes and processes[process_name].get('process') and processes[process_name]['process'].poll() is None:
-        master = processes[process_name]['master']
+    if TERMINAL_RESIZE_POLICY == 'last_active' and process_name:
+        update_terminal_size(request.sid, process_name)
+    
+    process_input = get_process_input(process_name)
+    if process_input is None or not input_data:
+        return
+    error = process_input.put(input_data.encode('utf-8'))
+    if error:
+        error_msg = f'[Ошибка отправки: {error}]\n'
+        emit_process_output(process_name, error_msg)
+        record_output(process_name, error_msg)
+
+@socketio.on('process_paste')
+def handle_process_paste(data):
+    """Кусок большой вставки: paste_ack приходит, когда он записан в PTY"""
+    process_name = data.get('process')
+    sid = request.sid
+    ack = {'process': process_name, 'id': data.get('id'), 'seq': data.get('seq')}
+    
+    def on_written(error):
         try:
-            os.write(master, input_data.encode('utf-8'))
-        except OSError as e:
-            try:
-                error_msg = f'[Ошибка отправки: {str(e)}]\n'
-                socketio.emit('process_output', {'process': process_name, 'data': error_msg})
-                
-                if process_name not in process_outputs:
-                    process_outputs[process_name] = ""
-                process_outputs[process_name] += error_msg
-                append_to_history_file(process_name, error_msg)
-            except:
-                pass
+            socketio.emit('paste_ack', dict(ack, error=error), to=sid)
+        except Exception:
+            pass
+    
+    process_input = get_process_input(process_name)
+    if process_input is None:
+        on_written('процесс не запущен')
+        return
+    error = process_input.put((data.get('data') or '').encode('utf-8'), on_written)
+    if error:
+        on_written(error)
 
 @socketio.on('get_process_history')
 def handle_get_process_history(data):
+    """Подписать клиента на вывод процесса и отправить ему историю"""
     process_name = data.get('process')
-    if process_name in process_outputs:
-        try:
-            socketio.emit('process_history', {'process': process_name, 'data': process_outputs[process_name]})
-        except:
-            pass
+    if not process_name:
+        return
+    subscribe_output(request.sid, process_name, flow_control=bool(data.get('flow_control')))
+    
+    # Буфер (и чтение истории с диска) создаем только для известных процессов
+    if process_name in process_outputs or process_name in known_histories or script_registry.get(process_name):
+        content = get_process_snapshot(process_name)
     else:
-        try:
-            file_path = get_history_file_path(process_name)
-            if os.path.exists(file_path):
-                content = ""
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()[-MAX_HISTORY_LINES:]
-                    for line in lines:
-                        try:
-                            entry = json.loads(line.strip())
-                            content += entry['data']
-                        except:
-                            continue
-                socketio.emit('process_history', {'process': process_name, 'data': content})
-            else:
-                socketio.emit('process_history', {'process': process_name, 'data': ''})
-        except Exception as e:
-            print(f"Ошибка загрузки истории из файла для {process_name}: {e}")
-            socketio.emit('process_history', {'process': process_name, 'data': ''})
+        content = ''
+    emit('process_history', make_output_payload(request.sid, process_name, content))
+
+@socketio.on('query_history')
+def handle_query_history(data):
+    """Страница истории через Socket.IO; ответ history_page с тем же request_id"""
+    process_name = data.get('process')
+    if not process_name:
+        return
+    try:
+        result = query_history(process_name, **{
+            key: data.get(key) for key in ('limit', 'before', 'after', 'start', 'end', 'last_bytes')
+        })
+    except ValueError as e:
+        result = {'process': process_name, 'entries': [], 'before': None, 'after': None, 'error': str(e)}
+    result['request_id'] = data.get('request_id')
+    emit('history_page', result)
+
+@socketio.on('search_history')
+def handle_search_history(data):
+    """Поиск по истории через Socket.IO: результаты приходят пачками history_search_results"""
+    request_id = data.get('request_id')
+    try:
+        results = search_history(data.get('q', ''), **{
+            key: data.get(key) for key in ('regex', 'case', 'process', 'start', 'end', 'limit', 'cursor')
+        })
+    except ValueError as e:
+        emit('history_search_results', {'request_id': request_id, 'results': [], 'done': True, 'next': None, 'error': str(e)})
+        return
+    batch = []
+    for result in results:
+        if result.get('done'):
+            emit('history_search_results', {'request_id': request_id, 'results': batch, 'done': True, 'next': result['next']})
+        else:
+            batch.append(result)
+            if len(batch) >= HISTORY_SEARCH_BATCH:
+                emit('history_search_results', {'request_id': request_id, 'results': batch, 'done': False, 'next': None})
+                batch = []
+
+@socketio.on('unsubscribe_process')
+def handle_unsubscribe_process(data):
+    """Отписать клиента от вывода процесса"""
+    process_name = data.get('process')
+    if process_name:
+        unsubscribe_output(request.sid, process_name)
+
+@socketio.on('registry_sync')
+def handle_registry_sync(data=None):
+    """Подписка на изменения списка скриптов: снимок или дельты после since того же epoch"""
+    data = data or {}
+    since = data.get('since')
+    script_registry.sync(request.sid, int(since) if since is not None else None, data.get('epoch'))
+
+@socketio.on('output_ack')
+def handle_output_ack(data):
+    """Подтверждение клиентом полученных кадров вывода"""
+    process_name = data.get('process')
+    if process_name:
+        ack_output(request.sid, process_name, int(data.get('seq', 0)))
+
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    unsubscribe_output(request.sid)
+    forget_client_rooms(request.sid)
+    client_transports.pop(request.sid, None)
 
 @socketio.on('scripts_updated')
 def handle_scripts_updated():
     pass
 
+# События клиентов, которые worker пересылает процессу-владельцу
+SOCKET_EVENT_HANDLERS = {
+    'connect': handle_connect,
+    'disconnect': handle_disconnect,
+    'resize_terminal': handle_resize_terminal,
+    'process_input': handle_process_input,
+    'process_paste': handle_process_paste,
+    'get_process_history': handle_get_process_history,
+    'query_history': handle_query_history,
+    'search_history': handle_search_history,
+    'unsubscribe_process': handle_unsubscribe_process,
+    'registry_sync': handle_registry_sync,
+    'output_ack': handle_output_ack,
+}
+
+def make_socket_forwarder(event):
+    def forward(data=None, *args):
+        try:
+            owner_client.request('POST', '/api/internal/socket_event', json.dumps({
+                'sid': request.sid,
+                'event': event,
+                'data': None if event == 'disconnect' else data
+            }).encode('utf-8'), {'Content-Type': 'application/json'})
+        except (OSError, http.client.HTTPException) as e:
+            print(f"Ошибка пересылки события {event} владельцу процессов: {e}")
+    return forward
+
+if SERVER_ROLE == 'worker':
+    SOCKET_EVENT_TARGETS = {event: make_socket_forwarder(event) for event in SOCKET_EVENT_HANDLERS}
+    if SERVER_ASYNC_MODE != 'asyncio':
+        for event, handler in SOCKET_EVENT_TARGETS.items():
+            socketio.on_event(event, handler)
+else:
+    SOCKET_EVENT_TARGETS = SOCKET_EVENT_HANDLERS
+
+class AsyncServerBridge:
+    """Синхронный интерфейс AsyncServer для потоков: emit и комнаты по порядку в цикле asyncio"""
+
+    def __init__(self, server):
+        self.server = server
+        self.manager = server.manager
+        self._loop = None
+        self._queue = None
+
+    def attach(self, loop):
+        self._queue = asyncio.Queue()
+        self._loop = loop
+        loop.create_task(self._run())
+
+    def emit(self, event, data=None, to=None, room=None, skip_sid=None, namespace=None, callback=None, **kwargs):
+        self._submit(self.server.emit, event, data, to=to or room, skip_sid=skip_sid, namespace=namespace or '/')
+
+    def enter_room(self, sid, room, namespace=None):
+        self._submit(self.server.enter_room, sid, room, namespace=namespace or '/')
+
+    def leave_room(self, sid, room, namespace=None):
+        self._submit(self.server.leave_room, sid, room, namespace=namespace or '/')
+
+    def _submit(self, method, *args, **kwargs):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return  # Сервер еще не запущен - клиентов нет
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._queue.put_nowait((method, args, kwargs))
+        else:
+            loop.call_soon_threadsafe(self._queue.put_nowait, (method, args, kwargs))
+
+    async def _run(self):
+        while True:
+            method, args, kwargs = await self._queue.get()
+            try:
+                await method(*args, **kwargs)
+            except Exception as e:
+                print(f"Ошибка отправки клиентам: {e}")
+
+class AsyncUnixSocketManager(AsyncPubSubManager):
+    """Вариант UnixSocketManager для AsyncServer"""
+
+    name = 'unix'
+
+    def __init__(self, url, channel='flask-socketio', write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.path = url[len('unix://'):]
+        self._streams = None
+        self._connect_lock = None
+
+    async def _connect(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._streams is None:
+                self._streams = await asyncio.open_unix_connection(self.path, limit=16 * 1024 * 1024)
+            return self._streams
+
+    def _reset(self, streams):
+        if streams is not None and self._streams is streams:
+            self._streams = None
+            streams[1].close()
+
+    async def _publish(self, data):
+        line = (self.json.dumps(data) + '\n').encode('utf-8')
+        for attempt in range(2):
+            streams = None
+            try:
+                streams = await self._connect()
+                streams[1].write(line)
+                await streams[1].drain()
+                return
+            except OSError as e:
+                self._reset(streams)
+                if attempt:
+                    print(f"Ошибка отправки в шину сообщений: {e}")
+
+    async def _listen(self):
+        while True:
+            streams = None
+            try:
+                streams = await self._connect()
+                async for line in streams[0]:
+                    yield line
+            except (OSError, ValueError):
+                pass
+            self._reset(streams)
+            await asyncio.sleep(1)
+
+class WSGIAdapter:
+    """Минимальный мост ASGI -> WSGI для Flask в режиме asyncio (ответ отправляется по мере выдачи)"""
+
+    def __init__(self, wsgi_app, executor):
+        self.wsgi_app = wsgi_app
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        body = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            body.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        environ = self._make_environ(scope, b''.join(body))
+        loop = asyncio.get_running_loop()
+        status, headers, result = await loop.run_in_executor(self.executor, self._run, environ)
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(key.lower().encode('latin-1'), value.encode('latin-1')) for key, value in headers]
+            })
+            # Каждый кусок ответа берется в пуле потоков: генератор может долго считать
+            chunks = iter(result)
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.executor, result.close)
+
+    def _make_environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+            'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for raw_key, raw_value in scope.get('headers', []):
+            key = raw_key.decode('latin-1').upper().replace('-', '_')
+            value = raw_value.decode('latin-1')
+            if key == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+                continue
+            if key == 'CONTENT_LENGTH':
+                continue
+            key = 'HTTP_' + key
+            environ[key] = environ[key] + ',' + value if key in environ else value
+        return environ
+
+    def _run(self, environ):
+        response = {}
+        
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+        
+        result = self.wsgi_app(environ, start_response)
+        return response['status'], response['headers'], result
+
+UPLOAD_INPUT_PATH_RE = re.compile(r'^/api/process/([^/]+)/input$')
+
+async def send_json_response(send, status, data):
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode('latin-1'))]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def upload_process_input_async(process_name, receive, send):
+    """POST /api/process/<name>/input в режиме asyncio: ожидание места в очереди - в корутине"""
+    process_input = get_process_input(process_name)
+    if process_input is None:
+        return await send_json_response(send, 409, {'success': False, 'message': f'Процесс {process_name} не запущен'})
+    loop = asyncio.get_running_loop()
+    
+    def make_waiter():
+        future = loop.create_future()
+        
+        def on_written(error):
+            # Вызывается из цикла ввода-вывода или из потока, закрывшего очередь
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(error))
+        return future, on_written
+    
+    written = deque()  # Ожидания записи поставленных кусков, от старых к новым
+    total = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        more_body = message.get('more_body', False)
+        body = message.get('body', b'')
+        for offset in range(0, len(body), INPUT_UPLOAD_CHUNK):
+            chunk = body[offset:offset + INPUT_UPLOAD_CHUNK]
+            deadline = loop.time() + INPUT_UPLOAD_TIMEOUT
+            while written and process_input.pending >= INPUT_UPLOAD_HIGH_WATER:
+                try:
+                    error = await asyncio.wait_for(asyncio.shield(written[0]), max(0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    return await send_json_response(send, 504, {'success': False, 'message': f'Процесс не читает ввод {INPUT_UPLOAD_TIMEOUT} с', 'bytes': total})
+                written.popleft()
+                if error:
+                    return await send_json_response(send, 409, {'success': False, 'message': f'Ошибка отправки: {error}', 'bytes': total})
+            future, on_written = make_waiter()
+            error = process_input.put(chunk, on_written)
+            if error:
+                return await send_json_response(send, 409, {'success': False, 'message': f'Ошибка отправки: {error}', 'bytes': total})
+            written.append(future)
+            total += len(chunk)
+    await send_json_response(send, 200, {'success': True, 'message': f'Передано {total} байт', 'bytes': total})
+
+def dispatch_socket_event(event, sid, data):
+    """Обработчик события клиента в режиме asyncio (выполняется в пуле потоков)"""
+    with app.test_request_context('/socket.io/'):
+        call_socket_handler(SOCKET_EVENT_TARGETS[event], event, sid, data)
+
+def make_async_client_manager():
+    if not MESSAGE_QUEUE:
+        return None
+    if MESSAGE_QUEUE.startswith('unix://'):
+        return AsyncUnixSocketManager(MESSAGE_QUEUE)
+    if MESSAGE_QUEUE.startswith(('redis://', 'rediss://')):
+        return AsyncRedisManager(MESSAGE_QUEUE, channel='flask-socketio')
+    raise ValueError(f'Шина {MESSAGE_QUEUE} не поддерживается в режиме asyncio (нужен unix:// или redis://)')
+
+def make_asgi_app():
+    """ASGI-приложение для режима asyncio: Socket.IO на AsyncServer, остальное - Flask через WSGIAdapter"""
+    executor = ThreadPoolExecutor(max_workers=SOCKET_HANDLER_THREADS, thread_name_prefix='socket-handler')
+    server = AsyncServer(async_mode='asgi', cors_allowed_origins='*', client_manager=make_async_client_manager())
+    bridge = AsyncServerBridge(server)
+    
+    async def run_event(event, sid, data):
+        await asyncio.get_running_loop().run_in_executor(executor, dispatch_socket_event, event, sid, data)
+    
+    def make_handler(event):
+        async def handler(sid, data=None, *args):
+            await run_event(event, sid, data)
+        return handler
+    
+    async def on_connect(sid, environ, auth=None):
+        await run_event('connect', sid, auth)
+    
+    async def on_disconnect(sid, *args):
+        await run_event('disconnect', sid, None)
+    
+    server.on('connect', on_connect)
+    server.on('disconnect', on_disconnect)
+    for event in SOCKET_EVENT_TARGETS:
+        if event not in ('connect', 'disconnect'):
+            server.on(event, make_handler(event))
+    
+    async def on_startup():
+        loop = asyncio.get_running_loop()
+        bridge.attach(loop)
+        io_loop.attach(loop)
+    
+    async def on_shutdown():
+        await asyncio.get_running_loop().run_in_executor(None, cleanup)
+    
+    wsgi_adapter = WSGIAdapter(app, executor)
+    
+    async def http_app(scope, receive, send):
+        # Загрузку ввода обслуживает владелец процессов; worker пересылает ее через Flask
+        if scope['type'] == 'http' and scope['method'] == 'POST' and SERVER_ROLE != 'worker':
+            match = UPLOAD_INPUT_PATH_RE.match(scope['path'])
+            if match:
+                return await upload_process_input_async(match.group(1), receive, send)
+        await wsgi_adapter(scope, receive, send)
+    
+    # Весь код приложения продолжает вызывать socketio.emit - теперь он уходит в AsyncServer
+    socketio.server = bridge
+    return ASGIApp(server, other_asgi_app=http_app, on_startup=on_startup, on_shutdown=on_shutdown)
+
+if SERVER_ASYNC_MODE == 'asyncio':
+    asgi_app = make_asgi_app()
+
+if SERVER_ROLE != 'worker':
+    # Автозапуск - после объявления всех функций запуска процессов
+    supervisor.autostart()
+
 if __name__ == '__main__':
     try:
-        socketio.run(app, host='0.0.0.0', port=5000, debug=True, use_reloader=False)
+        if SERVER_ASYNC_MODE == 'asyncio':
+            try:
+                import uvicorn
+            except ImportError:
+                print("Для режима asyncio нужен пакет uvicorn: pip install uvicorn")
+                sys.exit(1)
+            uvicorn.run(asgi_app, host=SERVER_HOST, port=SERVER_PORT)
+        else:
+            socketio.run(app, host=SERVER_HOST, port=SERVER_PORT, debug=True, use_reloader=False)
     except KeyboardInterrupt:
         print("Получен сигнал завершения")
     finally:
-        shutdown_event.set()
         cleanup()
\ No newline at end of file
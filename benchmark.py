@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""Нагрузочный тест менеджера терминалов.
+
+Создает в папке scripts синтетические скрипты с разным характером вывода
+(построчный, прогресс-бар, пачками), запускает их через API, подключает
+клиентов Socket.IO и измеряет задержку эха нажатий (process_input),
+скорость доставки вывода, CPU/RSS сервера, скорость записи истории и
+время ответа /api/processes. Результат сохраняется в JSON.
+
+Сервер должен быть уже запущен на этой же машине, например:
+    python3 app.py
+    python3 benchmark.py --scripts 4 --clients 16 --duration 30
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from urllib.parse import urlsplit
+
+try:
+    import simple_websocket
+except ImportError:
+    simple_websocket = None
+
+PROFILES = ('line', 'progress', 'bursty')
+ECHO_SCRIPT = 'bench_echo'
+ACK_INTERVAL = 0.2  # Как часто клиенты подтверждают кадры вывода (как браузер)
+REGISTRY_TIMEOUT = 15  # Сколько ждать, пока сервер увидит созданные скрипты (секунд)
+
+PROFILE_BODIES = {
+    # Построчный вывод с постоянной частотой
+    'line': '''n = 0
+while True:
+    n += 1
+    sys.stdout.write(f"{n:08d} " + "x" * WIDTH + "\\n")
+    sys.stdout.flush()
+    time.sleep(1 / RATE)
+''',
+    # Прогресс-бар: перерисовка одной строки через \\r
+    'progress': '''n = 0
+while True:
+    n = (n + 1) % 101
+    bar = "#" * (n * WIDTH // 100)
+    sys.stdout.write(f"\\r[{bar:<{WIDTH}}] {n:3d}%")
+    if n == 100:
+        sys.stdout.write("\\n")
+    sys.stdout.flush()
+    time.sleep(1 / RATE)
+''',
+    # Пачки вывода с паузами
+    'bursty': '''line = "y" * WIDTH + "\\n"
+count = max(1, BURST_BYTES // len(line))
+while True:
+    sys.stdout.write(line * count)
+    sys.stdout.flush()
+    time.sleep(BURST_INTERVAL)
+''',
+    # Ничего не выводит сам: эхо нажатий делает терминал
+    'echo': '''for _ in sys.stdin:
+    pass
+''',
+}
+
+def make_script(profile, args):
+    params = (
+        f"RATE = {args.rate}\n"
+        f"WIDTH = {args.line_width}\n"
+        f"BURST_BYTES = {args.burst_kb * 1024}\n"
+        f"BURST_INTERVAL = {args.burst_interval}\n"
+    )
+    return "#!/usr/bin/env python3\nimport sys, time\n" + params + PROFILE_BODIES[profile]
+
+def percentiles(values):
+    """Сводка по ряду значений: count, min, mean, p50, p90, p99, max"""
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+
+    def rank(p):
+        return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+
+    return {
+        'count': len(values),
+        'min': round(values[0], 3),
+        'mean': round(sum(values) / len(values), 3),
+        'p50': round(rank(50), 3),
+        'p90': round(rank(90), 3),
+        'p99': round(rank(99), 3),
+        'max': round(values[-1], 3),
+    }
+
+class BenchClient:
+    """Минимальный клиент Socket.IO (Engine.IO v4 поверх WebSocket)"""
+
+    def __init__(self, base_url, binary=True):
+        parts = urlsplit(base_url)
+        scheme = 'wss' if parts.scheme == 'https' else 'ws'
+        self.url = f'{scheme}://{parts.netloc}/socket.io/?EIO=4&transport=websocket'
+        self.binary = binary
+        self.ws = None
+        self.sid = None
+        self.bytes = 0
+        self.frames = 0
+        self.resyncs = 0
+        self.last_seq = {}
+        self.on_text = None  # Вызывается с текстом вывода (для проверки эха)
+        self._send_lock = threading.Lock()
+        self._last_ack = 0
+        self._pending_binary = None
+        self._running = False
+        self._thread = None
+
+    def connect(self):
+        self.ws = simple_websocket.Client(self.url)
+        packet = self.ws.receive(timeout=10)
+        if not packet or not packet.startswith('0'):
+            raise RuntimeError(f'Неожиданный ответ Engine.IO: {packet!r}')
+        self._send('40' + json.dumps({'binary': self.binary, 'compress': False}))
+        while True:
+            packet = self.ws.receive(timeout=10)
+            if packet is None:
+                raise RuntimeError('Сервер не подтвердил подключение Socket.IO')
+            if isinstance(packet, str) and packet.startswith('40'):
+                self.sid = json.loads(packet[2:]).get('sid')
+                break
+            if isinstance(packet, str) and packet.startswith('44'):
+                raise RuntimeError(f'Сервер отклонил подключение: {packet[2:]}')
+        self._running = True
+        self._thread = threading.Thread(target=self._reader, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._running = False
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+    def emit(self, event, data):
+        self._send('42' + json.dumps([event, data]))
+
+    def _send(self, packet):
+        with self._send_lock:
+            self.ws.send(packet)
+
+    def _reader(self):
+        while self._running:
+            try:
+                packet = self.ws.receive(timeout=1)
+            except Exception:
+                break
+            if packet is None:
+                continue
+            if isinstance(packet, bytes):
+                self._on_attachment(packet)
+            elif packet == '2':
+                self._send('3')
+            elif packet.startswith('42'):
+                event, data = json.loads(packet[2:])[:2]
+                self._on_event(event, data)
+            elif packet.startswith('45'):
+                count, _, body = packet[2:].partition('-')
+                event, data = json.loads(body)[:2]
+                self._pending_binary = {'event': event, 'data': data, 'count': int(count), 'attachments': []}
+            self._maybe_ack()
+
+    def _on_attachment(self, data):
+        pending = self._pending_binary
+        if pending is None:
+            return
+        pending['attachments'].append(data)
+        if len(pending['attachments']) == pending['count']:
+            self._pending_binary = None
+            self._on_event(pending['event'], self._fill_placeholders(pending['data'], pending['attachments']))
+
+    def _fill_placeholders(self, data, attachments):
+        if isinstance(data, dict):
+            if data.get('_placeholder'):
+                return attachments[data['num']]
+            return {key: self._fill_placeholders(value, attachments) for key, value in data.items()}
+        if isinstance(data, list):
+            return [self._fill_placeholders(value, attachments) for value in data]
+        return data
+
+    def _on_event(self, event, data):
+        if event not in ('process_output', 'process_resync', 'process_history') or not isinstance(data, dict):
+            return
+        payload = data.get('data') or ''
+        raw = payload if isinstance(payload, bytes) else payload.encode('utf-8')
+        if event == 'process_output':
+            self.bytes += len(raw)
+            self.frames += 1
+        elif event == 'process_resync':
+            self.resyncs += 1
+        if data.get('seq'):
+            self.last_seq[data['process']] = data['seq']
+        if self.on_text is not None:
+            self.on_text(raw.decode('utf-8', errors='replace'))
+
+    def _maybe_ack(self):
+        now = time.monotonic()
+        if now - self._last_ack < ACK_INTERVAL:
+            return
+        self._last_ack = now
+        for process_name, seq in list(self.last_seq.items()):
+            self.emit('output_ack', {'process': process_name, 'seq': seq})
+
+class EchoProbe:
+    """Замер задержки эха: отправляет маркер через process_input и ждет его в выводе"""
+
+    def __init__(self, client, process_name, interval):
+        self.client = client
+        self.process_name = process_name
+        self.interval = interval
+        self.latencies = []
+        self.lost = 0
+        self.recording = False
+        self._pending = {}  # маркер -> время отправки
+        self._tail = ''
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        client.on_text = self._on_text
+
+    def _on_text(self, text):
+        now = time.monotonic()
+        with self._lock:
+            self._tail = (self._tail + text)[-4096:]
+            for marker, sent in list(self._pending.items()):
+                if marker in self._tail:
+                    del self._pending[marker]
+                    if self.recording:
+                        self.latencies.append((now - sent) * 1000)
+
+    def run(self):
+        counter = 0
+        while not self._stop.wait(self.interval):
+            counter += 1
+            marker = f'~{counter:06d}~'
+            with self._lock:
+                # Маркеры без ответа дольше 10 секунд считаем потерянными
+                for old, sent in list(self._pending.items()):
+                    if time.monotonic() - sent > 10:
+                        del self._pending[old]
+                        self.lost += self.recording
+                self._pending[marker] = time.monotonic()
+            # Перевод строки время от времени, чтобы строка терминала не переполнялась
+            data = marker + ('\r' if counter % 20 == 0 else '')
+            self.client.emit('process_input', {'process': self.process_name, 'data': data})
+
+    def stop(self):
+        self._stop.set()
+
+class Benchmark:
+    def __init__(self, args):
+        self.args = args
+        self.base_url = args.url.rstrip('/')
+        self.names = []
+        self.clients = []
+        self.probe = None
+        self.api_latencies = []
+        self.api_304_latencies = []
+        self.server_samples = []
+        self.recording = False
+        self._stop = threading.Event()
+        self._threads = []
+
+    # --- HTTP ---
+    def request(self, method, path, headers=None):
+        req = urllib.request.Request(self.base_url + path, method=method, headers=headers or {})
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                return response.status, dict(response.headers), response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, dict(e.headers), e.read()
+
+    def get_metrics(self):
+        """Разобрать /api/metrics в словарь имя{метки} -> значение"""
+        _, _, body = self.request('GET', '/api/metrics')
+        metrics = {}
+        for line in body.decode('utf-8').splitlines():
+            if not line or line.startswith('#'):
+                continue
+            key, _, value = line.rpartition(' ')
+            try:
+                metrics[key] = float(value)
+            except ValueError:
+                pass
+        return metrics
+
+    # --- Скрипты ---
+    def create_scripts(self):
+        profiles = [p.strip() for p in self.args.profiles.split(',') if p.strip()]
+        for profile in profiles:
+            if profile not in PROFILES:
+                raise SystemExit(f'Неизвестный профиль {profile}, доступны: {", ".join(PROFILES)}')
+
+        scripts = [(f'bench_{profiles[i % len(profiles)]}_{i}', profiles[i % len(profiles)]) for i in range(self.args.scripts)]
+        scripts.append((ECHO_SCRIPT, 'echo'))
+        for name, profile in scripts:
+            folder = os.path.join(self.args.scripts_dir, name)
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, name + '.py')
+            with open(path, 'w') as f:
+                f.write(make_script(profile, self.args))
+            os.chmod(path, 0o755)
+            self.names.append(name)
+        print(f"Создано скриптов: {len(self.names)} в {self.args.scripts_dir}")
+
+    def wait_for_registry(self):
+        deadline = time.monotonic() + REGISTRY_TIMEOUT
+        while time.monotonic() < deadline:
+            _, _, body = self.request('GET', '/api/processes')
+            known = {process['name'] for process in json.loads(body)}
+            if all(name in known for name in self.names):
+                return
+            time.sleep(0.5)
+        raise SystemExit('Сервер не увидел созданные скрипты: проверьте, что --scripts-dir - папка scripts сервера')
+
+    def start_scripts(self):
+        for name in self.names:
+            _, _, body = self.request('POST', f'/api/process/{name}/start')
+            result = json.loads(body)
+            if not result.get('success'):
+                raise SystemExit(f'Не удалось запустить {name}: {result.get("message")}')
+
+    def stop_scripts(self):
+        for name in self.names:
+            try:
+                self.request('POST', f'/api/process/{name}/stop')
+            except OSError:
+                pass
+
+    def remove_scripts(self):
+        # Ждем завершения процессов, чтобы история успела закрыться
+        time.sleep(2)
+        for name in self.names:
+            shutil.rmtree(os.path.join(self.args.scripts_dir, name), ignore_errors=True)
+            if self.args.history_dir and os.path.isdir(self.args.history_dir):
+                for file in os.listdir(self.args.history_dir):
+                    if file == name + '.log' or file.startswith(name + '.log.'):
+                        try:
+                            os.remove(os.path.join(self.args.history_dir, file))
+                        except OSError:
+                            pass
+
+    # --- Клиенты и измерения ---
+    def connect_clients(self):
+        load_names = [name for name in self.names if name != ECHO_SCRIPT]
+        binary = self.args.transport == 'binary'
+        for i in range(self.args.clients):
+            client = BenchClient(self.base_url, binary=binary)
+            client.connect()
+            if load_names:
+                client.emit('get_process_history', {'process': load_names[i % len(load_names)], 'flow_control': True})
+            self.clients.append(client)
+
+        probe_client = BenchClient(self.base_url, binary=binary)
+        probe_client.connect()
+        probe_client.emit('get_process_history', {'process': ECHO_SCRIPT, 'flow_control': True})
+        self.probe = EchoProbe(probe_client, ECHO_SCRIPT, self.args.echo_interval)
+        print(f"Подключено клиентов: {len(self.clients)} + 1 для замера эха")
+
+    def poll_api(self):
+        etag = None
+        while not self._stop.wait(self.args.api_interval):
+            started = time.monotonic()
+            status, headers, _ = self.request('GET', '/api/processes')
+            elapsed = (time.monotonic() - started) * 1000
+            etag = headers.get('ETag', etag)
+            if self.recording and status == 200:
+                self.api_latencies.append(elapsed)
+            if etag:
+                started = time.monotonic()
+                status, _, _ = self.request('GET', '/api/processes', {'If-None-Match': etag})
+                elapsed = (time.monotonic() - started) * 1000
+                if self.recording and status == 304:
+                    self.api_304_latencies.append(elapsed)
+
+    def sample_server(self):
+        while not self._stop.wait(1):
+            if not self.recording:
+                continue
+            metrics = self.get_metrics()
+            self.server_samples.append({
+                'time': time.monotonic(),
+                'cpu_seconds': metrics.get('wtm_server_cpu_seconds_total'),
+                'rss_bytes': metrics.get('wtm_server_rss_bytes'),
+                'threads': metrics.get('wtm_server_threads'),
+            })
+
+    def start_thread(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def snapshot(self):
+        return {
+            'time': time.monotonic(),
+            'metrics': self.get_metrics(),
+            'client_bytes': [client.bytes for client in self.clients],
+            'client_frames': [client.frames for client in self.clients],
+        }
+
+    def run(self):
+        self.create_scripts()
+        try:
+            self.wait_for_registry()
+            # Клиенты подключаются до запуска скриптов, чтобы рукопожатие не конкурировало с нагрузкой
+            self.connect_clients()
+            self.start_scripts()
+            self.start_thread(self.probe.run)
+            self.start_thread(self.poll_api)
+            self.start_thread(self.sample_server)
+
+            print(f"Прогрев {self.args.warmup} с...")
+            time.sleep(self.args.warmup)
+            start = self.snapshot()
+            self.recording = self.probe.recording = True
+            print(f"Измерение {self.args.duration} с...")
+            time.sleep(self.args.duration)
+            self.recording = self.probe.recording = False
+            end = self.snapshot()
+        finally:
+            self._stop.set()
+            if self.probe:
+                self.probe.stop()
+            for client in self.clients + ([self.probe.client] if self.probe else []):
+                client.close()
+            self.stop_scripts()
+            if not self.args.keep:
+                self.remove_scripts()
+        return self.report(start, end)
+
+    def report(self, start, end):
+        duration = end['time'] - start['time']
+
+        def delta(key):
+            return end['metrics'].get(key, 0) - start['metrics'].get(key, 0)
+
+        client_rates = [(b - a) / duration for a, b in zip(start['client_bytes'], end['client_bytes'])]
+        delivered = sum(end['client_bytes']) - sum(start['client_bytes'])
+        generated = sum(delta(f'wtm_process_output_bytes{{process="{name}"}}') for name in self.names)
+        rss = [s['rss_bytes'] for s in self.server_samples if s['rss_bytes'] is not None]
+        threads = [s['threads'] for s in self.server_samples if s['threads'] is not None]
+        cpu_seconds = delta('wtm_server_cpu_seconds_total')
+
+        return {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'config': {key: value for key, value in vars(self.args).items() if key != 'output'},
+            'duration_seconds': round(duration, 3),
+            'echo_latency_ms': dict(percentiles(self.probe.latencies), lost=self.probe.lost),
+            'delivered': {
+                'bytes': delivered,
+                'bytes_per_sec': round(delivered / duration, 1),
+                'frames': sum(end['client_frames']) - sum(start['client_frames']),
+                'per_client_bytes_per_sec': percentiles(client_rates),
+                'resyncs': sum(client.resyncs for client in self.clients),
+            },
+            'generated_bytes_per_sec': round(generated / duration, 1),
+            'server': {
+                'cpu_percent': round(cpu_seconds / duration * 100, 1),
+                'rss_bytes_max': max(rss) if rss else None,
+                'rss_bytes_mean': round(sum(rss) / len(rss)) if rss else None,
+                'threads_max': max(threads) if threads else None,
+                'output_frames_per_sec': round(delta('wtm_output_frames_total') / duration, 1),
+                'output_frame_bytes_per_sec': round(delta('wtm_output_frame_bytes_total') / duration, 1),
+            },
+            'history': {
+                'entries_per_sec': round(delta('wtm_history_entries_written_total') / duration, 1),
+                'batches_per_sec': round(delta('wtm_history_batches_total') / duration, 2),
+                'flush_seconds_per_sec': round(delta('wtm_history_flush_seconds_total') / duration, 4),
+                'queue_max_depth': end['metrics'].get('wtm_history_queue_max_depth'),
+                'queue_max_bytes': end['metrics'].get('wtm_history_queue_max_bytes'),
+                'dropped': delta('wtm_history_dropped_total'),
+            },
+            'api_processes_latency_ms': percentiles(self.api_latencies),
+            'api_processes_304_latency_ms': percentiles(self.api_304_latencies),
+        }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест менеджера терминалов')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Адрес запущенного сервера')
+    parser.add_argument('--scripts', type=int, default=4, help='Число скриптов-генераторов вывода')
+    parser.add_argument('--profiles', default=','.join(PROFILES), help='Профили вывода по кругу: line, progress, bursty')
+    parser.add_argument('--clients', type=int, default=8, help='Число клиентов Socket.IO (распределяются по скриптам)')
+    parser.add_argument('--duration', type=float, default=30, help='Длительность измерения (секунд)')
+    parser.add_argument('--warmup', type=float, default=3, help='Прогрев перед измерением (секунд)')
+    parser.add_argument('--rate', type=float, default=100, help='Строк (или обновлений прогресс-бара) в секунду')
+    parser.add_argument('--line-width', type=int, default=80, help='Длина строки вывода')
+    parser.add_argument('--burst-kb', type=int, default=64, help='Объем одной пачки для профиля bursty (КБ)')
+    parser.add_argument('--burst-interval', type=float, default=2, help='Пауза между пачками (секунд)')
+    parser.add_argument('--echo-interval', type=float, default=0.2, help='Период отправки маркеров эха (секунд)')
+    parser.add_argument('--api-interval', type=float, default=0.5, help='Период опроса /api/processes (секунд)')
+    parser.add_argument('--transport', choices=('binary', 'text'), default='binary', help='Формат кадров вывода')
+    parser.add_argument('--scripts-dir', default='scripts', help='Папка scripts сервера')
+    parser.add_argument('--history-dir', default='history', help='Папка history сервера (для удаления истории тестовых скриптов)')
+    parser.add_argument('--keep', action='store_true', help='Не удалять тестовые скрипты и их историю')
+    parser.add_argument('--output', default='benchmark_results.json', help='Файл с результатами (JSON)')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if simple_websocket is None:
+        print("Нужен пакет simple-websocket: pip install simple-websocket")
+        sys.exit(1)
+
+    results = Benchmark(args).run()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    echo = results['echo_latency_ms']
+    print(f"Эхо: p50 {echo.get('p50')} мс, p99 {echo.get('p99')} мс ({echo['count']} замеров, потеряно {echo['lost']})")
+    print(f"Доставлено клиентам: {results['delivered']['bytes_per_sec'] / 1024:.1f} КБ/с")
+    print(f"Сервер: CPU {results['server']['cpu_percent']}%, RSS {(results['server']['rss_bytes_max'] or 0) / 1024 / 1024:.1f} МБ")
+    print(f"История: {results['history']['entries_per_sec']} записей/с")
+    print(f"/api/processes: p50 {results['api_processes_latency_ms'].get('p50')} мс")
+    print(f"Результаты сохранены в {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,40 @@
-const socket = io();
+// Бинарные кадры вывода (xterm сам декодирует UTF-8 из Uint8Array потоково)
+// и сжатие истории, если браузер поддерживает DecompressionStream
+const socket = io({
+    auth: {
+        binary: true,
+        compress: typeof DecompressionStream !== 'undefined'
+    }
+});
 let currentProcess = null;
 let processes = {};
 let term = null;
 let resizeTimeout = null;
+let lastOutputSeq = 0;
+let resyncSeq = 0;  // Кадры с seq не больше этого уже вошли в снимок process_resync
+let ackTimeout = null;
+let writeChain = Promise.resolve();
+let registrySeq = null;
+let registryEpoch = null;
+
+// Ввод: нажатия, пришедшие подряд, отправляются одним сообщением,
+// большие вставки - кусками с подтверждением (process_paste / paste_ack)
+const INPUT_COALESCE_INTERVAL = 8;
+const PASTE_THRESHOLD = 4096;
+const PASTE_CHUNK_SIZE = 32768;
+const PASTE_WINDOW = 4;
+let inputBuffer = '';
+let inputProcess = null;
+let inputTimeout = null;
+let pasteQueue = [];
+let pasteCounter = 0;
 
 document.addEventListener('DOMContentLoaded', function() {
-    loadProcesses();
+    // Список скриптов приходит через канал registry: снимок при подключении, дальше дельты
     setupSocketHandlers();
-    
-    setInterval(() => {
-        loadProcesses();
-    }, 10000);
+    if (socket.connected) {
+        requestRegistrySync();
+    }
     
     window.addEventListener('resize', handleWindowResize);
 });
@@ -18,29 +42,77 @@ document.addEventListener('DOMContentLoaded', function() {
 async function loadProcesses() {
     try {
         const response = await fetch('/api/processes');
-        const processList = await response.json();
-        
-        const oldProcesses = {...processes};
-        processes = {};
-        processList.forEach(proc => {
-            processes[proc.name] = proc;
-        });
-        
-        renderProcessesList(processList);
-        
-        if (currentProcess && currentProcess in oldProcesses) {
-            const oldStatus = oldProcesses[currentProcess].status;
-            const newStatus = processes[currentProcess]?.status || 'stopped';
-            if (oldStatus !== newStatus) {
-                updateControlButtons();
-            }
-        }
-        
+        applyProcessList(await response.json());
     } catch (error) {
         console.error('Ошибка загрузки процессов:', error);
     }
 }
 
+function applyProcessList(processList) {
+    const oldProcesses = {...processes};
+    processes = {};
+    processList.forEach(proc => {
+        processes[proc.name] = proc;
+    });
+    
+    renderProcessesList(processList);
+    
+    if (currentProcess && currentProcess in oldProcesses) {
+        const oldStatus = oldProcesses[currentProcess].status;
+        const newStatus = processes[currentProcess]?.status || 'stopped';
+        if (oldStatus !== newStatus) {
+            updateControlButtons();
+        }
+    }
+}
+
+function requestRegistrySync() {
+    socket.emit('registry_sync', {since: registrySeq, epoch: registryEpoch});
+}
+
+function applyRegistryDelta(delta) {
+    if (registrySeq === null) {
+        // Ждем снимок
+        return;
+    }
+    if (delta.epoch !== registryEpoch) {
+        // Сервер перезапущен: номера дельт начались заново, нужен снимок
+        registrySeq = null;
+        requestRegistrySync();
+        return;
+    }
+    if (delta.seq <= registrySeq) {
+        // Уже примененная дельта
+        return;
+    }
+    if (delta.seq !== registrySeq + 1) {
+        // Пропуск в последовательности - досинхронизируемся
+        requestRegistrySync();
+        return;
+    }
+    registrySeq = delta.seq;
+    
+    const proc = delta.process;
+    if (delta.op === 'remove') {
+        delete processes[proc.name];
+    } else if (delta.op === 'status') {
+        if (proc.name in processes) {
+            processes[proc.name].status = proc.status;
+        }
+    } else if (delta.op === 'supervisor') {
+        if (proc.name in processes) {
+            processes[proc.name].supervisor = proc.supervisor;
+        }
+    } else {
+        processes[proc.name] = proc;
+    }
+    
+    renderProcessesList(Object.values(processes));
+    if (proc.name === currentProcess) {
+        updateControlButtons();
+    }
+}
+
 function renderProcessesList(processList) {
     const container = document.getElementById('processes-list');
     container.innerHTML = '';
@@ -56,13 +128,31 @@ function renderProcessesList(processList) {
         item.innerHTML = `
             <div class="process-name">${proc.name}</div>
             <div class="process-status status-${proc.status}">${proc.status === 'running' ? 'Запущен' : 'Остановлен'}</div>
+            ${formatSupervisorState(proc.supervisor)}
         `;
         item.onclick = () => selectProcess(proc.name);
         container.appendChild(item);
     });
 }
 
+function formatSupervisorState(info) {
+    if (!info || info.restart === 'no') {
+        return '';
+    }
+    let text = info.restart === 'always' ? 'Автоперезапуск: всегда' : 'Автоперезапуск: при сбое';
+    if (info.state === 'backoff' && info.next_restart) {
+        const seconds = Math.max(0, Math.round(info.next_restart - Date.now() / 1000));
+        text = `Перезапуск через ${seconds} с (попытка ${info.restarts})`;
+    } else if (info.state === 'gave_up') {
+        text = `Автоперезапуск остановлен после ${info.restarts} попыток`;
+    }
+    return `<div class="process-supervisor supervisor-${info.state}">${text}</div>`;
+}
+
 async function selectProcess(processName) {
+    if (currentProcess && currentProcess !== processName) {
+        socket.emit('unsubscribe_process', {process: currentProcess});
+    }
     currentProcess = processName;
     
     document.querySelectorAll('.process-item').forEach(item => {
@@ -81,7 +171,7 @@ async function selectProcess(processName) {
         term.clear();
     }
     
-    socket.emit('get_process_history', {process: processName});
+    subscribeToProcess(processName);
     
     updateControlButtons();
     
@@ -93,6 +183,56 @@ async function selectProcess(processName) {
     }, 100);
 }
 
+function subscribeToProcess(processName) {
+    lastOutputSeq = 0;
+    resyncSeq = 0;
+    socket.emit('get_process_history', {process: processName, flow_control: true});
+    sendTerminalSize();
+}
+
+function sendTerminalSize() {
+    // Сервер выставляет размер PTY и отправляет процессу SIGWINCH
+    if (currentProcess && term) {
+        socket.emit('resize_terminal', {process: currentProcess, cols: term.cols, rows: term.rows});
+    }
+}
+
+function scheduleOutputAck() {
+    // Подтверждаем кадры не чаще раза в 200 мс, чтобы сервер знал, что мы успеваем
+    if (ackTimeout) return;
+    ackTimeout = setTimeout(() => {
+        ackTimeout = null;
+        if (currentProcess) {
+            socket.emit('output_ack', {process: currentProcess, seq: lastOutputSeq});
+        }
+    }, 200);
+}
+
+async function decodePayload(data, encoding) {
+    if (encoding === 'deflate') {
+        const stream = new Blob([data]).stream().pipeThrough(new DecompressionStream('deflate'));
+        return new Uint8Array(await new Response(stream).arrayBuffer());
+    }
+    if (data instanceof ArrayBuffer) {
+        return new Uint8Array(data);
+    }
+    return data;
+}
+
+function writeToTerminal(processName, data, encoding, options = {}) {
+    // Сохраняем порядок записи: распаковка истории асинхронная
+    writeChain = writeChain.then(async () => {
+        const payload = await decodePayload(data, encoding);
+        if (processName !== currentProcess || !term) return;
+        if (options.reset) {
+            term.reset();
+        }
+        term.write(payload, options.callback);
+    }).catch(error => {
+        console.error('Ошибка вывода в терминал:', error);
+    });
+}
+
 function initTerminal() {
     const { rows, cols } = calculateTerminalSize();
     
@@ -110,10 +250,7 @@ function initTerminal() {
     
     term.onData(e => {
         if (currentProcess) {
-            socket.emit('process_input', {
-                process: currentProcess,
-                data: e
-            });
+            sendInput(currentProcess, e);
         }
     });
     
@@ -122,6 +259,92 @@ function initTerminal() {
     setTimeout(updateTerminalSize, 100);
 }
 
+function sendInput(processName, data) {
+    // Пока идет вставка в этот процесс, ввод встает за ней, чтобы не обогнать
+    const lastPaste = pasteQueue[pasteQueue.length - 1];
+    if (lastPaste && lastPaste.process === processName) {
+        lastPaste.data += data;
+        pumpPaste();
+        return;
+    }
+    if (data.length >= PASTE_THRESHOLD || pasteQueue.length) {
+        flushInput();
+        pasteQueue.push({process: processName, data, id: ++pasteCounter, offset: 0, seq: 0, inFlight: 0});
+        pumpPaste();
+        return;
+    }
+    
+    if (inputProcess !== processName) {
+        flushInput();
+        inputProcess = processName;
+    }
+    inputBuffer += data;
+    // Первое нажатие после паузы уходит сразу, следующие копятся до конца окна
+    if (!inputTimeout) {
+        flushInput();
+        inputTimeout = setTimeout(onInputWindowEnd, INPUT_COALESCE_INTERVAL);
+    }
+}
+
+function onInputWindowEnd() {
+    inputTimeout = null;
+    if (inputBuffer) {
+        flushInput();
+        inputTimeout = setTimeout(onInputWindowEnd, INPUT_COALESCE_INTERVAL);
+    }
+}
+
+function flushInput() {
+    if (!inputBuffer) return;
+    socket.emit('process_input', {
+        process: inputProcess,
+        data: inputBuffer
+    });
+    inputBuffer = '';
+}
+
+function pumpPaste() {
+    const paste = pasteQueue[0];
+    if (!paste) return;
+    while (paste.inFlight < PASTE_WINDOW && paste.offset < paste.data.length) {
+        let end = Math.min(paste.offset + PASTE_CHUNK_SIZE, paste.data.length);
+        // Не разрезаем суррогатную пару: сервер кодирует каждый кусок в UTF-8 отдельно
+        const code = paste.data.charCodeAt(end - 1);
+        if (end < paste.data.length && code >= 0xD800 && code <= 0xDBFF) {
+            end--;
+        }
+        socket.emit('process_paste', {
+            process: paste.process,
+            id: paste.id,
+            seq: paste.seq++,
+            data: paste.data.slice(paste.offset, end)
+        });
+        paste.offset = end;
+        paste.inFlight++;
+    }
+    if (paste.offset >= paste.data.length && paste.inFlight === 0) {
+        pasteQueue.shift();
+        pumpPaste();
+    } else if (paste.offset > PASTE_CHUNK_SIZE * PASTE_WINDOW * 4) {
+        // Отправленную часть строки не держим в памяти
+        paste.data = paste.data.slice(paste.offset);
+        paste.offset = 0;
+    }
+}
+
+function onPasteAck(data) {
+    const paste = pasteQueue[0];
+    if (!paste || paste.id !== data.id) return;
+    paste.inFlight--;
+    if (data.error) {
+        pasteQueue.shift();
+        if (data.process === currentProcess && term) {
+            term.write(`\r\n[Вставка прервана: ${data.error}]\r\n`);
+        }
+    }
+    pumpPaste();
+}
+
 function calculateTerminalSize() {
     const terminalElement = document.getElementById('terminal');
     if (!terminalElement) return { rows: 24, cols: 80 };
@@ -147,6 +370,7 @@ function updateTerminalSize() {
     if (term.rows !== rows || term.cols !== cols) {
         try {
             term.resize(cols, rows);
+            sendTerminalSize();
         } catch (error) {
             console.warn('Ошибка изменения размера терминала:', error);
         }
@@ -194,9 +418,8 @@ async function startProcess() {
         const result = await response.json();
         
         if (result.success) {
-            processes[currentProcess] = {name: currentProcess, status: 'running'};
+            processes[currentProcess] = {...processes[currentProcess], name: currentProcess, status: 'running'};
             updateControlButtons();
-            loadProcesses();
         } else {
             if (term) {
                 term.write(`\n[Ошибка запуска: ${result.message}]\n`);
@@ -223,11 +446,8 @@ async function stopProcess() {
         });
         const result = await response.json();
         
-        if (result.success) {
-            processes[currentProcess] = {name: currentProcess, status: 'stopped'};
-            updateControlButtons();
-            loadProcesses();
-        } else {
+        // Остановка идет в фоне: статус 'stopped' придет через Socket.IO
+        if (!result.success) {
             if (term) {
                 term.write(`\n[Ошибка остановки: ${result.message}]\n`);
             }
@@ -247,38 +467,86 @@ async function restartProcess() {
         term.write('\n[Перезапуск процесса...]\n');
     }
     
-    await stopProcess();
-    setTimeout(() => {
-        startProcess();
-    }, 500);
+    try {
+        // Сервер сам запустит процесс после его завершения
+        const response = await fetch(`/api/process/${currentProcess}/restart`, {
+            method: 'POST'
+        });
+        const result = await response.json();
+        
+        if (!result.success && term) {
+            term.write(`\n[Ошибка перезапуска: ${result.message}]\n`);
+        }
+    } catch (error) {
+        console.error('Ошибка перезапуска процесса:', error);
+        if (term) {
+            term.write('\n[Ошибка сети при перезапуске процесса]\n');
+        }
+    }
 }
 
 function setupSocketHandlers() {
+    socket.on('connect', function() {
+        requestRegistrySync();
+        
+        // После переподключения комнаты на сервере потеряны - подписываемся заново
+        if (currentProcess && term) {
+            term.reset();
+            subscribeToProcess(currentProcess);
+        }
+    });
+    
+    socket.on('registry_snapshot', function(data) {
+        registryEpoch = data.epoch;
+        registrySeq = data.seq;
+        applyProcessList(data.processes);
+    });
+    
+    socket.on('registry_delta', applyRegistryDelta);
+    
+    socket.on('paste_ack', onPasteAck);
+    
+    socket.on('disconnect', function() {
+        // Подтверждения неотправленных кусков уже не придут
+        pasteQueue = [];
+    });
+    
     socket.on('process_status_update', function(data) {
-        if (data.process in processes) {
+        if (data.process in processes && processes[data.process].status !== data.status) {
             processes[data.process].status = data.status;
-            loadProcesses();
+            renderProcessesList(Object.values(processes));
             updateControlButtons();
         }
     });
     
     socket.on('process_output', function(data) {
         if (data.process === currentProcess && term) {
-            term.write(data.data);
+            if (data.seq && data.seq <= resyncSeq) {
+                return;
+            }
+            if (data.seq) {
+                lastOutputSeq = data.seq;
+            }
+            writeToTerminal(data.process, data.data, data.encoding, {callback: scheduleOutputAck});
+        }
+    });
+    
+    socket.on('process_resync', function(data) {
+        // Сервер пропустил часть кадров, пока мы не успевали - показываем актуальный экран
+        if (data.process === currentProcess && term) {
+            lastOutputSeq = resyncSeq = data.seq;
+            writeToTerminal(data.process, data.data, data.encoding, {reset: true});
         }
     });
     
     socket.on('process_history', function(data) {
         if (data.process === currentProcess && term) {
-            term.write(data.data);
+            writeToTerminal(data.process, data.data, data.encoding);
         }
     });
     
     socket.on('scripts_updated', function(data) {
         console.log('Список скриптов обновлен:', data.message);
-        setTimeout(() => {
-            loadProcesses();
-        }, 500);
     });
 }
 
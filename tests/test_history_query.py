@@ -0,0 +1,107 @@
+import json
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    """Модуль приложения с рабочей папкой во временном каталоге и маленькими сегментами истории"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'scripts').mkdir()
+    (tmp_path / 'history').mkdir()
+    import app as app_module
+    monkeypatch.setattr(app_module, 'HISTORY_SEGMENT_LINES', 5)
+    monkeypatch.setattr(app_module, 'HISTORY_MAX_SEGMENTS', 2)
+    return app_module
+
+
+def write_entries(app, process_name, count):
+    log = app.HistoryLog(process_name)
+    for n in range(count):
+        timestamp = 1000.0 + n
+        entry = {'timestamp': datetime.fromtimestamp(timestamp).isoformat(), 'data': f'entry {n}\n'}
+        log.write_lines([(json.dumps(entry) + '\n', timestamp, entry['data'])])
+    log.close()
+
+
+def test_after_cursor_from_rotated_segment_starts_at_oldest_entry(app):
+    # 12 записей по 5 в сегменте: сегмент 1 удален, остались 2 (записи 5-9) и текущий 3 (10-11)
+    write_entries(app, 'rotated', 12)
+    assert app.list_history_segments('rotated') == [2]
+
+    page = app.query_history('rotated', limit=3, after='1:4')
+    assert [e['cursor'] for e in page['entries']] == ['2:0', '2:1', '2:2']
+    assert page['entries'][0]['data'] == 'entry 5\n'
+
+
+def test_cursor_pagination_across_segments(app):
+    write_entries(app, 'paged', 12)
+
+    seen = []
+    page = app.query_history('paged', limit=3, after='0:0')
+    while True:
+        seen += [e['data'] for e in page['entries']]
+        if page['after'] is None:
+            break
+        page = app.query_history('paged', limit=3, after=page['after'])
+    assert seen == [f'entry {n}\n' for n in range(5, 12)]
+
+    seen = []
+    page = app.query_history('paged', limit=3)
+    while True:
+        seen = [e['data'] for e in page['entries']] + seen
+        if page['before'] is None:
+            break
+        page = app.query_history('paged', limit=3, before=page['before'])
+    assert seen == [f'entry {n}\n' for n in range(5, 12)]
+
+
+def test_before_cursor_from_rotated_segment_is_empty(app):
+    write_entries(app, 'old', 12)
+    page = app.query_history('old', before='1:2')
+    assert page['entries'] == []
+
+
+def test_last_bytes_is_not_capped_by_page_limit(app, monkeypatch):
+    monkeypatch.setattr(app, 'HISTORY_SEGMENT_LINES', 100)
+    monkeypatch.setattr(app, 'HISTORY_PAGE_MAX', 30)
+    write_entries(app, 'bytes', 50)  # 'entry N\n' - 8 или 9 символов
+
+    page = app.query_history('bytes', limit=3, last_bytes=90)
+    assert [e['data'] for e in page['entries']] == [f'entry {n}\n' for n in range(40, 50)]
+    assert page['before'] == '1:40'
+
+    # Большой объем ограничен HISTORY_PAGE_MAX, остальное - по курсору before
+    page = app.query_history('bytes', last_bytes=1000000)
+    assert len(page['entries']) == 30
+    assert page['before'] == '1:20'
+    assert page['after'] is None
+
+
+def test_rotation_during_query_rereads_index(app, monkeypatch):
+    write_entries(app, 'busy', 4)  # Только текущий сегмент (будущий 1) с 4 записями
+    load_history_index = app.load_history_index
+    calls = []
+
+    def rotate_after_load(process_name):
+        segments = load_history_index(process_name)
+        if not calls:
+            # Пока читается выборка, запись истории переполняет и ротирует текущий сегмент
+            log = app.HistoryLog(process_name)
+            for n in range(4, 7):
+                entry = {'timestamp': datetime.fromtimestamp(1000.0 + n).isoformat(), 'data': f'entry {n}\n'}
+                log.write_lines([(json.dumps(entry) + '\n', 1000.0 + n, entry['data'])])
+            log.close()
+        calls.append(process_name)
+        return segments
+
+    monkeypatch.setattr(app, 'load_history_index', rotate_after_load)
+    page = app.query_history('busy', limit=10)
+    assert len(calls) == 2
+    assert [e['data'] for e in page['entries']] == [f'entry {n}\n' for n in range(7)]
+    assert [e['cursor'] for e in page['entries']][-2:] == ['2:0', '2:1']
@@ -0,0 +1,82 @@
+import json
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    """Модуль приложения с рабочей папкой во временном каталоге и пустым набором индексов поиска"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'scripts').mkdir()
+    (tmp_path / 'history').mkdir()
+    import app as app_module
+    monkeypatch.setattr(app_module, 'known_histories', set())
+    with app_module.history_indexes_lock:
+        app_module.history_indexes.clear()
+    return app_module
+
+
+def write_chunks(app, process_name, chunks):
+    log = app.HistoryLog(process_name)
+    for n, data in enumerate(chunks):
+        timestamp = 1000.0 + n // 2  # По две записи с одним временем
+        entry = {'timestamp': datetime.fromtimestamp(timestamp).isoformat(), 'data': data}
+        log.write_lines([(json.dumps(entry) + '\n', timestamp, data)])
+    log.close()
+    app.known_histories.add(process_name)
+
+
+def search_all(app, query, evict=False, **kwargs):
+    found, cursor = [], None
+    while True:
+        results = list(app.search_history(query, limit=2, cursor=cursor, **kwargs))
+        found += [(r['process'], r['cursor'], r['line']) for r in results[:-1]]
+        cursor = results[-1]['next']
+        if cursor is None:
+            return found
+        if evict:
+            # Индекс вытеснен между страницами - при следующем поиске он строится заново
+            with app.history_indexes_lock:
+                app.history_indexes.clear()
+
+
+def test_search_pages_survive_index_rebuild(app):
+    write_chunks(app, 'one', ['err a\nerr b\n', 'err c\n', 'ok\nerr d\n', 'err e\nerr f'])
+    write_chunks(app, 'two', ['err x\n', 'err y\nerr z\n'])
+
+    expected = search_all(app, 'err')
+    assert len(expected) == 9
+    assert len(set(expected)) == 9
+    assert search_all(app, 'err', evict=True) == expected
+
+
+def test_search_filters_by_process_and_case(app):
+    write_chunks(app, 'one', ['Error one\n'])
+    write_chunks(app, 'two', ['error two\n'])
+
+    assert [r[2] for r in search_all(app, 'error', process=['two'])] == ['error two']
+    assert [r[2] for r in search_all(app, 'Error', case=True)] == ['Error one']
+
+
+def test_index_follows_writes_and_rotation(app, monkeypatch):
+    monkeypatch.setattr(app, 'HISTORY_SEGMENT_LINES', 2)
+    monkeypatch.setattr(app, 'HISTORY_MAX_SEGMENTS', 2)
+    write_chunks(app, 'live', ['word 0\n'])
+    index = app.history_indexer.get_index('live')
+    assert [line[4] for line in index.candidates(['word'])] == ['word 0']
+
+    log = app.HistoryLog('live')
+    for n in range(1, 6):
+        entry = {'timestamp': datetime.fromtimestamp(2000.0 + n).isoformat(), 'data': f'word {n}\n'}
+        log.write_lines([(json.dumps(entry) + '\n', 2000.0 + n, entry['data'])])
+    log.close()
+    app.history_indexer.get_index('dummy')  # Очередь индексатора общая: дождаться обработки записей
+
+    # По 2 записи в сегменте: после ротации на записи 5 остался только сегмент 3 (записи 4-5)
+    assert app.list_history_segments('live') == [3]
+    assert [line[4] for line in index.candidates(['word'])] == ['word 5', 'word 4']
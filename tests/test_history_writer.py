@@ -0,0 +1,47 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    """Модуль приложения с рабочей папкой во временном каталоге"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'scripts').mkdir()
+    (tmp_path / 'history').mkdir()
+    import app as app_module
+    return app_module
+
+
+def test_full_queue_drops_entries_without_blocking(app, monkeypatch):
+    monkeypatch.setattr(app, 'HISTORY_QUEUE_BYTES', 100)
+    writer = app.HistoryWriter()  # Поток не запущен: очередь никто не разбирает
+
+    done = threading.Event()
+
+    def produce():
+        for n in range(10):
+            writer.put('full', 'x' * 39 + '\n', 1000.0 + n, 'x')
+        done.set()
+
+    threading.Thread(target=produce, daemon=True).start()
+    assert done.wait(2)
+    stats = writer.get_stats()
+    assert stats['queued'] == 2
+    assert stats['dropped'] == 8
+    assert stats['dropped_bytes'] == 8 * 40
+    assert stats['queue_bytes'] == 80
+
+
+def test_stop_writes_queued_entries(app):
+    writer = app.HistoryWriter()
+    writer.start()
+    for n in range(3):
+        writer.put('written', f'line {n}\n', 1000.0 + n, f'{n}')
+    writer.stop()
+    with open(app.get_history_file_path('written')) as f:
+        assert f.read() == 'line 0\nline 1\nline 2\n'
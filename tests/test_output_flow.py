@@ -0,0 +1,87 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    """Модуль приложения с рабочей папкой во временном каталоге, без виртуального экрана"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'scripts').mkdir()
+    (tmp_path / 'history').mkdir()
+    import app as app_module
+    monkeypatch.setattr(app_module, 'TERMINAL_SCREEN_MODEL', False)
+    monkeypatch.setattr(app_module, 'OUTPUT_MAX_UNACKED_FRAMES', 3)
+    return app_module
+
+
+def send_frame(app, process_name, text):
+    app.emit_process_output(process_name, text)
+    app.output_batcher.flush(process_name)
+
+
+def received(client, event):
+    return [message['args'][0] for message in client.get_received() if message['name'] == event]
+
+
+def test_lagging_client_is_resynced_with_snapshot(app):
+    client = app.socketio.test_client(app.app)
+    try:
+        client.emit('get_process_history', {'process': 'flow', 'flow_control': True})
+        client.get_received()
+
+        for n in range(6):
+            send_frame(app, 'flow', f'frame {n}\n')
+        frames = received(client, 'process_output')
+        # После OUTPUT_MAX_UNACKED_FRAMES неподтвержденных кадров клиент выведен из комнаты
+        assert [frame['data'] for frame in frames] == [f'frame {n}\n' for n in range(4)]
+
+        client.emit('output_ack', {'process': 'flow', 'seq': frames[-1]['seq']})
+        resync = received(client, 'process_resync')
+        assert len(resync) == 1
+        assert resync[0]['seq'] == app.output_batcher.current_seq('flow')
+        assert resync[0]['data'].endswith('frame 4\nframe 5\n')
+
+        # Дальше кадры снова приходят и нумеруются после снимка
+        send_frame(app, 'flow', 'frame 6\n')
+        frames = received(client, 'process_output')
+        assert [(frame['seq'], frame['data']) for frame in frames] == [(resync[0]['seq'] + 1, 'frame 6\n')]
+    finally:
+        client.disconnect()
+
+
+def test_resync_flushes_pending_output_into_snapshot(app):
+    client = app.socketio.test_client(app.app)
+    try:
+        client.emit('get_process_history', {'process': 'pending', 'flow_control': True})
+        for n in range(5):
+            send_frame(app, 'pending', f'frame {n}\n')
+        last_seq = received(client, 'process_output')[-1]['seq']
+        app.emit_process_output('pending', 'queued\n')  # Еще в окне склейки, кадр не отправлен
+
+        client.emit('output_ack', {'process': 'pending', 'seq': last_seq})
+        resync = received(client, 'process_resync')
+        assert resync[0]['data'].endswith('queued\n')
+        # Накопленный кадр вошел в снимок и отдельно не придет
+        app.output_batcher.flush('pending')
+        assert received(client, 'process_output') == []
+    finally:
+        client.disconnect()
+
+
+def test_history_reply_sends_bounded_tail(app, monkeypatch):
+    monkeypatch.setattr(app, 'OUTPUT_SNAPSHOT_SIZE', 10)
+    buffer = app.get_output_buffer('tail')
+    for chunk in ('aaaa', 'bbbb', 'cccc', 'dddd'):
+        buffer.append(chunk)
+    assert buffer.tail(6) == 'ccdddd'
+
+    client = app.socketio.test_client(app.app)
+    try:
+        client.emit('get_process_history', {'process': 'tail'})
+        assert [reply['data'] for reply in received(client, 'process_history')] == ['bbccccdddd']
+    finally:
+        client.disconnect()
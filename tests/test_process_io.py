@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    """Модуль приложения с рабочей папкой во временном каталоге"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'scripts').mkdir()
+    (tmp_path / 'history').mkdir()
+    import app as app_module
+    monkeypatch.setattr(app_module, 'TERMINAL_SCREEN_MODEL', False)
+    yield app_module
+    # Дождаться записи истории, пока рабочая папка еще временная
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        stats = app_module.history_writer.get_stats()
+        if not stats['queue_depth'] and not stats['pending_bytes']:
+            break
+        time.sleep(0.01)
+
+
+def make_script(app, tmp_path, name, body):
+    folder = tmp_path / 'scripts' / name
+    folder.mkdir()
+    script = folder / 'run.sh'
+    script.write_text('#!/bin/bash\n' + body)
+    script.chmod(0o755)
+    app.script_registry.rebuild()
+    return folder
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_io_loop_reads_output_and_detects_exit(app, tmp_path):
+    make_script(app, tmp_path, 'hello', 'echo hello from script\nexit 3\n')
+    success, message = app.start_process('hello')
+    assert success, message
+    assert wait_until(lambda: app.processes['hello']['status'] == 'stopped')
+    output = app.get_output_buffer('hello').tail(4096)
+    assert 'hello from script' in output
+    assert output.rstrip().endswith('[Процесс hello завершен]')
+
+
+def test_paste_chunks_are_acked_in_order_after_write(app, tmp_path):
+    folder = make_script(app, tmp_path, 'paste', 'stty raw -echo\nhead -c 120000 > out.bin\n')
+    assert app.start_process('paste')[0]
+    client = app.socketio.test_client(app.app)
+    try:
+        for seq in range(3):
+            client.emit('process_paste', {'process': 'paste', 'id': 1, 'seq': seq, 'data': str(seq) * 40000})
+        acks = []
+
+        def collect():
+            acks.extend(m['args'][0] for m in client.get_received() if m['name'] == 'paste_ack')
+            return len(acks) == 3
+
+        assert wait_until(collect)
+        assert [(ack['seq'], ack['error']) for ack in acks] == [(0, None), (1, None), (2, None)]
+        assert wait_until(lambda: app.processes['paste']['status'] == 'stopped')
+        assert (folder / 'out.bin').read_bytes() == b'0' * 40000 + b'1' * 40000 + b'2' * 40000
+    finally:
+        client.disconnect()
+
+
+def test_process_input_keeps_order_across_partial_writes(app, monkeypatch):
+    watched = []
+    monkeypatch.setattr(app.io_loop, 'watch_input', watched.append)
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(write_fd, False)
+    process_input = app.ProcessInput('pipe', write_fd)
+    written = []
+    try:
+        # Больше емкости канала: остаток ждет в очереди, пока цикл не допишет его
+        assert process_input.put(b'a' * 100000, lambda error: written.append(('a', error))) is None
+        assert process_input.put(b'b' * 1000, lambda error: written.append(('b', error))) is None
+        assert watched and process_input.pending > 0
+        assert written == []
+
+        data = bytearray()
+        while len(data) < 101000:
+            data += os.read(read_fd, 65536)
+            process_input.flush()
+        assert data == b'a' * 100000 + b'b' * 1000
+        assert written == [('a', None), ('b', None)]
+        assert process_input.pending == 0
+    finally:
+        process_input.close()
+        os.close(read_fd)
+        os.close(write_fd)
+
+
+def test_process_input_rejects_overflow_whole_and_fails_pending_on_close(app, monkeypatch):
+    monkeypatch.setattr(app.io_loop, 'watch_input', lambda process_input: None)
+    monkeypatch.setattr(app, 'INPUT_QUEUE_SIZE', 1000)
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(write_fd, False)
+    process_input = app.ProcessInput('full', write_fd)
+    written = []
+    try:
+        assert process_input.put(b'x' * 100000, written.append) is None  # Канал заполнен, остаток в очереди
+        pending = process_input.pending
+        assert process_input.put(b'y' * 10) == 'очередь ввода переполнена'
+        assert process_input.pending == pending  # Отклоненный ввод не обрезается и не дописывается
+
+        process_input.close('процесс завершен')
+        assert written == ['процесс завершен']
+        assert process_input.put(b'z') == 'процесс завершен'
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
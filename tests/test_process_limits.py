@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    """Модуль приложения с рабочей папкой во временном каталоге"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'scripts').mkdir()
+    (tmp_path / 'history').mkdir()
+    import app as app_module
+    return app_module
+
+
+def test_remove_script_cgroups_keeps_busy_and_foreign_groups(app, tmp_path, monkeypatch):
+    base = tmp_path / 'cgroup'
+    for name in ('manager', 'script.gone', 'script.other', 'script.busy'):
+        (base / name).mkdir(parents=True)
+    (base / 'script.busy' / 'cgroup.procs').write_text('1')  # непустой каталог не удаляется, как занятый cgroup
+    monkeypatch.setattr(app, 'cgroup_base', str(base))
+
+    app.remove_script_cgroups(['gone'])
+    assert sorted(os.listdir(base)) == ['manager', 'script.busy', 'script.other']
+
+    app.remove_script_cgroups()
+    assert sorted(os.listdir(base)) == ['manager', 'script.busy']
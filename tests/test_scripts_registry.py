@@ -0,0 +1,113 @@
+import os
+import sys
+from collections import deque
+
+import pytest
+from watchdog.events import DirCreatedEvent, FileCreatedEvent, FileDeletedEvent, FileModifiedEvent
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    """Модуль приложения с рабочей папкой во временном каталоге и одним скриптом"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'scripts' / 'job' / 'logs').mkdir(parents=True)
+    (tmp_path / 'history').mkdir()
+    script = tmp_path / 'scripts' / 'job' / 'run.sh'
+    script.write_text('#!/bin/sh\n')
+    script.chmod(0o755)
+    import app as app_module
+    app_module.script_registry.rebuild()
+    return app_module
+
+
+@pytest.fixture()
+def handler(app):
+    handler = app.ScriptsFolderHandler(app.socketio)
+    yield handler
+    with handler._condition:
+        handler._first_event = None
+
+
+def touched_folders(handler, event):
+    handler.on_any_event(event)
+    with handler._condition:
+        folders, handler._folders = handler._folders, set()
+        handler._first_event = handler._last_event = None
+    return folders
+
+
+def test_script_data_files_do_not_trigger_rescan(app, handler, tmp_path):
+    (tmp_path / 'scripts' / 'job' / 'out.log').write_text('x')
+    (tmp_path / 'scripts' / 'job' / 'logs' / 'a.log').write_text('x')
+    assert touched_folders(handler, FileModifiedEvent('scripts/job/out.log')) == set()
+    assert touched_folders(handler, FileCreatedEvent('scripts/job/logs/a.log')) == set()
+    assert touched_folders(handler, FileDeletedEvent('scripts/job/old.log')) == set()
+    assert touched_folders(handler, DirCreatedEvent('scripts/job/cache')) == set()
+
+
+def test_entry_policy_and_new_executables_trigger_rescan(app, handler, tmp_path):
+    assert touched_folders(handler, FileModifiedEvent('scripts/job/run.sh')) == {'job'}
+    assert touched_folders(handler, FileDeletedEvent('scripts/job/run.sh')) == {'job'}
+    assert touched_folders(handler, FileCreatedEvent('scripts/job/supervisor.json')) == {'job'}
+    tool = tmp_path / 'scripts' / 'job' / 'tool'
+    tool.write_text('#!/bin/sh\n')
+    tool.chmod(0o755)
+    assert touched_folders(handler, FileCreatedEvent('scripts/job/tool')) == {'job'}
+    assert touched_folders(handler, DirCreatedEvent('scripts/other')) == {'other'}
+
+
+def registry_events(client):
+    return [(m['name'], m['args'][0]) for m in client.get_received() if m['name'].startswith('registry_')]
+
+
+def test_registry_sync_replays_deltas_after_since(app):
+    registry = app.script_registry
+    since = registry.version
+    registry.set_status('job', 'running')
+    registry.set_status('job', 'stopped')
+    client = app.socketio.test_client(app.app)
+    try:
+        client.emit('registry_sync', {'since': since, 'epoch': registry.epoch})
+        events = registry_events(client)
+        assert [name for name, _ in events] == ['registry_delta', 'registry_delta']
+        assert [delta['seq'] for _, delta in events] == [since + 1, since + 2]
+        assert [delta['process']['status'] for _, delta in events] == ['running', 'stopped']
+    finally:
+        client.disconnect()
+
+
+def test_registry_delta_gap_forces_full_snapshot(app, monkeypatch):
+    registry = app.script_registry
+    monkeypatch.setattr(registry, '_deltas', deque(maxlen=2))
+    since = registry.version
+    for status in ('running', 'stopped', 'running'):
+        registry.set_status('job', status)
+    client = app.socketio.test_client(app.app)
+    try:
+        client.emit('registry_sync', {'since': since, 'epoch': registry.epoch})
+        events = registry_events(client)
+        assert [name for name, _ in events] == ['registry_snapshot']
+        snapshot = events[0][1]
+        assert snapshot['seq'] == registry.version
+        assert [process['name'] for process in snapshot['processes']] == ['job']
+    finally:
+        client.disconnect()
+
+
+def test_registry_other_epoch_or_rebuild_forces_full_snapshot(app):
+    registry = app.script_registry
+    since = registry.version
+    client = app.socketio.test_client(app.app)
+    try:
+        client.emit('registry_sync', {'since': since, 'epoch': 'previous-server'})
+        assert [name for name, _ in registry_events(client)] == ['registry_snapshot']
+
+        registry.rebuild()  # Журнал очищен - дельт после since больше нет
+        client.emit('registry_sync', {'since': since, 'epoch': registry.epoch})
+        events = registry_events(client)
+        assert [name for name, _ in events] == ['registry_snapshot']
+        assert events[0][1]['seq'] == registry.version == since + 1
+    finally:
+        client.disconnect()
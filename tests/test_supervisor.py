@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    """Модуль приложения с рабочей папкой во временном каталоге"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'scripts').mkdir()
+    (tmp_path / 'history').mkdir()
+    import app as app_module
+    yield app_module
+    # Дождаться записи истории, пока рабочая папка еще временная
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        stats = app_module.history_writer.get_stats()
+        if not stats['queue_depth'] and not stats['pending_bytes']:
+            break
+        time.sleep(0.01)
+
+
+@pytest.fixture()
+def restarts(app, monkeypatch):
+    """Запланированные перезапуски вместо таймеров цикла ввода-вывода: список (задержка, callback)"""
+    scheduled = []
+    monkeypatch.setattr(app.io_loop, 'call_later', lambda delay, callback: scheduled.append((delay, callback)))
+    return scheduled
+
+
+def make_supervisor(app, monkeypatch, **policy):
+    supervisor = app.Supervisor()
+    policy = dict(app.SUPERVISOR_DEFAULT_POLICY, limits={}, **policy)
+    monkeypatch.setattr(supervisor, 'policy', lambda process_name: policy)
+    return supervisor
+
+
+def crash(supervisor, returncode=1):
+    supervisor.on_start('job')
+    supervisor.on_exit('job', returncode)
+
+
+def test_backoff_doubles_up_to_max_and_gives_up(app, monkeypatch, restarts):
+    supervisor = make_supervisor(app, monkeypatch, restart='always', backoff_initial=1, backoff_max=4, max_restarts=4)
+    for _ in range(5):
+        crash(supervisor)
+    assert [delay for delay, _ in restarts] == [1, 2, 4, 4]
+    status = supervisor.get_status('job')
+    assert status['state'] == 'gave_up'
+    assert status['restarts'] == 4
+    assert '[Автоперезапуск остановлен: 4 перезапусков за 300 с]' in app.get_output_buffer('job').tail(4096)
+
+
+def test_on_failure_ignores_clean_exit_and_manual_stop(app, monkeypatch, restarts):
+    supervisor = make_supervisor(app, monkeypatch, restart='on-failure')
+    crash(supervisor, 0)
+    supervisor.on_start('job')
+    supervisor.on_exit('job', 1, manual=True)
+    assert restarts == []
+    assert supervisor.get_status('job')['state'] == 'idle'
+
+
+def test_long_run_resets_backoff(app, monkeypatch, restarts):
+    supervisor = make_supervisor(app, monkeypatch, restart='always', backoff_reset=60)
+    crash(supervisor)
+    crash(supervisor)
+    supervisor.on_start('job')
+    supervisor._states['job']['started_at'] -= 61  # Процесс проработал дольше backoff_reset
+    supervisor.on_exit('job', 1)
+    assert [delay for delay, _ in restarts] == [1, 2, 1]
+
+
+def test_start_or_reset_cancels_pending_restart(app, monkeypatch, restarts):
+    supervisor = make_supervisor(app, monkeypatch, restart='always')
+    started = []
+    monkeypatch.setattr(app, 'start_process', lambda process_name: started.append(process_name) or (True, ''))
+
+    crash(supervisor)
+    supervisor.on_start('job')  # Запущен вручную до срабатывания таймера
+    restarts[-1][1]()
+    supervisor.on_exit('job', 1)
+    assert supervisor.reset('job') is True
+    restarts[-1][1]()
+    assert started == []
+    assert supervisor.get_status('job')['state'] == 'idle'
+
+    crash(supervisor)
+    restarts[-1][1]()
+    assert started == ['job']
@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+
+import pytest
+
+pyte = pytest.importorskip('pyte')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture()
+def app(tmp_path, monkeypatch):
+    """Модуль приложения с рабочей папкой во временном каталоге"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'scripts').mkdir()
+    (tmp_path / 'history').mkdir()
+    import app as app_module
+    return app_module
+
+
+def wait_snapshot(screen, scrollback=0, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        snapshot = screen.snapshot(scrollback=scrollback)
+        if snapshot is not None:
+            return snapshot
+        time.sleep(0.01)
+    raise AssertionError('экран не прогрелся')
+
+
+def test_snapshot_waits_for_seed_parsed_in_background(app, monkeypatch):
+    screen = app.TerminalScreen(20, 5)
+    try:
+        # Поток экрана еще не разобрал начальный хвост - снимка нет, клиент получит сырой вывод
+        with screen._lock:
+            screen.feed('line\r\n' * 1000, seed=True)
+            assert screen.snapshot() is None
+        assert 'line' in wait_snapshot(screen)
+    finally:
+        screen.close()
+
+
+def test_snapshot_cursor_follows_screen_on_taller_client(app):
+    screen = app.TerminalScreen(20, 5)
+    try:
+        # Прокрутка над экраном: вместе с ней снимок длиннее окна клиента
+        screen.feed(''.join(f'old {n}\r\n' for n in range(10)) + 'one\r\ntwo\r\nthr')
+        snapshot = wait_snapshot(screen, scrollback=100)
+    finally:
+        screen.close()
+
+    client = pyte.Screen(20, 12)  # У клиента строк больше, чем у экрана сервера
+    pyte.Stream(client).feed(snapshot)
+    row = next(y for y in range(client.lines) if client.display[y].startswith('thr'))
+    assert (client.cursor.y, client.cursor.x) == (row, 3)